@@ -0,0 +1,196 @@
+from functional import FunctionalProcessor
+from recorder import TraceRecorder, CHUNK_SIZE, np
+from instruction import Opcode, OPCODE_FLAGS, ARITH, LOGIC, MEM, CTRL, BRANCH, WRITES_RD, WRITES_RT, READS_RT
+from memory import load_image
+import argparse
+import os
+import sys
+
+# RAW distances of MAX_DISTANCE or more share the last histogram bucket
+MAX_DISTANCE = 32
+
+# Instruction class names and bits, in the order Processor reports them
+CLASSES = (('arithmetic', ARITH), ('logic', LOGIC), ('memory', MEM), ('control', CTRL))
+
+class TraceAnalysis(object):
+    '''
+    Accumulates statistics over a dynamic trace recorded by TraceRecorder. Each chunk is
+    processed with vectorized NumPy operations; the little state that crosses chunk borders
+    (the last writer of every register and the per-PC counts) is carried along, so the trace
+    can be analyzed chunk by chunk as it is recorded.
+
+    Dependencies are architectural: an instruction reads rs, and rt if its opcode reads rt,
+    and writes rd or rt as its opcode defines. The RAW distance of a source operand is the
+    number of dynamic instructions since the latest write of that register. Operands at
+    distance 1 or 2 are hazards in a 5-stage pipeline without forwarding, and operands at
+    distance 1 from a load are load-use hazards even with forwarding. Hazards are counted
+    once per instruction. They describe the program, not the stall counts of a particular
+    timing model (see AnalyticalProcessor for those).
+    '''
+    def __init__(self, max_distance=MAX_DISTANCE):
+        '''
+        Initializes empty statistics.
+        '''
+        if np is None:
+            raise ImportError('analyzing dynamic traces requires NumPy')
+        self.max_distance = max_distance
+        # Per-opcode tables indexed by opcode + 1, so that undecodable words (-1) map to 0
+        self._flags = np.array([0] + [OPCODE_FLAGS[op] for op in Opcode], dtype=np.int64)
+        self._is_load = np.array([False] + [op == Opcode.Ldw for op in Opcode])
+        self.length = 0
+        self.opcode_counts = np.zeros(len(Opcode) + 1, dtype=np.int64)
+        self.branch_taken = np.zeros(len(Opcode) + 1, dtype=np.int64)
+        self.distances = np.zeros(max_distance + 1, dtype=np.int64)
+        self.initial_reads = 0
+        self.raw_hazards = 0
+        self.load_use_hazards = 0
+        # Global index of each register's latest writer (-1 for none) and whether it is a load
+        self._last_write = np.full(32, -1, dtype=np.int64)
+        self._last_write_load = np.zeros(32, dtype=bool)
+        # Execution and taken counts per PC, kept sorted by PC
+        self._pcs = np.zeros(0, dtype=np.int64)
+        self._pc_counts = np.zeros(0, dtype=np.int64)
+        self._pc_taken = np.zeros(0, dtype=np.int64)
+
+    def update(self, chunk):
+        '''
+        Adds one chunk of the trace, given as a dictionary of column arrays.
+        '''
+        n = len(chunk['pc'])
+        if n == 0:
+            return
+        base = self.length
+        op = chunk['opcode'].astype(np.int64) + 1
+        rs, rt, rd = chunk['rs'].astype(np.int64), chunk['rt'].astype(np.int64), chunk['rd'].astype(np.int64)
+        taken = chunk['taken']
+        flags = self._flags[op]
+        index = np.arange(base, base + n, dtype=np.int64)
+        self.opcode_counts += np.bincount(op, minlength=len(self.opcode_counts))
+        self.branch_taken += np.bincount(op[taken], minlength=len(self.branch_taken))
+
+        # Writes, sorted by register and then position, as one combined key
+        dest = np.where(flags & WRITES_RD, rd, np.where(flags & WRITES_RT, rt, -1))
+        writes = dest >= 0
+        w_reg, w_index, w_load = dest[writes], index[writes], self._is_load[op[writes]]
+        order = np.lexsort((w_index, w_reg))
+        w_reg, w_index, w_load = w_reg[order], w_index[order], w_load[order]
+        w_key = w_reg * (base + n) + w_index
+
+        # Reads: rs of every instruction that has one, and rt where the opcode reads it
+        reads_rt = (flags & READS_RT) != 0
+        r_reg = np.concatenate((rs[rs >= 0], rt[reads_rt]))
+        r_index = np.concatenate((index[rs >= 0], index[reads_rt]))
+        # Latest write strictly before each read: within the chunk if there is one, else carried over
+        pos = np.searchsorted(w_key, r_reg * (base + n) + r_index) - 1
+        found = pos >= 0
+        found[found] = w_reg[pos[found]] == r_reg[found]
+        writer = np.where(found, w_index[np.maximum(pos, 0)] if len(w_index) else 0, self._last_write[r_reg])
+        writer_load = np.where(found, w_load[np.maximum(pos, 0)] if len(w_load) else False, self._last_write_load[r_reg])
+        known = writer >= 0
+        self.initial_reads += int(np.count_nonzero(~known))
+        distance = r_index[known] - writer[known]
+        self.distances += np.bincount(np.minimum(distance, self.max_distance), minlength=self.max_distance + 1)
+
+        hazard = np.zeros(n, dtype=bool)
+        hazard[r_index[known][distance <= 2] - base] = True
+        self.raw_hazards += int(np.count_nonzero(hazard))
+        hazard[:] = False
+        hazard[r_index[known][(distance == 1) & writer_load[known]] - base] = True
+        self.load_use_hazards += int(np.count_nonzero(hazard))
+
+        # Carry the last write of every register written in this chunk
+        if len(w_reg):
+            last = np.append(w_reg[1:] != w_reg[:-1], True)
+            self._last_write[w_reg[last]] = w_index[last]
+            self._last_write_load[w_reg[last]] = w_load[last]
+
+        # Merge the per-PC counts
+        pcs = np.concatenate((self._pcs, chunk['pc']))
+        counts = np.concatenate((self._pc_counts, np.ones(n, dtype=np.int64)))
+        taken_counts = np.concatenate((self._pc_taken, taken.astype(np.int64)))
+        self._pcs, inverse = np.unique(pcs, return_inverse=True)
+        self._pc_counts = np.bincount(inverse, weights=counts).astype(np.int64)
+        self._pc_taken = np.bincount(inverse, weights=taken_counts).astype(np.int64)
+        self.length += n
+
+    def hot_spots(self, top=10):
+        '''
+        Returns the top most executed PCs as (pc, executions, taken) tuples.
+        '''
+        order = np.argsort(-self._pc_counts, kind='stable')[:top]
+        return [(int(self._pcs[i]), int(self._pc_counts[i]), int(self._pc_taken[i])) for i in order]
+
+    def result(self, top=10):
+        '''
+        Returns the statistics as a dictionary of plain Python values.
+        '''
+        counts = {str(op): int(self.opcode_counts[op + 1]) for op in Opcode}
+        branches = {str(op): {'executed': counts[str(op)], 'taken': int(self.branch_taken[op + 1])}
+                    for op in Opcode if OPCODE_FLAGS[op] & BRANCH}
+        return {
+            'instructions': int(self.opcode_counts[1:].sum()),
+            'undecodable_words': int(self.opcode_counts[0]),
+            'opcode_counts': counts,
+            'class_counts': {name: int(self.opcode_counts[1:][(self._flags[1:] & bit) != 0].sum()) for name, bit in CLASSES},
+            'raw_distance_histogram': self.distances.tolist(),
+            'reads_of_initial_values': self.initial_reads,
+            'raw_hazards': self.raw_hazards,
+            'load_use_hazards': self.load_use_hazards,
+            'branches': branches,
+            'hot_spots': self.hot_spots(top),
+        }
+
+def analyze(memory_image, chunk_size=CHUNK_SIZE, max_distance=MAX_DISTANCE, max_instructions=None):
+    '''
+    Runs memory_image on a FunctionalProcessor and analyzes its dynamic trace chunk by chunk.
+
+    :return: The TraceAnalysis.
+    '''
+    analysis = TraceAnalysis(max_distance)
+    recorder = TraceRecorder(chunk_size, on_chunk=analysis.update)
+    p = FunctionalProcessor(memory_image, recorder=recorder)
+    p.run(max_instructions)
+    recorder.flush()
+    return analysis
+
+def print_result(result):
+    '''
+    Prints a TraceAnalysis result.
+    '''
+    print("\n" + "*" * 5 + " Instruction Mix " + "*" * 5 + "\n")
+    print("Total Instruction count: ", result['instructions'])
+    for name, count in result['opcode_counts'].items():
+        if count:
+            print(f"{name}: {count}")
+    for name, count in result['class_counts'].items():
+        print(f"{name.capitalize()} Instruction count: ", count)
+    print("\n" + "*" * 5 + " RAW Dependencies " + "*" * 5 + "\n")
+    histogram = result['raw_distance_histogram']
+    for distance, count in enumerate(histogram):
+        if count:
+            label = f">={distance}" if distance == len(histogram) - 1 else str(distance)
+            print(f"Distance {label}: {count}")
+    print("Reads of initial register values: ", result['reads_of_initial_values'])
+    print("RAW hazards (distance 1 or 2): ", result['raw_hazards'])
+    print("Load-use hazards: ", result['load_use_hazards'])
+    print("\n" + "*" * 5 + " Branching Information " + "*" * 5 + "\n")
+    for name, branch in result['branches'].items():
+        print(f"{name}: {branch['executed']} executed, {branch['taken']} taken")
+    print("\n" + "*" * 5 + " Hot Spots " + "*" * 5 + "\n")
+    for pc, count, taken in result['hot_spots']:
+        print(f"PC {pc}: {count} executions" + (f", {taken} taken" if taken else ""))
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze the dynamic instruction trace of a memory image.")
+    parser.add_argument("image_file", help="memory image file")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help=f"instructions per recorded chunk (default: {CHUNK_SIZE})")
+    parser.add_argument("--max-distance", type=int, default=MAX_DISTANCE, help=f"largest RAW distance with its own bucket (default: {MAX_DISTANCE})")
+    parser.add_argument("--top", type=int, default=10, help="number of hot spots to list (default: 10)")
+    args = parser.parse_args()
+    if not os.path.exists(args.image_file):
+        print(f"Error: The file '{args.image_file}' does not exist. Please provide a correct file.")
+        sys.exit(1)
+    print_result(analyze(load_image(args.image_file), args.chunk_size, args.max_distance).result(args.top))
+
+if __name__ == "__main__":
+    main()
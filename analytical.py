@@ -0,0 +1,188 @@
+from array import array
+from functional import FunctionalProcessor, _signed32
+from processor import Processor
+from instruction import Opcode, ARITH, LOGIC, MEM, CTRL, R_TYPE, BRANCH, READS_RT
+
+# Dynamic instructions a store stays in flight for after it executes. A fetch from its
+# address within this window hits the IF-stage store check, which the model does not cover.
+STORE_WINDOW = 4
+
+class UnsupportedTrace(Exception):
+    '''
+    Raised when a program's timing cannot be derived from its dynamic trace, because it
+    fetches an instruction that a store still in the pipeline is writing.
+    '''
+
+class DynamicTrace(object):
+    '''
+    Compact record of one architectural execution, one entry per executed instruction word.
+
+    Attributes:
+    - pcs: PC of each instruction.
+    - instrs: The decoded Instruction executed at each entry. These are the shared
+      templates of the decode cache, so each entry costs a single reference.
+    - aux: Effective address for Ldw and Stw, 1 for a taken branch, otherwise 0.
+    - fetch_hits, fetch_misses: Decoded-instruction cache hits and misses the pipelined
+      model's fetch stage would see, including the wrong-path fetch behind each taken branch.
+    '''
+    def __init__(self):
+        self.pcs = array('q')
+        self.instrs = []
+        self.aux = array('q')
+        self.fetch_hits = 0
+        self.fetch_misses = 0
+
+    def __len__(self):
+        return len(self.pcs)
+
+def record_trace(memory_image, max_instructions=None):
+    '''
+    Executes memory_image on a FunctionalProcessor and records its dynamic trace.
+
+    :return: A tuple (processor, trace) of the finished FunctionalProcessor and its DynamicTrace.
+    :raises UnsupportedTrace: If the program fetches code that was stored to just before.
+    '''
+    p = FunctionalProcessor(memory_image)
+    trace = DynamicTrace()
+    pcs, instrs, aux = trace.pcs, trace.instrs, trace.aux
+    fetch, dispatch, counts, r = p._fetch, p.dispatch, p.opcode_counts, p.regs.regs
+    # Dynamic index of the latest store to each address, and the PCs the pipeline has decoded
+    stored = dict()
+    cached = set()
+    pc = 0
+    executed = 0
+    while not p.Halt:
+        if max_instructions is not None and executed >= max_instructions:
+            break
+        index = len(pcs)
+        if index - stored.get(pc, -STORE_WINDOW - 1) <= STORE_WINDOW:
+            raise UnsupportedTrace(f'instruction at PC {pc} is fetched while a store to it is in flight')
+        if pc in cached:
+            trace.fetch_hits += 1
+        else:
+            trace.fetch_misses += 1
+            cached.add(pc)
+        instr = fetch(pc)
+        opcode = instr.opcode
+        extra = 0
+        if opcode is not None:
+            executed += 1
+            counts[opcode] += 1
+            if instr.flags & MEM:
+                extra = _signed32(_signed32(r[instr.reg_rs]) + instr.imm)
+                if opcode == Opcode.Stw:
+                    stored[extra] = index
+                    cached.discard(extra)
+            elif instr.flags & BRANCH:
+                taken = p.branches_taken
+        next_pc = dispatch[opcode](instr, pc)
+        if opcode is not None and instr.flags & BRANCH and p.branches_taken != taken:
+            extra = 1
+            # The pipeline fetches the instruction behind a taken branch before flushing it
+            if index + 1 - stored.get(pc + 4, -STORE_WINDOW - 1) <= STORE_WINDOW:
+                raise UnsupportedTrace(f'instruction at PC {pc + 4} is fetched while a store to it is in flight')
+            if pc + 4 in cached:
+                trace.fetch_hits += 1
+            else:
+                trace.fetch_misses += 1
+                cached.add(pc + 4)
+        pcs.append(pc)
+        instrs.append(instr)
+        aux.append(extra)
+        pc = next_pc
+    p.pc = pc
+    p.num_instructions += executed
+    return p, trace
+
+class AnalyticalProcessor(Processor):
+    '''
+    Computes the results of a Processor run from a recorded DynamicTrace in one linear pass,
+    without stepping the pipeline. The final state comes from the FunctionalProcessor that
+    recorded the trace; cycles, stalls, hazards and branch penalties follow from the rules the
+    pipelined model applies:
+    - Each instruction passes ID one cycle after the previous one and executes the next cycle.
+    - A taken branch flushes the instruction behind it, so the next one passes ID 3 cycles later.
+    - Without forwarding, an instruction waits in ID until every source register's latest
+      producer executed at least 2 cycles before. With forwarding, it waits one cycle only
+      when that producer is a load that executes in the same cycle.
+    - The run ends 4 cycles after Halt passes ID.
+    Several configurations can be timed from one trace, so both forwarding settings cost a
+    single execution.
+
+    Attributes:
+    - reference: The FunctionalProcessor returned by record_trace.
+    - trace: Its DynamicTrace.
+    - forwarding: Enables full-forwarding if set to True. Defaults to False.
+    - debug: Accepted for compatibility with Processor and ignored.
+    '''
+    def __init__(self,reference,trace,forwarding=False,debug=False):
+        '''
+        Instantiate a new analytical processor.
+        '''
+        super().__init__(reference.original_mem, forwarding=forwarding, debug=debug)
+        self.reference = reference
+        self.trace = trace
+
+    def run(self,):
+        '''
+        Computes the timing of the complete trace.
+        '''
+        reference = self.reference
+        forwarding = self.forwarding
+        # Cycle each register's latest producer executed in, and whether it is a load
+        ready = [-2] * 32
+        load = [False] * 32
+        st_count = []
+        taken_branches = 0
+        branches = 0
+        cycle = 1  # Cycle 0 fetches the first instruction
+        for instr, extra in zip(self.trace.instrs, self.trace.aux):
+            opcode = instr.opcode
+            if opcode is None:
+                cycle += 1
+                continue
+            if opcode == Opcode.Halt:
+                break
+            flags = instr.flags
+            rs = instr.reg_rs
+            rt = instr.reg_rt if flags & READS_RT else None
+            if forwarding:
+                if (ready[rs] == cycle and load[rs]) or (rt is not None and ready[rt] == cycle and load[rt]):
+                    st_count.append(1)
+                    cycle += 1
+            else:
+                latest = ready[rs] if rt is None else max(ready[rs], ready[rt])
+                if latest + 2 > cycle:
+                    st_count.append(latest + 2 - cycle)
+                    cycle = latest + 2
+            # Like the scoreboard, R-type instructions claim rd and all others rt
+            dest = instr.reg_rd if flags & R_TYPE else instr.reg_rt
+            if dest is not None:
+                ready[dest] = cycle + 1
+                load[dest] = opcode == Opcode.Ldw
+            if flags & BRANCH:
+                branches += 1
+                if extra:
+                    taken_branches += 1
+                    cycle += 2
+            cycle += 1
+        self.cycles = cycle + 4
+        self.st_count = st_count
+        self.hazards = len(st_count)
+        self.total_branches = branches
+        self.branches_taken = taken_branches
+        self.branch_penalties = 2 * taken_branches
+        self.mispredictions = taken_branches
+        self.num_instructions = reference.num_instructions
+        self.ari_count = reference._count(ARITH)
+        self.logic_count = reference._count(LOGIC)
+        self.ld_count = reference._count(MEM)
+        self.ctrl_count = reference._count(CTRL)
+        self.decode_hits = self.trace.fetch_hits
+        self.decode_misses = self.trace.fetch_misses
+        self.pc = reference.pc
+        self.mem_image = reference.mem_image
+        self.reg_change = reference.reg_change
+        self.Halt = reference.Halt
+        self.stop_reason = 'halt'
+        return
@@ -0,0 +1,124 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from runner import run_config, add_budget_arguments, budget_from_args, add_timing_arguments, timing_from_args
+import argparse
+import csv
+import glob
+import json
+import os
+import sys
+
+IMAGE_PATTERNS = ['*.txt', '*.bin']
+
+def expand_images(paths):
+    '''
+    Expands directories, glob patterns and plain file names into a sorted list of image files.
+    Directories contribute every *.txt and *.bin file they contain.
+    '''
+    images = []
+    for path in paths:
+        if os.path.isdir(path):
+            for pattern in IMAGE_PATTERNS:
+                images.extend(glob.glob(os.path.join(path, pattern)))
+        elif glob.has_magic(path):
+            images.extend(glob.glob(path))
+        else:
+            images.append(path)
+    return sorted(set(images))
+
+def config_matrix(forwarding=(False, True), timing=None):
+    '''
+    Returns the list of Processor configurations to sweep. Debug output is always off.
+    timing holds the icache, dcache and predictor arguments every configuration shares, if any.
+    '''
+    return [dict({'forwarding': f, 'debug': False}, **(timing or {})) for f in forwarding]
+
+def _run_stats(image_file, config, budget):
+    '''
+    Worker entry point: simulates one (image, config) pair and returns its store_stats().
+    '''
+    return run_config(image_file, dict(config, budget=budget))[1]
+
+def run_batch(images, configs, jobs=None, budget=None):
+    '''
+    Simulates every image under every configuration in a process pool and yields
+    result rows as the runs finish. A run that fails yields a row with an 'error'
+    entry instead of statistics, so one bad image does not stop the sweep.
+
+    :param images: List of memory image files.
+    :param configs: List of configuration dictionaries for Processor.
+    :param jobs: Number of worker processes. Defaults to the CPU count.
+    :param budget: Keyword arguments for Processor.run that bound each run, e.g.
+        {'max_seconds': 60, 'detect_stuck': True}. A run stopped early reports partial
+        statistics with its 'stop_reason'.
+    '''
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(_run_stats, image, config, budget): (image, config) for image in images for config in configs}
+        for future in as_completed(futures):
+            image, config = futures[future]
+            row = {'trace': image}
+            row.update(config)
+            try:
+                row.update(future.result())
+            except Exception as e:
+                row['error'] = f'{type(e).__name__}: {e}'
+            yield row
+
+def write_summary(rows, path):
+    '''
+    Writes result rows to path, as CSV if it ends in '.csv' and as JSON otherwise.
+    Rows are sorted by trace and configuration so the file does not depend on completion order.
+    '''
+    rows = sorted(rows, key=lambda row: (row['trace'], row.get('forwarding')))
+    if path.endswith('.csv'):
+        fields = []
+        for row in rows:
+            fields.extend(key for key in row if key not in fields)
+        with open(path, 'w', newline='') as out:
+            writer = csv.DictWriter(out, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+    else:
+        with open(path, 'w') as out:
+            json.dump(rows, out, indent=2)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulate many memory images under several processor configurations.")
+    parser.add_argument("paths", nargs="+", help="image files, directories or glob patterns")
+    parser.add_argument("--forwarding", choices=["on", "off", "both"], default="both",
+        help="forwarding settings to sweep (default: both)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--output", default="batch_summary.json",
+        help="summary file; written as CSV if it ends in .csv, JSON otherwise (default: batch_summary.json)")
+    add_budget_arguments(parser)
+    add_timing_arguments(parser)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    images = []
+    for image in expand_images(args.paths):
+        if os.path.exists(image):
+            images.append(image)
+        else:
+            print(f"Warning: The file '{image}' does not exist, skipping it.")
+    if not images:
+        print("Error: No memory images found.")
+        sys.exit(1)
+    forwarding = {'on': (True,), 'off': (False,), 'both': (False, True)}[args.forwarding]
+    configs = config_matrix(forwarding, timing_from_args(args))
+
+    rows = []
+    for row in run_batch(images, configs, args.jobs, budget_from_args(args)):
+        rows.append(row)
+        if 'error' in row:
+            print(f"[{len(rows)}/{len(images) * len(configs)}] {row['trace']} forwarding={row['forwarding']}: {row['error']}")
+        else:
+            print(f"[{len(rows)}/{len(images) * len(configs)}] {row['trace']} forwarding={row['forwarding']}: "
+                  f"cycles={row['cycles']} instructions={row['num_instructions']} ipc={row['ipc']:.4f}"
+                  + ("" if row['stop_reason'] == 'halt' else f" (stopped: {row['stop_reason']})"))
+        sys.stdout.flush()
+    write_summary(rows, args.output)
+    print(f"Wrote {len(rows)} results to '{args.output}'")
+
+if __name__ == "__main__":
+    main()
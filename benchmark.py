@@ -0,0 +1,191 @@
+from concurrent.futures import ProcessPoolExecutor
+from functional import FunctionalProcessor
+from instruction import Opcode
+from processor import Processor
+from memory import load_image
+import argparse
+import glob
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Zeroed words appended after a synthetic program for its loads and stores
+SYNTHETIC_DATA_WORDS = 16
+
+def encode_r(opcode, rs, rt, rd):
+    '''
+    Encodes an R-type instruction word.
+    '''
+    return opcode << 26 | rs << 21 | rt << 16 | rd << 11
+
+def encode_i(opcode, rs, rt, imm):
+    '''
+    Encodes an I-type instruction word. imm is a signed 16-bit value.
+    '''
+    return opcode << 26 | rs << 21 | rt << 16 | (imm & 0xFFFF)
+
+def synthetic_loop(iterations, body=8):
+    '''
+    Generates a memory image of a counted loop. Each iteration executes body
+    instructions drawn from a repeating mix of dependent arithmetic, logical, load
+    and store instructions, then decrements the counter and branches back.
+
+    :param iterations: Number of loop iterations, at most 32767 * 16384.
+    :param body: Number of instructions in the loop body besides the loop control.
+    :return: A list of 32-bit words, including a small zeroed data region.
+    '''
+    hi, lo = divmod(iterations, 16384)
+    words = [
+        encode_i(Opcode.Addi, 0, 1, hi),         # R1 = iterations // 16384
+        encode_i(Opcode.Muli, 1, 1, 16384),      # R1 *= 16384
+        encode_i(Opcode.Addi, 1, 1, lo),         # R1 += iterations % 16384
+        encode_i(Opcode.Addi, 0, 2, 1),          # R2 = 1
+    ]
+    loop_start = len(words)
+    # The data word sits just past the program: setup, body, 3 loop-control words and Halt
+    data_addr = (loop_start + body + 4) * 4
+    mix = [
+        encode_r(Opcode.Add, 2, 1, 2),           # R2 = R2 + R1
+        encode_r(Opcode.Xor, 2, 3, 3),           # R3 = R2 ^ R3
+        encode_i(Opcode.Stw, 0, 3, data_addr),   # mem[data] = R3
+        encode_i(Opcode.Ldw, 0, 4, data_addr),   # R4 = mem[data]
+        encode_i(Opcode.Muli, 4, 5, 3),          # R5 = R4 * 3
+        encode_r(Opcode.Sub, 5, 2, 6),           # R6 = R5 - R2
+        encode_i(Opcode.Andi, 6, 7, 0xFF),       # R7 = R6 & 0xFF
+        encode_i(Opcode.Ori, 7, 8, 1),           # R8 = R7 | 1
+    ]
+    for index in range(body):
+        words.append(mix[index % len(mix)])
+    words.append(encode_i(Opcode.Subi, 1, 1, 1))                       # R1 -= 1
+    words.append(encode_i(Opcode.Bz, 1, 0, 2))                         # exit when R1 == 0
+    words.append(encode_i(Opcode.Beq, 0, 0, loop_start - len(words)))  # branch back
+    words.append(Opcode.Halt << 26)
+    words.extend([0] * SYNTHETIC_DATA_WORDS)
+    return words
+
+def write_image(words, path):
+    '''
+    Writes words as a text memory image, one hex word per line.
+    '''
+    with open(path, 'w') as image:
+        for word in words:
+            image.write('{0:08X}\n'.format(word))
+
+def run_case(name, image_file, forwarding, functional):
+    '''
+    Benchmarks one simulation. Runs in its own worker process so that peak RSS is per case.
+
+    :return: A result dictionary for the JSON report.
+    '''
+    start = time.perf_counter()
+    mem_image = load_image(image_file)
+    if functional:
+        p = FunctionalProcessor(mem_image)
+    else:
+        p = Processor(mem_image, forwarding=forwarding)
+    startup = time.perf_counter() - start
+    start = time.perf_counter()
+    p.run()
+    elapsed = time.perf_counter() - start
+    cycles = None if functional else p.cycles
+    return {
+        'name': name,
+        'mode': 'functional' if functional else 'pipeline',
+        'forwarding': None if functional else forwarding,
+        'simulated_cycles': cycles,
+        'simulated_instructions': p.num_instructions,
+        'startup_seconds': startup,
+        'run_seconds': elapsed,
+        'cycles_per_second': cycles / elapsed if cycles and elapsed > 0 else None,
+        'instructions_per_second': p.num_instructions / elapsed if elapsed > 0 else None,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def _version():
+    '''
+    Returns the git revision of the simulator, or 'unknown' outside a git checkout.
+    '''
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def compare(results, baseline):
+    '''
+    Prints the throughput of each case relative to a previous report.
+    '''
+    previous = {(r['name'], r['mode'], r['forwarding']): r for r in baseline['results']}
+    print(f"\nCompared with {baseline.get('version', 'unknown')}:")
+    for result in results:
+        old = previous.get((result['name'], result['mode'], result['forwarding']))
+        if old is None or not old['instructions_per_second'] or not result['instructions_per_second']:
+            continue
+        ratio = result['instructions_per_second'] / old['instructions_per_second']
+        print(f"  {_label(result)}: {ratio:.2f}x instructions/sec")
+
+def _label(result):
+    if result['mode'] == 'functional':
+        return f"{result['name']} [functional]"
+    return f"{result['name']} [forwarding={result['forwarding']}]"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure the simulator's own throughput.")
+    parser.add_argument("paths", nargs="*", default=[os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trace_files')],
+        help="image files or directories to benchmark (default: the bundled trace_files/)")
+    parser.add_argument("--loop-iterations", type=int, nargs="*", default=[10000],
+        help="iteration counts of synthetic loops to benchmark (default: 10000; none to skip)")
+    parser.add_argument("--loop-body", type=int, default=8, help="instructions per synthetic loop body (default: 8)")
+    parser.add_argument("--functional", action="store_true", help="also benchmark the functional model")
+    parser.add_argument("--output", default="benchmark.json", help="JSON report to write (default: benchmark.json)")
+    parser.add_argument("--compare", help="previous JSON report to compare throughput against")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    cases = []
+    for path in args.paths:
+        files = sorted(glob.glob(os.path.join(path, '*.txt'))) if os.path.isdir(path) else [path]
+        cases.extend((os.path.basename(f), f) for f in files)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for iterations in args.loop_iterations:
+            image_file = os.path.join(tmp, f'loop_{iterations}.txt')
+            write_image(synthetic_loop(iterations, args.loop_body), image_file)
+            cases.append((f'synthetic_loop_{iterations}x{args.loop_body}', image_file))
+
+        runs = [(name, image_file, forwarding, False) for name, image_file in cases for forwarding in (False, True)]
+        if args.functional:
+            runs.extend((name, image_file, False, True) for name, image_file in cases)
+        results = []
+        # One worker per case, run one at a time, so timings don't contend and RSS is per case
+        with ProcessPoolExecutor(max_workers=1, max_tasks_per_child=1) as pool:
+            for run in runs:
+                result = pool.submit(run_case, *run).result()
+                results.append(result)
+                cycles_per_second = f"{result['cycles_per_second']:.0f}" if result['cycles_per_second'] else '-'
+                print(f"{_label(result)}: {cycles_per_second} cycles/s, "
+                      f"{result['instructions_per_second']:.0f} instr/s, startup {result['startup_seconds'] * 1000:.2f} ms, "
+                      f"peak RSS {result['peak_rss_kb']} KB")
+                sys.stdout.flush()
+
+    report = {
+        'version': _version(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    with open(args.output, 'w') as out:
+        json.dump(report, out, indent=2)
+    print(f"Wrote results to '{args.output}'")
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare(results, json.load(baseline))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from processor import Processor
+from instruction import Instruction
+from memory import load_image
+import argparse
+import tracemalloc
+
+def _cycle(p):
+    '''
+    Advances the processor by one clock cycle, exactly as Processor.run does.
+    '''
+    p.Write_back()
+    p.Memory_op()
+    p.Execute()
+    p.Instruction_decode()
+    p.Fetch()
+    p.data_list[0] = p.pc
+    p.cycles += 1
+
+def _halted(p):
+    '''
+    True once Halt reaches write-back. Compares the mnemonic so that revisions
+    with string opcodes can be measured for comparison too.
+    '''
+    return str(p.data_list[4].opcode) == 'Halt'
+
+def measure(image_file, forwarding=False, warmup=100):
+    '''
+    Measures heap allocation of the pipelined model per simulated cycle with tracemalloc.
+    The first warmup cycles (which fill the decoded-instruction cache) are not measured.
+
+    :return: A dictionary with the number of measured cycles, the average number of
+        Instruction records allocated per cycle, the average peak bytes allocated within
+        a cycle above the heap size at its start, and the average bytes retained per cycle.
+    '''
+    p = Processor(load_image(image_file), forwarding=forwarding)
+    while p.cycles < warmup and not _halted(p):
+        _cycle(p)
+    # Count Instruction allocations exactly by wrapping __new__ for the measured cycles.
+    # tracemalloc alone undercounts them, since a freed record offsets the next allocation.
+    allocations = [0]
+    def counting_new(cls, *args):
+        allocations[0] += 1
+        return object.__new__(cls)
+    Instruction.__new__ = staticmethod(counting_new)
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    transient = 0
+    cycles = 0
+    while not _halted(p):
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        _cycle(p)
+        transient += tracemalloc.get_traced_memory()[1] - before
+        cycles += 1
+    retained = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del Instruction.__new__
+    return {
+        'cycles': cycles,
+        'instructions_allocated_per_cycle': allocations[0] / cycles if cycles else 0,
+        'peak_bytes_per_cycle': transient / cycles if cycles else 0,
+        'retained_bytes_per_cycle': retained / cycles if cycles else 0,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure heap allocation per simulated cycle of the pipelined model.")
+    parser.add_argument("image_file", help="memory image file")
+    parser.add_argument("--forwarding", action="store_true", help="simulate with forwarding enabled")
+    parser.add_argument("--warmup", type=int, default=100, help="cycles to run before measuring (default: 100)")
+    args = parser.parse_args()
+    result = measure(args.image_file, args.forwarding, args.warmup)
+    print(f"Measured cycles: {result['cycles']}")
+    print(f"Instruction records allocated per cycle: {result['instructions_allocated_per_cycle']:.3f}")
+    print(f"Peak bytes allocated per cycle: {result['peak_bytes_per_cycle']:.1f}")
+    print(f"Bytes retained per cycle: {result['retained_bytes_per_cycle']:.1f}")
+
+if __name__ == "__main__":
+    main()
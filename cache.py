@@ -0,0 +1,147 @@
+from array import array
+
+# Replacement policies: LRU evicts the line used longest ago, FIFO the line filled longest ago
+POLICIES = ('lru', 'fifo')
+
+# Configuration used for any parameter a cache specification leaves out
+DEFAULTS = {'size': 4096, 'ways': 2, 'line_size': 32, 'policy': 'lru', 'hit_latency': 1, 'miss_latency': 10}
+
+# Keys of a cache specification string and the Cache parameters they set
+SPEC_KEYS = {'size': 'size', 'ways': 'ways', 'line': 'line_size', 'policy': 'policy',
+             'hit': 'hit_latency', 'miss': 'miss_latency'}
+
+def _power_of_two(value):
+    return value > 0 and value & (value - 1) == 0
+
+def parse_spec(text):
+    '''
+    Parses a cache specification such as 'size=8192,ways=4,line=64,policy=fifo,hit=1,miss=20'
+    into keyword arguments for Cache. Omitted keys take their DEFAULTS; an empty string gives
+    the default cache. Raises ValueError for an unknown key or a malformed value.
+    '''
+    config = dict(DEFAULTS)
+    for item in filter(None, text.split(',')):
+        name, _, value = item.partition('=')
+        if name not in SPEC_KEYS:
+            raise ValueError(f"unknown cache parameter '{name}', expected one of {', '.join(SPEC_KEYS)}")
+        config[SPEC_KEYS[name]] = value if name == 'policy' else int(value, 0)
+    Cache(**config)
+    return config
+
+class Cache(object):
+    '''
+    Timing model of a set-associative cache. It holds no data, only the tags of the lines
+    it contains, so an access tells the pipeline how long it takes but the words still come
+    from the memory image. Stores allocate lines like loads, and write-backs are not modeled.
+
+    The tag store is a flat array of 64-bit integers with one slot per way of every set, the
+    ways of set s in slots s * ways to s * ways + ways - 1. A slot holds the line number
+    (address // line_size) of its line, or -1 while empty. A parallel array holds the access count at which the
+    line was last used (LRU) or filled (FIFO), so the victim is the slot with the smallest
+    stamp; empty slots have stamp 0 and are filled first.
+
+    Attributes:
+    - config: The keyword arguments the cache was created with.
+    - hits, misses: Accesses that found their line, and that had to fill it.
+    - stall_cycles: Cycles the accesses took beyond one each.
+    '''
+    def __init__(self, size=4096, ways=2, line_size=32, policy='lru', hit_latency=1, miss_latency=10):
+        '''
+        Creates an empty cache of size bytes in lines of line_size bytes, ways lines per set.
+        An access takes hit_latency cycles if its line is present and miss_latency cycles
+        otherwise; one cycle is the latency the pipeline assumes without a cache.
+        '''
+        if not _power_of_two(line_size) or line_size < 4:
+            raise ValueError(f"line size {line_size} is not a power of two of at least 4 bytes")
+        if ways < 1 or size % (line_size * ways):
+            raise ValueError(f"size {size} is not a multiple of {ways} ways of {line_size}-byte lines")
+        sets = size // (line_size * ways)
+        if not _power_of_two(sets):
+            raise ValueError(f"{size} bytes in {ways} ways of {line_size}-byte lines do not make a power-of-two number of sets")
+        if policy not in POLICIES:
+            raise ValueError(f"unknown replacement policy '{policy}', expected one of {', '.join(POLICIES)}")
+        if not 1 <= hit_latency <= miss_latency:
+            raise ValueError(f"latencies must satisfy 1 <= hit ({hit_latency}) <= miss ({miss_latency})")
+        self.config = {'size': size, 'ways': ways, 'line_size': line_size, 'policy': policy,
+                       'hit_latency': hit_latency, 'miss_latency': miss_latency}
+        self.ways = ways
+        self.offset_bits = line_size.bit_length() - 1
+        self.set_mask = sets - 1
+        self.lru = policy == 'lru'
+        # Cycles an access adds beyond the single cycle of the pipeline stage
+        self.hit_penalty = hit_latency - 1
+        self.miss_penalty = miss_latency - 1
+        self.tags = array('q', [-1]) * (sets * ways)
+        self.stamps = array('q', [0]) * (sets * ways)
+        self.clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.stall_cycles = 0
+
+    def line(self,address):
+        '''
+        Returns the number of the line holding byte address.
+        '''
+        return (address & 0xFFFFFFFF) >> self.offset_bits
+
+    def access(self,address):
+        '''
+        Looks up the line holding byte address, filling it on a miss. Returns the number of
+        cycles the access takes beyond one.
+        '''
+        line = (address & 0xFFFFFFFF) >> self.offset_bits
+        ways = self.ways
+        start = (line & self.set_mask) * ways
+        tags = self.tags
+        stamps = self.stamps
+        self.clock += 1
+        if ways == 1:
+            slot = start if tags[start] == line else -1
+        else:
+            found = tags[start:start + ways]
+            slot = start + found.index(line) if line in found else -1
+        if slot >= 0:
+            self.hits += 1
+            if self.lru:
+                stamps[slot] = self.clock
+            self.stall_cycles += self.hit_penalty
+            return self.hit_penalty
+        if ways > 1:
+            ages = stamps[start:start + ways]
+            start += ages.index(min(ages))
+        tags[start] = line
+        stamps[start] = self.clock
+        self.misses += 1
+        self.stall_cycles += self.miss_penalty
+        return self.miss_penalty
+
+    def stats(self,name):
+        '''
+        Returns the access statistics as a dictionary whose keys start with name, e.g.
+        'dcache_hits'.
+        '''
+        accesses = self.hits + self.misses
+        return {
+            name + '_hits': self.hits,
+            name + '_misses': self.misses,
+            name + '_hit_rate': self.hits / accesses if accesses > 0 else 0,
+            name + '_stall_cycles': self.stall_cycles,
+        }
+
+    def state(self):
+        '''
+        Returns the contents and counters of the cache as a JSON-serializable dictionary.
+        '''
+        return {'tags': self.tags.tolist(), 'stamps': self.stamps.tolist(), 'clock': self.clock,
+                'hits': self.hits, 'misses': self.misses, 'stall_cycles': self.stall_cycles}
+
+    def load_state(self,state):
+        '''
+        Restores contents and counters returned by state() from a cache of the same configuration.
+        '''
+        if len(state['tags']) != len(self.tags):
+            raise ValueError(f"cache state has {len(state['tags'])} slots, not {len(self.tags)}")
+        self.tags = array('q', state['tags'])
+        self.stamps = array('q', state['stamps'])
+        for name in ('clock', 'hits', 'misses', 'stall_cycles'):
+            setattr(self, name, state[name])
@@ -0,0 +1,191 @@
+from processor import Processor, LATCH_COUNT, COUNTERS
+from instruction import Instruction, BUBBLE, OPCODES
+from memory import load_image
+import argparse
+import gzip
+import json
+import os
+import time
+
+# Version of the checkpoint layout, checked on restore
+FORMAT_VERSION = 1
+
+def _instr_state(instr):
+    state = {name: getattr(instr, name) for name in Instruction.__slots__}
+    state['opcode'] = None if instr.opcode is None else int(instr.opcode)
+    return state
+
+def _instr_from_state(state):
+    instr = Instruction(None)
+    for name, value in state.items():
+        setattr(instr, name, value)
+    if instr.opcode is not None:
+        instr.opcode = OPCODES[instr.opcode]
+    return instr
+
+def capture(p):
+    '''
+    Returns the complete state of a Processor between two cycles as a JSON-serializable
+    dictionary: the counters, registers, memory words written so far, the in-flight
+    instructions of data_list, the scoreboard, the recorded stalls, the PCs in the
+    decoded-instruction cache and the configuration and contents of the caches and the
+    branch predictor.
+    '''
+    # In-flight instructions, each saved once; data_list may hold one record in two slots
+    in_flight = []
+    for instr in p.data_list[1:]:
+        if instr is not BUBBLE and not any(instr is other for other in in_flight):
+            in_flight.append(instr)
+    def ref(instr):
+        for index, other in enumerate(in_flight):
+            if instr is other:
+                return index
+        return None
+    dirty = sorted(p.mem_image.dirty.items())
+    return {
+        'version': FORMAT_VERSION,
+        'forwarding': p.forwarding,
+        'image_words': len(p.original_mem),
+        'counters': {name: getattr(p, name) for name in COUNTERS},
+        'fetch_address': p.data_list[0],
+        'instructions': [_instr_state(instr) for instr in in_flight],
+        'latches': [ref(instr) for instr in p.data_list[1:]],
+        # Only a producer still in flight can be looked up; older entries keep their cycle only
+        'producers': [ref(instr) for instr in p.scoreboard.producer],
+        'issue_cycles': list(p.scoreboard.issue_cycle),
+        'registers': [p.regs.regs[index] for index in range(32)],
+        'reg_change': p.reg_change,
+        'memory_words': [index for index, _ in dirty],
+        'memory_values': [value for _, value in dirty],
+        'stalls': p.st_count,
+        'decoded_pcs': sorted(p.decode_cache),
+        'models': {name: {'config': model.config, 'state': model.state()} for name, model in p._timing_models().items()},
+        'fetch_line': p.fetch_line,
+        'fetch_ready': p.fetch_ready,
+    }
+
+def save(p, path):
+    '''
+    Writes a checkpoint of processor p to path as gzip-compressed JSON.
+    '''
+    # json.dumps uses the C encoder; json.dump to a file encodes piece by piece in Python
+    data = json.dumps(capture(p), separators=(',', ':'))
+    with gzip.open(path, 'wt') as out:
+        out.write(data)
+
+def load(path):
+    '''
+    Reads a checkpoint written by save.
+    '''
+    with gzip.open(path, 'rt') as checkpoint:
+        state = json.load(checkpoint)
+    if state.get('version') != FORMAT_VERSION:
+        raise ValueError(f"'{path}' is not a version {FORMAT_VERSION} checkpoint")
+    return state
+
+def restore(memory_image, path, **config):
+    '''
+    Creates a Processor on memory_image and restores the checkpoint at path into it.
+    Calling run() on the result continues exactly where the checkpointed run was.
+
+    :param memory_image: The memory image the checkpointed run started from.
+    :param path: The checkpoint file.
+    :param config: Further keyword arguments for Processor, e.g. trace_sink or profile.
+    :return: The restored Processor.
+    '''
+    state = load(path)
+    if state['image_words'] != len(memory_image):
+        raise ValueError(f"checkpoint '{path}' was taken on a memory image of {state['image_words']} words, "
+                         f"not {len(memory_image)}")
+    # Checkpoints from before the cache and predictor models have none
+    models = state.get('models', {})
+    for name, model in models.items():
+        config[name] = model['config']
+    p = Processor(memory_image, forwarding=state['forwarding'], **config)
+    for name, model in models.items():
+        getattr(p, name).load_state(model['state'])
+    p.fetch_line = state.get('fetch_line')
+    p.fetch_ready = state.get('fetch_ready', 0)
+    for name, value in state['counters'].items():
+        setattr(p, name, value)
+    for index, value in enumerate(state['registers']):
+        p.regs.regs[index] = value
+    p.reg_change = state['reg_change']
+    p.mem_image.dirty.update(zip(state['memory_words'], state['memory_values']))
+    p.st_count = state['stalls']
+    for pc in state['decoded_pcs']:
+        template = Instruction(p.mem_image.read_word(pc))
+        template.decode()
+        template.pc = pc
+        p.decode_cache[pc] = template
+    # The in-flight instructions take the first latches of the ring, so the next fetch
+    # uses a free one
+    in_flight = [_instr_from_state(instr) for instr in state['instructions']]
+    p.latches[:len(in_flight)] = in_flight
+    p.latch_index = len(in_flight) % LATCH_COUNT
+    p.data_list = [state['fetch_address']] + [BUBBLE if index is None else in_flight[index] for index in state['latches']]
+    p.scoreboard.producer = [None if index is None else in_flight[index] for index in state['producers']]
+    p.scoreboard.issue_cycle = state['issue_cycles']
+    return p
+
+def run_with_checkpoints(p, every, directory, max_cycles=None, max_instructions=None, max_seconds=None,
+                         detect_stuck=False):
+    '''
+    Runs processor p to completion, saving a checkpoint to directory every `every` cycles.
+    The budgets and detect_stuck apply to the whole run as in Processor.run, which may stop it
+    early; p.stop_reason then says why.
+
+    :return: The paths of the saved checkpoints.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    deadline = None if max_seconds is None else time.monotonic() + max_seconds
+    paths = []
+    while True:
+        limit = (p.cycles // every + 1) * every
+        if max_cycles is not None:
+            limit = min(limit, max_cycles)
+        seconds = None if deadline is None else max(deadline - time.monotonic(), 0)
+        if p.run(max_cycles=limit, max_instructions=max_instructions, max_seconds=seconds, detect_stuck=detect_stuck):
+            return paths
+        if p.stop_reason != 'max_cycles' or (max_cycles is not None and p.cycles >= max_cycles):
+            return paths
+        path = os.path.join(directory, f'cycle_{p.cycles}.json.gz')
+        save(p, path)
+        paths.append(path)
+
+# Counters reported for a region of interest
+REGION_COUNTERS = ('cycles', 'num_instructions', 'hazards', 'branches_taken', 'branch_penalties')
+
+def main():
+    parser = argparse.ArgumentParser(description="Save pipeline checkpoints, or resume a run from one.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    save_parser = commands.add_parser("save", help="simulate an image and save a checkpoint every N cycles")
+    save_parser.add_argument("image_file", help="memory image file")
+    save_parser.add_argument("--every", type=int, required=True, help="cycles between checkpoints")
+    save_parser.add_argument("--dir", default="checkpoints", help="directory for the checkpoints (default: checkpoints)")
+    save_parser.add_argument("--forwarding", action="store_true", help="simulate with forwarding enabled")
+    resume_parser = commands.add_parser("resume", help="restore a checkpoint and simulate from it")
+    resume_parser.add_argument("image_file", help="memory image file the checkpoint was taken on")
+    resume_parser.add_argument("checkpoint", help="checkpoint file")
+    resume_parser.add_argument("--cycles", type=int, help="cycles to simulate (default: until Halt)")
+    args = parser.parse_args()
+
+    mem_image = load_image(args.image_file)
+    if args.command == "save":
+        paths = run_with_checkpoints(Processor(mem_image, forwarding=args.forwarding), args.every, args.dir)
+        print(f"Saved {len(paths)} checkpoints to '{args.dir}'")
+        return
+    p = restore(mem_image, args.checkpoint)
+    start = {name: getattr(p, name) for name in REGION_COUNTERS}
+    start['stalls'] = sum(p.st_count)
+    p.run(None if args.cycles is None else p.cycles + args.cycles)
+    print(f"Region from cycle {start['cycles']} to cycle {p.cycles}:")
+    for name in REGION_COUNTERS:
+        print(f"  {name}: {getattr(p, name) - start[name]}")
+    print(f"  stalls: {sum(p.st_count) - start['stalls']}")
+    instructions = p.num_instructions - start['num_instructions']
+    if instructions:
+        print(f"  CPI: {(p.cycles - start['cycles']) / instructions}")
+
+if __name__ == "__main__":
+    main()
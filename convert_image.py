@@ -0,0 +1,25 @@
+from memory import convert_image
+import sys
+import os
+
+def main():
+	if len(sys.argv) < 3:
+		print("Usage: python convert_image.py <text_image_file> <binary_image_file> [big|little]")
+		sys.exit(1)
+
+	text_file = sys.argv[1]
+	bin_file = sys.argv[2]
+	byteorder = sys.argv[3] if len(sys.argv) > 3 else 'big'
+
+	if not os.path.exists(text_file):
+		print(f"Error: The file '{text_file}' does not exist. Please provide a correct file.")
+		sys.exit(1)
+	if byteorder not in ('big', 'little'):
+		print(f"Error: Unknown byte order '{byteorder}'. Use 'big' or 'little'.")
+		sys.exit(1)
+
+	count = convert_image(text_file, bin_file, byteorder)
+	print(f"Wrote {count} words to '{bin_file}' ({byteorder}-endian)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+import memory
+from translator import BlockTranslator, CodeModified
+from instruction import Instruction, Opcode, OPCODE_FLAGS, ARITH, LOGIC, MEM, CTRL, BRANCH
+
+def _signed32(num):
+    '''
+    Returns num truncated to 32 bits and interpreted as a signed number.
+    '''
+    num &= 0xFFFFFFFF
+    return num - 0x100000000 if num & 0x80000000 else num
+
+class FunctionalProcessor(object):
+    '''
+    Functional (ISA-only) model of the MIPS-lite processor. Executes one instruction per step
+    with no pipeline timing, using the same Instruction decoding, register file and Memory
+    state as Processor. It produces the same final PC, register and memory state and the same
+    instruction-mix counters, which makes it both a fast way to get results and a reference
+    to check the pipelined model against.
+
+    Attributes:
+    - memory_image: An instance of the Memory class containing the instruction trace.
+    - debug: Prints every executed instruction if set to True. Defaults to False.
+    - translate: Runs basic blocks translated to Python functions (see translator.py) instead of
+      interpreting one instruction at a time. Ignored when debug is set. Defaults to False.
+    - recorder: Receives every executed instruction through record(pc, instr, taken), e.g. a
+      recorder.TraceRecorder. Recording runs the interpreter even if translate is set. Defaults to None.
+    '''
+    def __init__(self,memory_image,debug=False,translate=False,recorder=None):
+        '''
+        Instantiate a new functional processor.
+        '''
+        self.mem_image = memory_image.fork()
+        self.original_mem = memory_image
+        self.debug = debug
+        self.regs = memory.registers()
+        self.decode_cache = dict()
+        self.mem_image.code_cache = self.decode_cache
+        self.pc = 0
+        # Last value written to each register, keyed by register number
+        self.changed_regs = {}
+        self.opcode_counts = dict.fromkeys(Opcode, 0)
+        self.num_instructions = 0
+        self.branches_taken = 0
+        self.Halt = False
+        self.dispatch = {
+            Opcode.Add: self._add, Opcode.Addi: self._addi, Opcode.Sub: self._sub, Opcode.Subi: self._subi,
+            Opcode.Mul: self._mul, Opcode.Muli: self._muli, Opcode.Or: self._or, Opcode.Ori: self._ori,
+            Opcode.And: self._and, Opcode.Andi: self._andi, Opcode.Xor: self._xor, Opcode.Xori: self._xori,
+            Opcode.Ldw: self._ldw, Opcode.Stw: self._stw, Opcode.Bz: self._bz, Opcode.Beq: self._beq,
+            Opcode.Jr: self._jr, Opcode.Halt: self._halt, None: self._nop
+        }
+        self.translator = BlockTranslator(self) if translate else None
+        self.recorder = recorder
+
+    @property
+    def reg_change(self):
+        '''
+        Written registers in the same form as Processor.reg_change, e.g. {'R1': 5}.
+        '''
+        return {'R' + str(reg): value for reg, value in self.changed_regs.items()}
+
+    def _fetch(self,pc):
+        '''
+        Returns the decoded instruction at pc, decoding and caching it on first use.
+        '''
+        instr = self.decode_cache.get(pc)
+        if instr is None:
+            instr = Instruction(self.mem_image.read_word(pc))
+            instr.decode()
+            instr.pc = pc
+            # A store can only invalidate the word's aligned address, so other PCs stay uncached
+            if memory.code_key(pc) == pc:
+                self.decode_cache[pc] = instr
+        return instr
+
+    def step(self,):
+        '''
+        Executes the instruction at the program counter.
+        Returns False once a Halt instruction has been executed.
+        '''
+        instr = self._fetch(self.pc)
+        if self.debug:
+            print("Executing at PC", self.pc, ": ", instr)
+        if instr.opcode is not None:
+            self.num_instructions += 1
+            self.opcode_counts[instr.opcode] += 1
+        taken = self.branches_taken
+        pc = self.dispatch[instr.opcode](instr, self.pc)
+        if self.recorder is not None:
+            self.recorder.record(self.pc, instr, self.branches_taken != taken)
+        self.pc = pc
+        return not self.Halt
+
+    def run(self,max_instructions=None):
+        '''
+        Runs the trace until Halt, or until max_instructions have been executed if given.
+        '''
+        if self.translator is not None and not self.debug and self.recorder is None:
+            self._run_translated(max_instructions)
+        else:
+            self._interpret(max_instructions)
+
+    def _run_translated(self,max_instructions):
+        '''
+        Runs translated blocks. A block that would overrun max_instructions is not entered;
+        the remaining instructions are interpreted so the limit is exact.
+        '''
+        translator = self.translator
+        blocks = translator.blocks
+        pc = self.pc
+        executed = 0
+        while not self.Halt:
+            block = blocks.get(pc) or translator.get(pc)
+            if max_instructions is not None and executed + block.length > max_instructions:
+                break
+            try:
+                pc = block.fn()
+            except CodeModified as e:
+                translator.fold(block, e.executed)
+                executed += sum(1 for op in block.opcodes[:e.executed] if op is not None)
+                translator.invalidate(e.address)
+                pc = e.pc
+                continue
+            block.runs += 1
+            executed += block.length
+            if block.halts:
+                self.Halt = True
+        self.pc = pc
+        translator.flush()
+        if max_instructions is not None and not self.Halt:
+            self._interpret(max_instructions - executed)
+
+    def _interpret(self,max_instructions):
+        '''
+        Interprets one instruction at a time through the dispatch table.
+        '''
+        dispatch = self.dispatch
+        fetch = self._fetch
+        counts = self.opcode_counts
+        record = self.recorder.record if self.recorder is not None else None
+        pc = self.pc
+        executed = 0
+        while not self.Halt:
+            if max_instructions is not None and executed >= max_instructions:
+                break
+            instr = fetch(pc)
+            opcode = instr.opcode
+            if opcode is not None:
+                executed += 1
+                counts[opcode] += 1
+            if self.debug:
+                print("Executing at PC", pc, ": ", instr)
+            if record is None:
+                pc = dispatch[opcode](instr, pc)
+            else:
+                taken = self.branches_taken
+                next_pc = dispatch[opcode](instr, pc)
+                record(pc, instr, self.branches_taken != taken)
+                pc = next_pc
+        self.pc = pc
+        self.num_instructions += executed
+        return
+
+    # Register values are sign-converted with the same rules as Processor: arithmetic,
+    # memory and branch instructions use signed rs, logical instructions use rs as stored,
+    # R-type instructions use signed rt, and Stw/Beq use rt as stored.
+    def _add(self,instr,pc):
+        r = self.regs.regs
+        value = (_signed32(r[instr.reg_rs]) + _signed32(r[instr.reg_rt])) & 0xFFFFFFFF
+        r[instr.reg_rd] = self.changed_regs[instr.reg_rd] = value - 0x100000000 if value & 0x80000000 else value
+        return pc + 4
+
+    def _addi(self,instr,pc):
+        r = self.regs.regs
+        value = (_signed32(r[instr.reg_rs]) + instr.imm) & 0xFFFFFFFF
+        r[instr.reg_rt] = self.changed_regs[instr.reg_rt] = value - 0x100000000 if value & 0x80000000 else value
+        return pc + 4
+
+    def _sub(self,instr,pc):
+        r = self.regs.regs
+        value = (_signed32(r[instr.reg_rs]) - _signed32(r[instr.reg_rt])) & 0xFFFFFFFF
+        r[instr.reg_rd] = self.changed_regs[instr.reg_rd] = value - 0x100000000 if value & 0x80000000 else value
+        return pc + 4
+
+    def _subi(self,instr,pc):
+        r = self.regs.regs
+        value = (_signed32(r[instr.reg_rs]) - instr.imm) & 0xFFFFFFFF
+        r[instr.reg_rt] = self.changed_regs[instr.reg_rt] = value - 0x100000000 if value & 0x80000000 else value
+        return pc + 4
+
+    def _mul(self,instr,pc):
+        r = self.regs.regs
+        value = (_signed32(r[instr.reg_rs]) * _signed32(r[instr.reg_rt])) & 0xFFFFFFFF
+        r[instr.reg_rd] = self.changed_regs[instr.reg_rd] = value - 0x100000000 if value & 0x80000000 else value
+        return pc + 4
+
+    def _muli(self,instr,pc):
+        r = self.regs.regs
+        value = (_signed32(r[instr.reg_rs]) * instr.imm) & 0xFFFFFFFF
+        r[instr.reg_rt] = self.changed_regs[instr.reg_rt] = value - 0x100000000 if value & 0x80000000 else value
+        return pc + 4
+
+    def _or(self,instr,pc):
+        r = self.regs.regs
+        r[instr.reg_rd] = self.changed_regs[instr.reg_rd] = r[instr.reg_rs] | _signed32(r[instr.reg_rt])
+        return pc + 4
+
+    def _ori(self,instr,pc):
+        r = self.regs.regs
+        r[instr.reg_rt] = self.changed_regs[instr.reg_rt] = r[instr.reg_rs] | instr.imm
+        return pc + 4
+
+    def _and(self,instr,pc):
+        r = self.regs.regs
+        r[instr.reg_rd] = self.changed_regs[instr.reg_rd] = r[instr.reg_rs] & _signed32(r[instr.reg_rt])
+        return pc + 4
+
+    def _andi(self,instr,pc):
+        r = self.regs.regs
+        r[instr.reg_rt] = self.changed_regs[instr.reg_rt] = r[instr.reg_rs] & instr.imm
+        return pc + 4
+
+    def _xor(self,instr,pc):
+        r = self.regs.regs
+        r[instr.reg_rd] = self.changed_regs[instr.reg_rd] = r[instr.reg_rs] ^ _signed32(r[instr.reg_rt])
+        return pc + 4
+
+    def _xori(self,instr,pc):
+        r = self.regs.regs
+        r[instr.reg_rt] = self.changed_regs[instr.reg_rt] = r[instr.reg_rs] ^ instr.imm
+        return pc + 4
+
+    def _ldw(self,instr,pc):
+        r = self.regs.regs
+        addr = _signed32(_signed32(r[instr.reg_rs]) + instr.imm)
+        r[instr.reg_rt] = self.changed_regs[instr.reg_rt] = _signed32(self.mem_image.read_word(addr))
+        return pc + 4
+
+    def _stw(self,instr,pc):
+        r = self.regs.regs
+        addr = _signed32(_signed32(r[instr.reg_rs]) + instr.imm)
+        self.mem_image.write_word(addr, r[instr.reg_rt])
+        if self.translator is not None and (addr & -4) in self.translator.code:
+            self.translator.invalidate(addr & -4)
+        return pc + 4
+
+    def _bz(self,instr,pc):
+        if _signed32(self.regs.regs[instr.reg_rs]) == 0:
+            self.branches_taken += 1
+            return pc + 4 * instr.x_addr
+        return pc + 4
+
+    def _beq(self,instr,pc):
+        r = self.regs.regs
+        if _signed32(r[instr.reg_rs]) == r[instr.reg_rt]:
+            self.branches_taken += 1
+            return pc + 4 * instr.imm
+        return pc + 4
+
+    def _jr(self,instr,pc):
+        self.branches_taken += 1
+        return _signed32(self.regs.regs[instr.reg_rs])
+
+    def _halt(self,instr,pc):
+        self.Halt = True
+        return pc + 4
+
+    def _nop(self,instr,pc):
+        return pc + 4
+
+    def _count(self,mask):
+        return sum(count for op, count in self.opcode_counts.items() if OPCODE_FLAGS[op] & mask)
+
+    def print_stats(self):
+        '''
+        Prints the final PC, memory and register state and the instruction counts.
+        '''
+        print("\nSimulating the MIPS-lite processor in functional mode\n")
+        print("*" * 5 + " PC, Memory and Register state " + "*" * 5 + "\n")
+        print("Program counter state: ", self.pc)
+        self.print_mem()
+        self.print_reg()
+        print("\n" + "*" * 5 + " Instruction Counts " + "*" * 5 + "\n")
+        print("Total Instruction count: ", self.num_instructions)
+        print("Arithmetic Instruction count: ", self._count(ARITH))
+        print("Logical Instruction count: ", self._count(LOGIC))
+        print("Memory Instruction count: ", self._count(MEM))
+        print("Control Instruction count: ", self._count(CTRL))
+        print("\n" + "*" * 5 + " Branching Information " + "*" * 5 + "\n")
+        print("Total number of branches: ", self._count(BRANCH))
+        print("Total number of branches taken: ", self.branches_taken)
+
+    def store_stats(self):
+        '''
+        Stores execution statistics in a dictionary and returns it. The keys match the
+        corresponding keys of Processor.store_stats().
+        '''
+        return {
+            "mode": "functional",
+            "program_counter": self.pc,
+            "num_instructions": self.num_instructions,
+            "arithmetic_instructions": self._count(ARITH),
+            "logic_instructions": self._count(LOGIC),
+            "memory_instructions": self._count(MEM),
+            "control_instructions": self._count(CTRL),
+            "total_branches": self._count(BRANCH),
+            "branches_taken": self.branches_taken
+        }
+
+    def print_mem(self):
+        '''
+        Prints the state of memory locations that have changed during execution, each on a new line.
+        '''
+        print("\nChanged memory state:")
+        for address, value in self.mem_image.changed_words():
+            print(f"Address {address}: {_signed32(value)}")
+
+    def print_reg(self):
+        '''
+        Prints the current state of the processor's registers in ascending order.
+        '''
+        print("\nRegister State:")
+        for reg in sorted(self.reg_change.keys(), key=lambda x: int(x[1:])):
+            print(f"{reg}: {self.reg_change[reg]}")
+
+def compare(reference,processor):
+    '''
+    Compares the final architectural state and instruction mix of a pipelined Processor
+    against a FunctionalProcessor that ran the same image.
+    Returns a list of human-readable mismatch descriptions; an empty list means they agree.
+    '''
+    mismatches = []
+    keys = ["program_counter", "num_instructions", "arithmetic_instructions", "logic_instructions",
+            "memory_instructions", "control_instructions", "total_branches", "branches_taken"]
+    ref_stats = reference.store_stats()
+    for key in keys:
+        value = getattr(processor, {
+            "program_counter": "pc", "arithmetic_instructions": "ari_count",
+            "logic_instructions": "logic_count", "memory_instructions": "ld_count",
+            "control_instructions": "ctrl_count"}.get(key, key))
+        if value != ref_stats[key]:
+            mismatches.append(f"{key}: expected {ref_stats[key]}, got {value}")
+    if reference.reg_change != processor.reg_change:
+        mismatches.append(f"registers: expected {reference.reg_change}, got {processor.reg_change}")
+    ref_mem = dict(reference.mem_image.changed_words())
+    mem = dict(processor.mem_image.changed_words())
+    if ref_mem != mem:
+        mismatches.append(f"memory: expected {ref_mem}, got {mem}")
+    return mismatches
+
+def verify(memory_image,forwarding=False):
+    '''
+    Runs memory_image through both the pipelined and the functional model and returns
+    the list of mismatches found by compare().
+    '''
+    from processor import Processor
+    reference = FunctionalProcessor(memory_image)
+    reference.run()
+    processor = Processor(memory_image, forwarding=forwarding)
+    processor.run()
+    return compare(reference, processor)
@@ -0,0 +1,200 @@
+from processor import Processor
+from memory import load_image, image_words, image_hash, WORD_TYPECODE
+import checkpoint
+from array import array
+import contextlib
+import glob
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+
+# Default directory of the run cache and cycles between checkpoints
+CACHE_DIR = '.simcache'
+CHECKPOINT_EVERY = 10000
+
+class FirstReads(object):
+    '''
+    Records, for every word of the base image a Processor reads, the cycle of the first
+    read that returned the image's value rather than one the program had written. Until
+    that cycle, a run cannot tell the word's original value apart from any other.
+    The recorder shadows the read_word method of the processor's memory overlay.
+    '''
+    def __init__(self, p, reads=None):
+        '''
+        Starts recording the reads of processor p, continuing from an earlier record if given.
+        '''
+        self.reads = dict() if reads is None else reads
+        memory = p.mem_image
+        dirty, read_word, reads = memory.dirty, memory.read_word, self.reads
+        def recording_read(index):
+            word_index = index >> 2
+            if word_index not in dirty and word_index not in reads:
+                reads[word_index] = p.cycles
+            return read_word(index)
+        memory.read_word = recording_read
+
+class RunCache(object):
+    '''
+    Directory of previous runs, used to re-simulate an edited image incrementally.
+
+    Every run is stored under the SHA-256 hash of its image and its configuration, with
+    checkpoints taken every `every` cycles, the cycle of the first read of every image word
+    (FirstReads) and the image words themselves. An index maps each image file and
+    configuration to the hash of the image of its latest run. When that file is simulated
+    again in that configuration, the words that differ from the latest run's image are
+    compared against the first reads. The run restores the last
+    checkpoint taken before any edited word was read, which has exactly the state a full
+    rerun would reach. It then simulates only the rest of the program.
+    '''
+    def __init__(self, directory=CACHE_DIR, every=CHECKPOINT_EVERY):
+        '''
+        Opens the cache in directory, creating it if needed.
+        '''
+        self.directory = directory
+        self.every = every
+        os.makedirs(directory, exist_ok=True)
+        self.index_path = os.path.join(directory, 'index.json')
+
+    def _index(self):
+        if not os.path.exists(self.index_path):
+            return dict()
+        with open(self.index_path) as index:
+            return json.load(index)
+
+    def _label(self, forwarding, timing):
+        '''
+        Returns the name that tells a configuration's runs of an image apart.
+        '''
+        label = 'forwarding' if forwarding else 'no_forwarding'
+        if timing:
+            # Caches and predictors change the timing, so each configuration keeps its own checkpoints
+            label += '_' + hashlib.sha256(json.dumps(timing, sort_keys=True).encode()).hexdigest()[:16]
+        return label
+
+    def _run_dir(self, digest, forwarding, timing):
+        return os.path.join(self.directory, digest, self._label(forwarding, timing))
+
+    def _checkpoints(self, run_dir):
+        '''
+        Returns the checkpoints of a stored run as (cycle, path) tuples in cycle order.
+        '''
+        paths = glob.glob(os.path.join(run_dir, 'cycle_*.json.gz'))
+        return sorted((int(os.path.basename(path)[len('cycle_'):-len('.json.gz')]), path) for path in paths)
+
+    def _load_words(self, digest):
+        words = array(WORD_TYPECODE)
+        with gzip.open(os.path.join(self.directory, digest, 'image.gz'), 'rb') as image:
+            words.frombytes(image.read())
+        return words
+
+    def _load_reads(self, run_dir):
+        with gzip.open(os.path.join(run_dir, 'reads.json.gz'), 'rt') as reads:
+            return {int(word): cycle for word, cycle in json.load(reads).items()}
+
+    def _resume_point(self, image_file, words, forwarding, timing):
+        '''
+        Finds the latest stored checkpoint from which a run of words can resume.
+        Returns (cycle, path, reads) with the first reads before that cycle, or None.
+        '''
+        runs = self._index().get(os.path.abspath(image_file))
+        if not isinstance(runs, dict):
+            return None
+        previous = runs.get(self._label(forwarding, timing))
+        if previous is None:
+            return None
+        run_dir = self._run_dir(previous, forwarding, timing)
+        if not os.path.exists(os.path.join(run_dir, 'reads.json.gz')):
+            return None
+        old_words = self._load_words(previous)
+        if len(old_words) != len(words):
+            return None
+        reads = self._load_reads(run_dir)
+        edited = [index for index, (old, new) in enumerate(zip(old_words, words)) if old != new]
+        first = min((reads[index] for index in edited if index in reads), default=float('inf'))
+        usable = [(cycle, path) for cycle, path in self._checkpoints(run_dir) if cycle <= first]
+        if not usable:
+            return None
+        cycle, path = usable[-1]
+        return cycle, path, {word: read for word, read in reads.items() if read < cycle}
+
+    def simulate(self, image_file, forwarding=False, budget=None, **config):
+        '''
+        Simulates image_file to completion, resuming from a previous run of the same file
+        when possible, and stores the run for the next time. Only a run that reaches Halt
+        is stored.
+
+        :param budget: Keyword arguments for Processor.run that bound the run, e.g.
+            {'detect_stuck': True}; a run stopped early reports its stop_reason.
+        :param config: Further keyword arguments for Processor.
+        :return: A tuple (processor, resumed_cycle) of the finished Processor and the cycle it
+            resumed from (0 for a full run).
+        '''
+        mem_image = load_image(image_file)
+        words = image_words(mem_image)
+        digest = image_hash(words)
+        timing = {name: config[name] for name in ('icache', 'dcache', 'predictor') if config.get(name) is not None}
+        run_dir = self._run_dir(digest, forwarding, timing)
+        resume = self._resume_point(image_file, words, forwarding, timing)
+        if resume is not None:
+            resumed_cycle, path, reads = resume
+            p = checkpoint.restore(mem_image, path, **config)
+            kept = [(cycle, old) for cycle, old in self._checkpoints(os.path.dirname(path)) if cycle <= resumed_cycle]
+        else:
+            resumed_cycle, reads, kept = 0, None, []
+            p = Processor(mem_image, forwarding=forwarding, **config)
+        staging = run_dir + '.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for _, old in kept:
+            shutil.copy(old, staging)
+        recorder = FirstReads(p, reads)
+        try:
+            checkpoint.run_with_checkpoints(p, self.every, staging, **(budget or {}))
+        finally:
+            # Restore the plain read method, so the returned processor behaves like any other
+            del p.mem_image.read_word
+        if p.stop_reason != 'halt':
+            shutil.rmtree(staging, ignore_errors=True)
+            # Leaves the image's directory if another run of it is stored
+            with contextlib.suppress(OSError):
+                os.rmdir(os.path.dirname(run_dir))
+            return p, resumed_cycle
+        with gzip.open(os.path.join(staging, 'reads.json.gz'), 'wt') as out:
+            json.dump(recorder.reads, out)
+        image_path = os.path.join(self.directory, digest, 'image.gz')
+        if not os.path.exists(image_path):
+            with gzip.open(image_path, 'wb') as out:
+                out.write(words.tobytes())
+        shutil.rmtree(run_dir, ignore_errors=True)
+        os.replace(staging, run_dir)
+        index = self._index()
+        runs = index.get(os.path.abspath(image_file))
+        if not isinstance(runs, dict):
+            runs = index[os.path.abspath(image_file)] = dict()
+        runs[self._label(forwarding, timing)] = digest
+        with open(self.index_path, 'w') as out:
+            json.dump(index, out, indent=2)
+        return p, resumed_cycle
+
+def run_incremental(image_file, configs, directory=CACHE_DIR, budget=None):
+    '''
+    Like runner.run_configs, but simulates each configuration through a RunCache.
+    budget holds keyword arguments for Processor.run that bound every run, e.g.
+    {'max_cycles': 10**6, 'detect_stuck': True}.
+
+    :return: A list of (report, stats) tuples in the order of configs.
+    '''
+    cache = RunCache(directory)
+    results = []
+    for config in configs:
+        config = dict(config)
+        forwarding = config.pop('forwarding', False)
+        report = io.StringIO()
+        with contextlib.redirect_stdout(report):
+            p, _ = cache.simulate(image_file, forwarding, budget, **config)
+            p.print_stats()
+        results.append((report.getvalue(), p.store_stats()))
+    return results
@@ -1,43 +1,120 @@
+from enum import IntEnum
+
+class Opcode(IntEnum):
+    """
+    The MIPS-lite opcodes, valued by their 6-bit encoding.
+    Members are named after the instruction mnemonics and print as them.
+    """
+    Add = 0
+    Addi = 1
+    Sub = 2
+    Subi = 3
+    Mul = 4
+    Muli = 5
+    Or = 6
+    Ori = 7
+    And = 8
+    Andi = 9
+    Xor = 10
+    Xori = 11
+    Ldw = 12
+    Stw = 13
+    Bz = 14
+    Beq = 15
+    Jr = 16
+    Halt = 17
+
+    def __str__(self):
+        return self.name
+
+# Instruction class bits, combined into a per-opcode mask in OPCODE_FLAGS
+ARITH = 0x001       # Arithmetic instruction
+LOGIC = 0x002       # Logical instruction
+MEM = 0x004         # Memory (load/store) instruction
+CTRL = 0x008        # Control instruction
+R_TYPE = 0x010      # Register format
+WRITES_RD = 0x020   # Writes its result to rd
+WRITES_RT = 0x040   # Writes its result to rt
+BRANCH = 0x080      # Branch or jump that can redirect the PC
+READS_RT = 0x100    # Reads rt as a source operand
+
+OPCODE_FLAGS = {
+    Opcode.Add: ARITH | R_TYPE | WRITES_RD | READS_RT,
+    Opcode.Addi: ARITH | WRITES_RT,
+    Opcode.Sub: ARITH | R_TYPE | WRITES_RD | READS_RT,
+    Opcode.Subi: ARITH | WRITES_RT,
+    Opcode.Mul: ARITH | R_TYPE | WRITES_RD | READS_RT,
+    Opcode.Muli: ARITH | WRITES_RT,
+    Opcode.Or: LOGIC | R_TYPE | WRITES_RD | READS_RT,
+    Opcode.Ori: LOGIC | WRITES_RT,
+    Opcode.And: LOGIC | R_TYPE | WRITES_RD | READS_RT,
+    Opcode.Andi: LOGIC | WRITES_RT,
+    Opcode.Xor: LOGIC | R_TYPE | WRITES_RD | READS_RT,
+    Opcode.Xori: LOGIC | WRITES_RT,
+    Opcode.Ldw: MEM | WRITES_RT,
+    Opcode.Stw: MEM | READS_RT,
+    Opcode.Bz: CTRL | BRANCH,
+    Opcode.Beq: CTRL | BRANCH | READS_RT,
+    Opcode.Jr: CTRL | BRANCH,
+    Opcode.Halt: CTRL,
+}
+
+# Opcode member for each 6-bit encoding, indexed by the encoding
+OPCODES = tuple(Opcode)
+
 class Instruction(object):
     """
     Represents a CPU instruction with methods to decode it from hexadecimal format.
+    Instances are slotted records; the decode tables live at module level.
 
     Attributes:
-        hex_instr (str): Hexadecimal string representing the instruction.
-        opcode_dict (dict): Maps binary opcode strings to their mnemonic.
-        r_type (list): List of mnemonics that are of R-type format.
+        hex_instr (str or int): Hexadecimal string or 32-bit integer representing the instruction.
         hex (str): Hexadecimal representation of the instruction.
-        opcode (str): Mnemonic of the opcode.
+        opcode (Opcode): The decoded opcode, or None for a bubble or an unknown encoding.
+        flags (int): Instruction class bits from OPCODE_FLAGS, 0 for a bubble.
         type (str): Type of the instruction ('R' for register, 'I' for immediate).
         rs, rt, rd (int): Source, target, and destination register numbers.
         reg_rs, reg_rt, reg_rd (int): Actual register numbers after decoding.
         imm (int): Immediate value for I-type instructions.
         x_addr (int): Address for branch instructions.
         frwd_rs, frwd_rt (bool): Flags indicating if forwarding is applied to rs and rt registers.
+        decoded (bool): True once the fields have been decoded from hex.
+        pc (int): Address the instruction was fetched from, or None if unknown.
+        predicted (int): For a branch, the address the branch predictor fetched next, or None
+            if no prediction was made and the fetch continued sequentially.
+        predict_history (int): Branch history the prediction was made with, for predictors that keep one.
     """
+    __slots__ = ('hex', 'opcode', 'flags', 'type', 'rs', 'rt', 'rd', 'reg_rs', 'reg_rt', 'reg_rd',
+                 'imm', 'x_addr', 'frwd_rs', 'frwd_rt', 'decoded', 'pc', 'predicted', 'predict_history')
 
     def __init__(self, hex_instr):
         """
         Initializes a new Instruction instance.
 
         Args:
-            hex_instr (str): Hexadecimal string of the instruction.
+            hex_instr (str or int): Hexadecimal string of the instruction, or the 32-bit word itself.
+        """
+        self.reset(hex_instr)
+
+    def reset(self, hex_instr):
+        """
+        Reinitializes this instance in place to an undecoded instruction, so that
+        pipeline latches can be reused instead of allocating new instances.
+
+        Args:
+            hex_instr (str or int): Hexadecimal string of the instruction, or the 32-bit word itself.
         """
-        self.opcode_dict = {
-            '000000': 'Add', '000001': 'Addi', '000010': 'Sub', '000011': 'Subi',
-            '000100': 'Mul', '000101': 'Muli', '000110': 'Or', '000111': 'Ori',
-            '001000': 'And', '001001': 'Andi', '001010': 'Xor', '001011': 'Xori',
-            '001100': 'Ldw', '001101': 'Stw', '001110': 'Bz', '001111': 'Beq',
-            '010000': 'Jr', '010001': 'Halt'
-        }
-        self.r_type = ['Add', 'Sub', 'Mul', 'Or', 'And', 'Xor']
-        self.hex = hex_instr
+        self.hex = '{0:08X}'.format(hex_instr) if isinstance(hex_instr, int) else hex_instr
         self.opcode = None
+        self.flags = 0
         self.type = None
         self.rs = self.rt = self.rd = 0
         self.reg_rs = self.reg_rt = self.reg_rd = None
         self.imm = self.x_addr = None
         self.frwd_rs = self.frwd_rt = False
+        self.decoded = False
+        self.pc = None
+        self.predicted = self.predict_history = None
 
     def __repr__(self):
         """
@@ -45,31 +122,88 @@ class Instruction(object):
         """
         return f'Instr({self.hex},{self.opcode},R{self.reg_rs}:{self.rs},R{self.reg_rt}:{self.rt},R{self.reg_rd}:{self.rd},imm:{self.imm},addr:{self.x_addr},rs_f:{self.frwd_rs},rt_f:{self.frwd_rt})'
 
+    def clone(self):
+        """
+        Returns a copy of this instruction that can travel through the pipeline
+        without modifying the original.
+        """
+        instr = Instruction.__new__(Instruction)
+        instr.copy_from(self)
+        return instr
+
+    def copy_from(self, other):
+        """
+        Overwrites every field of this instance with the fields of other. Used to load
+        a reusable pipeline latch from a template in the decoded-instruction cache.
+        """
+        self.hex = other.hex
+        self.opcode = other.opcode
+        self.flags = other.flags
+        self.type = other.type
+        self.rs = other.rs
+        self.rt = other.rt
+        self.rd = other.rd
+        self.reg_rs = other.reg_rs
+        self.reg_rt = other.reg_rt
+        self.reg_rd = other.reg_rd
+        self.imm = other.imm
+        self.x_addr = other.x_addr
+        self.frwd_rs = other.frwd_rs
+        self.frwd_rt = other.frwd_rt
+        self.decoded = other.decoded
+        self.pc = other.pc
+        self.predicted = other.predicted
+        self.predict_history = other.predict_history
+
     def decode(self):
         """
-        Decodes the instruction from its hexadecimal representation.
+        Decodes the instruction from its hexadecimal representation using integer bit fields.
         """
-        if self.hex is None:
+        if self.hex is None or self.decoded:
             return
-        # Convert hex to a 32-bit binary string
-        bin_inst = '{0:032b}'.format(int.from_bytes(bytes.fromhex(self.hex), byteorder='big', signed=True))
-        opcode = bin_inst[:6]
-        if opcode in self.opcode_dict:
-            self.opcode = self.opcode_dict[opcode]
-            if self.opcode in self.r_type:  # Decode R-type instruction
+        self.decoded = True
+        word = int(self.hex, 16)
+        opcode = word >> 26
+        if 0 <= opcode < len(OPCODES):
+            self.opcode = OPCODES[opcode]
+            self.flags = OPCODE_FLAGS[self.opcode]
+            if self.flags & R_TYPE:  # Decode R-type instruction
                 self.type = 'R'
-                self.reg_rs = int(bin_inst[6:11], 2)
-                self.reg_rt = int(bin_inst[11:16], 2)
-                self.reg_rd = int(bin_inst[16:21], 2)
+                self.reg_rs = (word >> 21) & 0x1F
+                self.reg_rt = (word >> 16) & 0x1F
+                self.reg_rd = (word >> 11) & 0x1F
             else:  # Decode I-type instruction
                 self.type = 'I'
-                if self.opcode == 'Halt':
+                if self.opcode == Opcode.Halt:
                     return
-                self.reg_rs = int(bin_inst[6:11], 2)
-                if self.opcode == 'Jr':
+                self.reg_rs = (word >> 21) & 0x1F
+                if self.opcode == Opcode.Jr:
                     return
-                if self.opcode == 'Bz':
-                    self.x_addr = int('{0:016b}'.format(int.from_bytes(bytes.fromhex(self.hex[-4:]), byteorder='big', signed=True)), 2)
+                # The 16-bit immediate is sign-extended
+                imm = word & 0xFFFF
+                imm = imm - 0x10000 if imm & 0x8000 else imm
+                if self.opcode == Opcode.Bz:
+                    self.x_addr = imm
                     return
-                self.reg_rt = int(bin_inst[11:16], 2)
-                self.imm = int('{0:016b}'.format(int.from_bytes(bytes.fromhex(self.hex[-4:]), byteorder='big', signed=True)), 2)
+                self.reg_rt = (word >> 16) & 0x1F
+                self.imm = imm
+
+class _Bubble(Instruction):
+    """
+    An empty pipeline slot. A single shared, immutable instance (BUBBLE) is used for
+    every bubble, so inserting one allocates nothing.
+    """
+    __slots__ = ()
+
+    def __init__(self):
+        empty = Instruction(None)
+        for name in Instruction.__slots__:
+            object.__setattr__(self, name, getattr(empty, name))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('the pipeline bubble is immutable')
+
+    def __reduce__(self):
+        return 'BUBBLE'
+
+BUBBLE = _Bubble()
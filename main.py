@@ -1,35 +1,106 @@
-from processor import Processor
-from memory import Memory
+from runner import run_configs, run_analytical, add_budget_arguments, budget_from_args, add_timing_arguments, timing_from_args
+from incremental import run_incremental, CACHE_DIR
+from resultcache import CACHE_DIR as RESULT_CACHE_DIR
+from functional import FunctionalProcessor
+from memory import load_image
+from profiler import print_profile
+import argparse
 import sys
 import os
 
-def main():
-	if len(sys.argv) < 2:
-		print("Usage: python main.py <memory_image_file>")
-		sys.exit(1)
+def parse_args():
+	parser = argparse.ArgumentParser(description="Simulate a memory image on the MIPS-lite processor.")
+	parser.add_argument("image_file", help="memory image file (hex text, or raw binary ending in .bin)")
+	parser.add_argument("--functional", action="store_true",
+		help="run the fast functional model only (final state and instruction counts, no timing)")
+	parser.add_argument("--jobs", type=int, default=None,
+		help="number of worker processes for the simulations (default: one per configuration, 1 runs sequentially)")
+	parser.add_argument("--analytical", action="store_true",
+		help="execute the program once and compute the timing of both forwarding settings from its dynamic trace")
+	parser.add_argument("--trace", metavar="PATH",
+		help="write a per-cycle pipeline trace of each run, e.g. run.jsonl.gz gives run.no_forwarding.jsonl.gz and "
+			"run.forwarding.jsonl.gz (.bin for the binary format; .gz, .bz2 or .xz to compress)")
+	parser.add_argument("--trace-cycles", type=_range, metavar="START:STOP", help="only trace cycles in [START, STOP)")
+	parser.add_argument("--trace-pcs", type=_range, metavar="LOW:HIGH", help="only trace cycles with an instruction from PCs in [LOW, HIGH)")
+	parser.add_argument("--profile", action="store_true",
+		help="report host time per pipeline stage and the stall cycles, hazards and branch penalties per PC")
+	parser.add_argument("--incremental", nargs="?", const=CACHE_DIR, metavar="CACHE_DIR",
+		help="keep checkpoints of each run in CACHE_DIR (default: %(const)s) and, after the image is edited, "
+			"resume from the last one taken before an edited word was read")
+	parser.add_argument("--no-cache", action="store_true",
+		help=f"always simulate, without consulting or filling the result cache in {RESULT_CACHE_DIR}")
+	add_budget_arguments(parser)
+	add_timing_arguments(parser)
+	args = parser.parse_args()
+	if args.analytical and (args.trace or args.profile):
+		parser.error("--trace and --profile need the pipelined simulation and cannot be used with --analytical")
+	if args.incremental and (args.analytical or args.trace or args.profile):
+		parser.error("--incremental cannot be used with --analytical, --trace or --profile")
+	if args.analytical and any(budget is not None for budget in (args.max_cycles, args.max_instructions, args.max_seconds)):
+		parser.error("--max-cycles, --max-instructions and --max-seconds cannot be used with --analytical")
+	if args.analytical and timing_from_args(args):
+		parser.error("--icache, --dcache and --predictor need the pipelined simulation and cannot be used with --analytical")
+	return args
+
+def _range(text):
+	'''
+	Parses a half-open range START:STOP, where either bound may be omitted.
+	'''
+	start, _, stop = text.partition(':')
+	try:
+		return (int(start, 0) if start else 0, int(stop, 0) if stop else float('inf'))
+	except ValueError:
+		raise argparse.ArgumentTypeError(f"invalid range '{text}', expected START:STOP")
 
-	image_file = sys.argv[1]
+def _trace_path(path, label):
+	'''
+	Inserts label before the extensions of path, e.g. run.jsonl.gz -> run.<label>.jsonl.gz.
+	'''
+	directory, name = os.path.split(path)
+	stem, dot, extensions = name.partition('.')
+	return os.path.join(directory, stem + '.' + label + dot + extensions)
+
+def main():
+	args = parse_args()
+	image_file = args.image_file
 
 	# Check if the file exists
 	if not os.path.exists(image_file):
 		print(f"Error: The file '{image_file}' does not exist. Please provide a correct file.")
 		sys.exit(1)  # Exit if the file does not exist
 
-	mem_image = Memory(image_file)
-
 	print("\n" + "*" * 10 + "ECE586 Spring 2024 Final Project Team 6" + "*" * 10)
-	# Start the processor with forwarding disabled
-	p1 = Processor(mem_image, forwarding=False, debug=False)
-	p1.run()
-	p1.print_stats()
-	stats_without_forwarding = p1.store_stats()
-
-	# Start the processor with forwarding enabled
-	p2 = Processor(mem_image, forwarding=True)
-	p2.run()
-	p2.print_stats()
+	if args.functional:
+		f = FunctionalProcessor(load_image(image_file), translate=True)
+		f.run()
+		f.print_stats()
+		print("\n************************************\n")
+		return
+
+	# Simulate with forwarding disabled and enabled concurrently
+	configs = [{'forwarding': False, 'debug': False}, {'forwarding': True}]
+	for config in configs:
+		config.update(timing_from_args(args))
+	if args.profile:
+		for config in configs:
+			config['profile'] = True
+	if args.trace:
+		for config, label in zip(configs, ('no_forwarding', 'forwarding')):
+			config['trace'] = {'path': _trace_path(args.trace, label), 'cycles': args.trace_cycles, 'pcs': args.trace_pcs}
+	if args.analytical:
+		results = run_analytical(image_file, configs, budget_from_args(args))
+	elif args.incremental:
+		results = run_incremental(image_file, configs, args.incremental, budget_from_args(args))
+	else:
+		for config in configs:
+			config['budget'] = budget_from_args(args)
+			if not args.no_cache:
+				config['result_cache'] = RESULT_CACHE_DIR
+		results = run_configs(image_file, configs, jobs=args.jobs)
+	(report_without_forwarding, stats_without_forwarding), (report_with_forwarding, stats_with_forwarding) = results
+	print(report_without_forwarding, end="")
+	print(report_with_forwarding, end="")
 	print("\n************************************\n")
-	stats_with_forwarding = p2.store_stats()
 
 	# Extract total cycles from stats
 	cycles_without_forwarding = stats_without_forwarding['cycles']
@@ -52,5 +123,11 @@ def main():
 	print(f"Total IPC lift (%) due to forwarding: {(ipc_with_forwarding - ipc_without_forwarding) * 100:.2f}%")
 	print("\n************************************\n")
 
+	if args.profile:
+		for stats in (stats_without_forwarding, stats_with_forwarding):
+			print("*" * 5 + f" Profile with Forwarding: {stats['forwarding']} " + "*" * 5 + "\n")
+			print_profile(stats['profile'])
+			print()
+
 if __name__ == "__main__":
     main()
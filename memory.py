@@ -1,9 +1,34 @@
+import hashlib
+import mmap
 import os
+import struct
+import sys
+from array import array
+
+# Array typecode holding one unsigned 32-bit word per element.
+WORD_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+
+# Words per page of a PagedMemory (4 KiB pages)
+PAGE_SHIFT = 10
+PAGE_WORDS = 1 << PAGE_SHIFT
+PAGE_MASK = PAGE_WORDS - 1
+ZERO_PAGE = array(WORD_TYPECODE, [0]) * PAGE_WORDS
+
+# Words hashed at a time by image_digest from a mapped image (1 MiB)
+HASH_CHUNK_WORDS = 1 << 18
+
+def code_key(index):
+    '''
+    Returns the address under which decoded-instruction caches keep the word holding
+    byte address index: the word's aligned address within the 32-bit space.
+    '''
+    return index & 0xFFFFFFFC
 
 class Memory(object):
     '''
     A class to simulate memory operations based on a trace file.
     It supports reading and writing both words and bytes to memory locations.
+    Words are held as unsigned 32-bit integers in a compact array, indexed by address // 4.
     '''
     def __init__(self, path):
         '''
@@ -11,62 +36,424 @@ class Memory(object):
         
         :param path: The file path to the trace file.
         '''
-        self.mem_trace = dict()
+        self.words = array(WORD_TYPECODE)
+        # Decoded-instruction cache of the processor using this memory, if any.
+        # Entries are dropped on writes so self-modifying code stays correct.
+        self.code_cache = None
         if os.path.exists(path):
-            index = 0
-            with open(path, 'r+') as trace:
-                lines = trace.readlines()
-                for line in lines:
-                    # Store each line from the trace file into the memory trace dictionary.
-                    # The line's content is stored at 'index', simulating a memory address.
-                    self.mem_trace[index] = line.strip('\n')
-                    index += 4  # Increment index by 4 for the next memory address.
+            with open(path, 'r') as trace:
+                for line in trace:
+                    line = line.strip()
+                    if line:
+                        # Each line of the trace file holds one word in hex; the
+                        # word's position in the file gives its memory address.
+                        self.words.append(int(line, 16))
+    
+    def __len__(self):
+        '''
+        Returns the number of words held in memory.
+        '''
+        return len(self.words)
+    
+    def _grow(self, word_index):
+        '''
+        Zero-extends memory so that word_index is addressable.
+        '''
+        missing = word_index + 1 - len(self.words)
+        if missing > 0:
+            self.words.frombytes(bytes(missing * self.words.itemsize))
     
     def read_word(self, index):
         '''
         Reads and returns a word from a specified memory location.
         
         :param index: The memory address to read from.
-        :return: The word at the specified memory address.
+        :return: The word at the specified memory address as an unsigned 32-bit integer.
         '''
-        return self.mem_trace[index]
+        return self.words[index >> 2]
+    
+    def read_hex(self, index):
+        '''
+        Reads a word and returns it formatted as an 8-digit hex string.
+        
+        :param index: The memory address to read from.
+        :return: The word at the specified memory address in hex.
+        '''
+        return '{0:08X}'.format(self.read_word(index))
     
     def read_byte(self, index):
         '''
         Reads and returns a single byte from a specified memory location.
+        Bytes are numbered big-endian within a word, so offset 0 is the most significant byte.
         
         :param index: The memory address to read from.
-        :return: The byte at the specified memory address.
+        :return: The byte at the specified memory address as an integer.
         '''
-        offset = index % 4
-        word = self.mem_trace[index - offset]
-        # Convert the word from hex to binary, extract the relevant byte, and return it as an integer.
-        byte = int('{0:032b}'.format(int.from_bytes(bytes.fromhex(word), byteorder='big', signed=True))[offset*8:offset*8+8])
-        return byte
+        shift = (3 - (index & 3)) * 8
+        return (self.read_word(index & ~3) >> shift) & 0xFF
     
     def write_byte(self, index, word):
         '''
         Writes a byte to a specified memory location.
         
         :param index: The memory address to write to.
-        :param word: The byte (in hex) to write.
+        :param word: The byte to write, as an integer or a hex string.
         '''
-        offset = index % 4
-        current_word = self.mem_trace[index - offset]
-        current_word_bin = '{0:032b}'.format(int.from_bytes(bytes.fromhex(current_word), byteorder='big', signed=True))
-        new_byte_bin = '{0:08b}'.format(int.from_bytes(bytes.fromhex(word), byteorder='big', signed=True))
-        # Replace the relevant byte in the current word with the new byte.
-        word_write = current_word_bin[:offset*8] + new_byte_bin + current_word_bin[offset*8+8:]
-        self.mem_trace[index - offset] = hex(int(word_write, 2))[2:]
+        if isinstance(word, str):
+            word = int(word, 16)
+        shift = (3 - (index & 3)) * 8
+        address = index & ~3
+        current = self.read_word(address) if (address >> 2) < len(self) else 0
+        self.write_word(address, current & ~(0xFF << shift) | (word & 0xFF) << shift)
     
     def write_word(self, index, word):
         '''
         Writes a word to a specified memory location.
         
         :param index: The memory address to write to.
-        :param word: The word to write.
+        :param word: The word to write, as an integer (signed or unsigned) or a hex string.
+        '''
+        if isinstance(word, str):
+            word = int(word, 16)
+        word_index = index >> 2
+        self._grow(word_index)
+        self.words[word_index] = word & 0xFFFFFFFF
+        if self.code_cache:
+            self.code_cache.pop(code_key(index), None)
+    
+    def fork(self):
+        '''
+        Returns a copy-on-write view of this memory. The fork shares this image
+        read-only, so the image must not be written while forks are in use.
+        
+        :return: A MemoryOverlay backed by this memory.
+        '''
+        return MemoryOverlay(self)
+
+class MappedMemory(Memory):
+    '''
+    A memory image backed by a binary file of raw 32-bit words, opened with mmap.
+    Only the pages that are actually read are brought in by the OS, so opening a
+    large image takes constant time. The mapping is private (copy-on-write), so
+    writes never reach the file on disk.
+    '''
+    def __init__(self, path, byteorder='big'):
+        '''
+        Maps a binary memory image.
+        
+        :param path: The file path to the binary image.
+        :param byteorder: Byte order of the words in the file, 'big' or 'little'.
+        '''
+        self.path = path
+        self.byteorder = byteorder
+        self._word = struct.Struct('>I' if byteorder == 'big' else '<I')
+        self.code_cache = None
+        with open(path, 'rb') as image:
+            size = os.fstat(image.fileno()).st_size
+            # mmap refuses empty files, so an empty image is backed by an empty buffer.
+            self._map = mmap.mmap(image.fileno(), 0, access=mmap.ACCESS_COPY) if size else bytearray()
+        self._num_words = size // 4
+    
+    def __len__(self):
+        '''
+        Returns the number of words in the mapped image.
+        '''
+        return self._num_words
+    
+    def read_word(self, index):
+        '''
+        Reads and returns a word from a specified memory location.
+        
+        :param index: The memory address to read from.
+        :return: The word at the specified memory address as an unsigned 32-bit integer.
+        '''
+        if index >> 2 >= self._num_words:
+            raise IndexError('address {} is outside the memory image'.format(index))
+        return self._word.unpack_from(self._map, index & ~3)[0]
+    
+    def write_word(self, index, word):
+        '''
+        Writes a word into the private mapping. The image cannot grow past its file size.
+        
+        :param index: The memory address to write to.
+        :param word: The word to write, as an integer (signed or unsigned) or a hex string.
         '''
-        self.mem_trace[index] = word
+        if isinstance(word, str):
+            word = int(word, 16)
+        if index >> 2 >= self._num_words:
+            raise IndexError('address {} is outside the memory image'.format(index))
+        self._word.pack_into(self._map, index & ~3, word & 0xFFFFFFFF)
+        if self.code_cache:
+            self.code_cache.pop(code_key(index), None)
+    
+    def close(self):
+        '''
+        Releases the mapping. The memory must not be used afterwards.
+        '''
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+
+class PagedMemory(Memory):
+    '''
+    A sparse memory covering the full 32-bit address space. Words live in fixed-size pages
+    of PAGE_WORDS words, held in arrays and allocated on first write; loading an image
+    allocates only the pages holding a non-zero word. Any other address reads as zero, and
+    addresses wrap modulo 2**32, so memory use follows the touched pages rather than the
+    highest address. Each page written since loading is marked dirty and its loaded contents
+    kept, so changed_words() compares only the dirty pages.
+    '''
+    def __init__(self, path=None):
+        '''
+        Initializes the memory with the contents of a text image, or empty.
+
+        :param path: The file path to a text image with one hex word per line.
+        '''
+        self.pages = dict()
+        self.dirty_pages = set()
+        # Loaded contents of the dirty pages that held part of the image
+        self._loaded = dict()
+        self.code_cache = None
+        self._num_words = 0
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as trace:
+                words = array(WORD_TYPECODE, (int(line, 16) for line in trace if not line.isspace()))
+            self._num_words = len(words)
+            for start in range(0, len(words), PAGE_WORDS):
+                page = words[start:start + PAGE_WORDS]
+                # All-zero pages read the same unallocated
+                if any(page):
+                    page.extend(ZERO_PAGE[len(page):])
+                    self.pages[start >> PAGE_SHIFT] = page
+
+    def __len__(self):
+        '''
+        Returns the number of words up to the last word loaded or written.
+        '''
+        return self._num_words
+
+    def read_word(self, index):
+        '''
+        Reads and returns a word, zero if its page has never been loaded or written.
+
+        :param index: The memory address to read from.
+        :return: The word at the specified memory address as an unsigned 32-bit integer.
+        '''
+        word_index = (index & 0xFFFFFFFF) >> 2
+        page = self.pages.get(word_index >> PAGE_SHIFT)
+        if page is None:
+            return 0
+        return page[word_index & PAGE_MASK]
+
+    def write_word(self, index, word):
+        '''
+        Writes a word, allocating its page on first touch and marking the page dirty.
+
+        :param index: The memory address to write to.
+        :param word: The word to write, as an integer (signed or unsigned) or a hex string.
+        '''
+        if isinstance(word, str):
+            word = int(word, 16)
+        word_index = (index & 0xFFFFFFFF) >> 2
+        number = word_index >> PAGE_SHIFT
+        if number not in self.dirty_pages:
+            page = self.pages.get(number)
+            if page is None:
+                self.pages[number] = array(WORD_TYPECODE, ZERO_PAGE)
+            else:
+                self._loaded[number] = array(WORD_TYPECODE, page)
+            self.dirty_pages.add(number)
+        self.pages[number][word_index & PAGE_MASK] = word & 0xFFFFFFFF
+        if word_index >= self._num_words:
+            self._num_words = word_index + 1
+        if self.code_cache:
+            self.code_cache.pop(code_key(index), None)
+
+    def changed_words(self):
+        '''
+        Yields (address, value) for every word whose value differs from the loaded image,
+        in ascending address order. Only the dirty pages are compared.
+        '''
+        for number in sorted(self.dirty_pages):
+            page = self.pages[number]
+            loaded = self._loaded.get(number, ZERO_PAGE)
+            start = number << PAGE_SHIFT
+            for offset, value in enumerate(page):
+                if value != loaded[offset]:
+                    yield (start + offset) * 4, value
+
+    def resident_pages(self):
+        '''
+        Returns the number of allocated pages.
+        '''
+        return len(self.pages)
+
+class MemoryOverlay(Memory):
+    '''
+    A copy-on-write view over a shared base Memory. Reads fall through to the base
+    image and writes land in a per-overlay map of dirty words, so creating an overlay
+    is O(1) and the changes made through it can be listed without scanning the image.
+    '''
+    def __init__(self, base, dirty=None):
+        '''
+        Initializes an overlay on top of a base memory.
+        
+        :param base: The Memory instance shared read-only by this overlay.
+        :param dirty: Optional map of word index to value to start from.
+        '''
+        self.base = base
+        self.dirty = dict() if dirty is None else dirty
+        self.code_cache = None
+    
+    def __len__(self):
+        '''
+        Returns the number of addressable words, including words written past the base image.
+        '''
+        if not self.dirty:
+            return len(self.base)
+        return max(len(self.base), max(self.dirty) + 1)
+    
+    def read_word(self, index):
+        '''
+        Reads and returns a word, preferring a value written through this overlay.
+        
+        :param index: The memory address to read from.
+        :return: The word at the specified memory address as an unsigned 32-bit integer.
+        '''
+        # Addresses are 32-bit; a negative effective address wraps to the top of memory
+        index &= 0xFFFFFFFF
+        word = self.dirty.get(index >> 2)
+        if word is None:
+            return self.base.read_word(index)
+        return word
+    
+    def write_word(self, index, word):
+        '''
+        Writes a word into the overlay, leaving the base image untouched.
+        
+        :param index: The memory address to write to.
+        :param word: The word to write, as an integer (signed or unsigned) or a hex string.
+        '''
+        if isinstance(word, str):
+            word = int(word, 16)
+        self.dirty[(index & 0xFFFFFFFF) >> 2] = word & 0xFFFFFFFF
+        if self.code_cache:
+            self.code_cache.pop(code_key(index), None)
+    
+    def fork(self):
+        '''
+        Returns a new overlay on the same base with a copy of this overlay's dirty words.
+        '''
+        return MemoryOverlay(self.base, dict(self.dirty))
+    
+    def changed_words(self):
+        '''
+        Yields (address, value) for every dirty word whose value differs from the base image,
+        in ascending address order.
+        '''
+        base_len = len(self.base)
+        for word_index in sorted(self.dirty):
+            value = self.dirty[word_index]
+            if word_index >= base_len or self.base.read_word(word_index * 4) != value:
+                yield word_index * 4, value
+
+def image_words(memory_image):
+    '''
+    Returns the words of a memory image as an array of unsigned 32-bit integers, whichever
+    kind of Memory holds them.
+    '''
+    if type(memory_image) is Memory:
+        return array(WORD_TYPECODE, memory_image.words)
+    if type(memory_image) is PagedMemory:
+        words = array(WORD_TYPECODE, [0]) * len(memory_image)
+        for number, page in memory_image.pages.items():
+            start = number << PAGE_SHIFT
+            words[start:start + PAGE_WORDS] = page[:max(0, len(words) - start)]
+        return words
+    if type(memory_image) is MappedMemory:
+        return _mapped_words(memory_image, 0, len(memory_image))
+    return array(WORD_TYPECODE, (memory_image.read_word(index * 4) for index in range(len(memory_image))))
+
+def _mapped_words(memory_image, start, stop):
+    '''
+    Returns words start to stop of a MappedMemory as an array in host byte order.
+    '''
+    words = array(WORD_TYPECODE)
+    words.frombytes(memory_image._map[start * 4:stop * 4])
+    if memory_image.byteorder != sys.byteorder:
+        words.byteswap()
+    return words
+
+def image_hash(words):
+    '''
+    Returns the SHA-256 hex digest of an array of image words, so that a text image and its
+    binary conversion hash alike.
+    '''
+    return hashlib.sha256(words.tobytes()).hexdigest()
+
+def image_digest(memory_image):
+    '''
+    Returns image_hash(image_words(memory_image)). A MappedMemory is hashed in chunks of
+    HASH_CHUNK_WORDS words straight from its mapping, so the image is never copied whole.
+    '''
+    if type(memory_image) is not MappedMemory:
+        return image_hash(image_words(memory_image))
+    digest = hashlib.sha256()
+    for start in range(0, len(memory_image), HASH_CHUNK_WORDS):
+        digest.update(_mapped_words(memory_image, start, min(len(memory_image), start + HASH_CHUNK_WORDS)))
+    return digest.hexdigest()
+
+def load_image(path, byteorder=None, paged=True):
+    '''
+    Opens a memory image, choosing the loader from the file name. Files ending in
+    '.bin' are mapped as raw binary words (big-endian, or little-endian for
+    '.le.bin'); anything else is read as a text file with one hex word per line.
+    
+    :param path: The file path to the memory image.
+    :param byteorder: Overrides the byte order implied by the file name for binary images.
+    :param paged: Loads a text image into a sparse PagedMemory, which reads as zero outside
+        the image; with False, into a dense Memory.
+    :return: A Memory, PagedMemory or MappedMemory instance.
+    '''
+    if not path.endswith('.bin'):
+        return PagedMemory(path) if paged else Memory(path)
+    if byteorder is None:
+        byteorder = 'little' if path.endswith('.le.bin') else 'big'
+    return MappedMemory(path, byteorder)
+
+def convert_image(text_path, bin_path, byteorder='big'):
+    '''
+    Converts a text memory image (one hex word per line) into a raw binary image.
+    The text file is streamed, so images larger than RAM can be converted.
+    
+    :param text_path: The text image to read.
+    :param bin_path: The binary image to write.
+    :param byteorder: Byte order of the words written, 'big' or 'little'.
+    :return: The number of words written.
+    '''
+    chunk = array(WORD_TYPECODE)
+    swap = byteorder != sys.byteorder
+    count = 0
+    with open(text_path, 'r') as trace, open(bin_path, 'wb') as image:
+        for line in trace:
+            line = line.strip()
+            if not line:
+                continue
+            chunk.append(int(line, 16))
+            if len(chunk) == 65536:
+                count += len(chunk)
+                _write_chunk(image, chunk, swap)
+                chunk = array(WORD_TYPECODE)
+        count += len(chunk)
+        _write_chunk(image, chunk, swap)
+    return count
+
+def _write_chunk(image, chunk, swap):
+    '''
+    Writes an array of words to a binary file, byte-swapping from host order if needed.
+    '''
+    if swap:
+        chunk.byteswap()
+    chunk.tofile(image)
 
 class registers(object):
     '''
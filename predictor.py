@@ -0,0 +1,219 @@
+from instruction import Opcode
+from array import array
+
+# Tag of an empty BTB entry; no fetch address reaches it
+NO_TAG = -1 << 62
+
+# Keys of a predictor specification string and the predictor parameters they set
+SPEC_KEYS = {'entries': 'entries', 'bits': 'bits', 'history': 'history_bits', 'btb': 'btb_entries'}
+
+def _power_of_two(value):
+    return value > 0 and value & (value - 1) == 0
+
+def direct_target(instr):
+    '''
+    Returns the target of a Bz or Beq instruction, whose offset counts instructions from the
+    branch itself.
+    '''
+    return instr.pc + 4 * (instr.x_addr if instr.opcode == Opcode.Bz else instr.imm)
+
+class StaticPredictor(object):
+    '''
+    Branch predictor consulted by the IF stage. predict() gives the address to fetch after a
+    branch, and update() trains the predictor once the branch resolves in EX. This class
+    predicts every conditional branch not taken, or with backward_taken, a branch to an
+    earlier or the same address taken (loops) and any other not taken.
+
+    The target of Bz and Beq is known from the fetched instruction. A Jr is predicted taken
+    only when a branch target buffer of btb_entries entries (a power of two, 0 for none) holds
+    the target it jumped to the last time. The BTB is direct-mapped on the Jr's address; each
+    entry holds that address as its tag and the target.
+
+    Attributes:
+    - config: The keyword arguments make_predictor takes to create an equal predictor.
+    '''
+    kind = 'not-taken'
+
+    def __init__(self, btb_entries=0, backward_taken=False):
+        '''
+        Creates a predictor with an empty BTB.
+        '''
+        if btb_entries and not _power_of_two(btb_entries):
+            raise ValueError(f"BTB entries {btb_entries} is not a power of two")
+        if backward_taken:
+            self.kind = 'btfn'
+        self.config = {'kind': self.kind, 'btb_entries': btb_entries}
+        self.backward_taken = backward_taken
+        self.btb_mask = btb_entries - 1
+        self.btb_tags = array('q', [NO_TAG]) * btb_entries
+        self.btb_targets = array('q', [0]) * btb_entries
+
+    def predict(self,instr):
+        '''
+        Returns the address the IF stage fetches after the branch instr.
+        '''
+        pc = instr.pc
+        if instr.opcode == Opcode.Jr:
+            if self.btb_mask >= 0:
+                index = (pc >> 2) & self.btb_mask
+                if self.btb_tags[index] == pc:
+                    return self.btb_targets[index]
+            return pc + 4
+        target = direct_target(instr)
+        return target if self._taken(instr, target) else pc + 4
+
+    def _taken(self,instr,target):
+        return self.backward_taken and target <= instr.pc
+
+    def update(self,instr,taken,target):
+        '''
+        Trains the predictor with the outcome of the branch instr: whether it was taken, and
+        its target.
+        '''
+        if instr.opcode == Opcode.Jr:
+            if self.btb_mask >= 0:
+                index = (instr.pc >> 2) & self.btb_mask
+                self.btb_tags[index] = instr.pc
+                self.btb_targets[index] = target
+        else:
+            self._train(instr, taken)
+
+    def _train(self,instr,taken):
+        pass
+
+    def state(self):
+        '''
+        Returns the predictor's tables as a JSON-serializable dictionary.
+        '''
+        return {'btb_tags': self.btb_tags.tolist(), 'btb_targets': self.btb_targets.tolist()}
+
+    def load_state(self,state):
+        '''
+        Restores tables returned by state() from a predictor of the same configuration.
+        '''
+        self.btb_tags = array('q', state['btb_tags'])
+        self.btb_targets = array('q', state['btb_targets'])
+
+class BimodalPredictor(StaticPredictor):
+    '''
+    Predicts each conditional branch from a table of `entries` saturating counters of `bits`
+    bits (1 or 2), indexed by the branch address. A counter in its upper half predicts taken;
+    counters start just below it, weakly not taken. The counters are one byte each.
+    '''
+    kind = 'bimodal'
+
+    def __init__(self, entries=1024, bits=2, btb_entries=0):
+        '''
+        Creates a predictor whose counters all predict not taken.
+        '''
+        super().__init__(btb_entries)
+        if not _power_of_two(entries):
+            raise ValueError(f"table entries {entries} is not a power of two")
+        if bits not in (1, 2):
+            raise ValueError(f"counters have 1 or 2 bits, not {bits}")
+        self.config.update(entries=entries, bits=bits)
+        self.mask = entries - 1
+        self.maximum = (1 << bits) - 1
+        self.threshold = 1 << (bits - 1)
+        self.counters = bytearray([self.threshold - 1]) * entries
+
+    def _index(self,instr):
+        return (instr.pc >> 2) & self.mask
+
+    def _taken(self,instr,target):
+        return self.counters[self._index(instr)] >= self.threshold
+
+    def _train(self,instr,taken):
+        index = self._index(instr)
+        counter = self.counters[index]
+        if taken:
+            if counter < self.maximum:
+                self.counters[index] = counter + 1
+        elif counter:
+            self.counters[index] = counter - 1
+
+    def state(self):
+        state = super().state()
+        state['counters'] = list(self.counters)
+        return state
+
+    def load_state(self,state):
+        super().load_state(state)
+        self.counters = bytearray(state['counters'])
+
+class GsharePredictor(BimodalPredictor):
+    '''
+    Predicts each conditional branch from a table of `entries` 2-bit counters indexed by the
+    branch address XORed with the outcomes of the last history_bits conditional branches.
+    The history is updated as branches resolve, so a branch fetched while older ones are
+    still in flight does not see their outcomes. The history a prediction used travels with
+    the instruction, so the update trains the counter that made it.
+    '''
+    kind = 'gshare'
+
+    def __init__(self, entries=4096, history_bits=12, btb_entries=0):
+        '''
+        Creates a predictor with an empty history whose counters all predict not taken.
+        '''
+        super().__init__(entries, 2, btb_entries)
+        del self.config['bits']
+        self.config['history_bits'] = history_bits
+        self.history_mask = (1 << history_bits) - 1
+        self.history = 0
+
+    def _index(self,instr):
+        return ((instr.pc >> 2) ^ instr.predict_history) & self.mask
+
+    def _taken(self,instr,target):
+        instr.predict_history = self.history
+        return self.counters[self._index(instr)] >= self.threshold
+
+    def _train(self,instr,taken):
+        if instr.predict_history is None:
+            # Fetched without a prediction, e.g. forwarded from a store
+            instr.predict_history = self.history
+        super()._train(instr, taken)
+        self.history = ((self.history << 1) | taken) & self.history_mask
+
+    def state(self):
+        state = super().state()
+        state['history'] = self.history
+        return state
+
+    def load_state(self,state):
+        super().load_state(state)
+        self.history = state['history']
+
+PREDICTORS = {'not-taken': StaticPredictor, 'bimodal': BimodalPredictor, 'gshare': GsharePredictor}
+
+def make_predictor(config):
+    '''
+    Creates a predictor from a configuration dictionary with its 'kind' ('not-taken', 'btfn',
+    'bimodal' or 'gshare') and further keyword arguments for its class.
+    '''
+    config = dict(config)
+    kind = config.pop('kind', 'not-taken')
+    if kind == 'btfn':
+        return StaticPredictor(backward_taken=True, **config)
+    if kind not in PREDICTORS:
+        raise ValueError(f"unknown branch predictor '{kind}', expected one of not-taken, btfn, bimodal, gshare")
+    return PREDICTORS[kind](**config)
+
+def parse_spec(text):
+    '''
+    Parses a predictor specification such as 'gshare,entries=4096,history=12,btb=64' into a
+    configuration for make_predictor: the kind, then optional entries=N, bits=1|2 (bimodal),
+    history=N (gshare) and btb=N. Raises ValueError for an unknown kind or key.
+    '''
+    kind, *items = text.split(',')
+    config = {'kind': kind}
+    for item in items:
+        name, _, value = item.partition('=')
+        if name not in SPEC_KEYS:
+            raise ValueError(f"unknown predictor parameter '{name}', expected one of {', '.join(SPEC_KEYS)}")
+        config[SPEC_KEYS[name]] = int(value, 0)
+    try:
+        make_predictor(config)
+    except TypeError:
+        raise ValueError(f"'{text}' gives parameters the {kind} predictor does not take")
+    return config
@@ -1,6 +1,35 @@
-import copy
 import memory
-from instruction import Instruction
+import time
+from cache import Cache
+from predictor import make_predictor
+from scoreboard import Scoreboard
+from watchdog import StuckDetector
+from tracesink import HAZARD, FORWARD_RS, FORWARD_RT, FLUSH
+from profiler import StageProfiler
+from instruction import Instruction, BUBBLE, Opcode, ARITH, LOGIC, MEM, CTRL, R_TYPE, BRANCH, WRITES_RD, WRITES_RT, READS_RT
+
+# Number of reusable instruction records cycled through by the fetch stage
+LATCH_COUNT = 8
+# Register names as used in reg_change, indexed by register number
+REG_NAMES = tuple('R' + str(index) for index in range(32))
+# Processor attributes that, with the registers, memory and stalls, make up the result of a run
+COUNTERS = ('pc', 'cycles', 'ari_count', 'logic_count', 'ctrl_count', 'ld_count', 'stall_cycle',
+            'num_instructions', 'branch_penalties', 'branches_taken', 'total_branches', 'mispredictions',
+            'hazards', 'Halt', 'decode_hits', 'decode_misses', 'stop_reason')
+# Cycles between checks of the host-time budget
+WATCHDOG_CYCLES = 4096
+
+def _limit(max_cycles):
+    '''
+    Returns a cycle limit for comparison with >=, which data cache stalls may overshoot.
+    '''
+    return float('inf') if max_cycles is None else max_cycles
+
+def _earliest(limit, cycle):
+    '''
+    Returns the earlier of a cycle limit, which may be None for no limit, and cycle.
+    '''
+    return cycle if limit is None else min(limit, cycle)
 
 class Processor(object):
     '''
@@ -12,24 +41,59 @@ class Processor(object):
     - memory_image: An instance of the Memory class containing the instruction trace.
     - forwarding: Enables full-forwarding if set to True. Defaults to False.
     - debug: Enables verbose logging of pipeline stages if set to True. Defaults to False.
+    - trace_sink: A tracesink.TraceSink that receives a record of every cycle. Defaults to None.
+    - profile: Instruments the stage methods with a profiler.StageProfiler if set to True; its
+      results are included in store_stats() under 'profile'. Defaults to False.
+    - result_cache: A resultcache.ResultCache. A complete run from the start without tracing,
+      profiling or debug output takes its result from the cache if present, and stores it
+      otherwise. Defaults to None.
+    - icache, dcache: Keyword arguments for a cache.Cache that times the instruction fetches
+      of the IF stage, or the loads and stores of the MEM stage. Without one, every access
+      takes a single cycle. Defaults to None.
+
+    - predictor: Configuration of a predictor.make_predictor branch predictor, which IF
+      consults after fetching a branch. Without one, IF always fetches the next address and
+      every taken branch flushes. Defaults to None.
+
+    An instruction cache access slower than a cycle makes IF deliver bubbles until it
+    completes, while the later stages go on. A data cache access slower than a cycle stalls
+    the whole pipeline: the cycle of the MEM stage lasts as long as the access.
+    Branches resolve in EX. One the fetch stage did not follow correctly flushes the
+    instruction fetched behind it, which costs 2 cycles.
     '''
-    def __init__(self,memory_image,forwarding=False,debug=False):
+    def __init__(self,memory_image,forwarding=False,debug=False,trace_sink=None,profile=False,result_cache=None,
+                 icache=None,dcache=None,predictor=None):
         '''
         Instantiate a new processor.
         '''
-        self.mem_image = copy.deepcopy(memory_image)
+        self.mem_image = memory_image.fork()
         self.original_mem = memory_image
         self.forwarding = forwarding
         self.debug=debug
+        self.trace_sink = trace_sink
         self.frwrd_dict = dict()
+        self.scoreboard = Scoreboard()
         self.regs = memory.registers()
-        self.data_list = [0,Instruction(None),Instruction(None),Instruction(None),Instruction(None)]
+        # Decoded instruction templates keyed by PC, invalidated by memory writes
+        self.decode_cache = dict()
+        self.mem_image.code_cache = self.decode_cache
+        self.decode_hits = 0
+        self.decode_misses = 0
+        self.data_list = [0,BUBBLE,BUBBLE,BUBBLE,BUBBLE]
+        # Reusable instruction records for the IF stage. An instruction leaves the
+        # pipeline within four fetches, so a ring of LATCH_COUNT records is never
+        # overwritten while still in flight.
+        self.latches = [Instruction(None) for _ in range(LATCH_COUNT)]
+        self.latch_index = 0
         self.pc = 0
-        self.arith_opcode = ['Add','Addi','Sub','Subi','Mul','Muli']
-        self.logic_opcode = ['Or','Ori','And','Andi','Xor','Xori']
-        self.ld_opcode = ['Ldw','Stw']
-        self.ctrl_opcode = ['Bz','Beq','Jr','Halt']
-        self.r_type = ['Add','Sub','Mul','Or','And','Xor']
+        # Execute stage handlers, indexed by opcode
+        self.execute_table = [
+            self._ex_add, self._ex_addi, self._ex_sub, self._ex_subi,
+            self._ex_mul, self._ex_muli, self._ex_or, self._ex_ori,
+            self._ex_and, self._ex_andi, self._ex_xor, self._ex_xori,
+            self._ex_mem, self._ex_mem, self._ex_bz, self._ex_beq,
+            self._ex_jr, None
+        ]
         self.reg_change={}
         self.ari_count = 0
         self.logic_count = 0
@@ -40,17 +104,116 @@ class Processor(object):
         self.branch_penalties = 0
         self.branches_taken = 0
         self.total_branches = 0
+        self.mispredictions = 0
         self.hazards = 0
         self.st_count = []
         self.Halt = False
         self.cycles=0
+        self.profiler = StageProfiler(self) if profile else None
+        self.result_cache = result_cache
+        self.stuck_detector = None
+        self.icache = None if icache is None else Cache(**icache)
+        self.dcache = None if dcache is None else Cache(**dcache)
+        # Line of the instruction fetch waiting for the instruction cache, and the cycle it completes
+        self.fetch_line = None
+        self.fetch_ready = 0
+        self.predictor = None if predictor is None else make_predictor(predictor)
+        # Why the last run() returned: 'halt', 'max_cycles', 'max_instructions', 'max_seconds' or 'stuck'
+        self.stop_reason = None
         
-    def run(self,):
+    def run(self,max_cycles=None,max_instructions=None,max_seconds=None,detect_stuck=False):
         ''' 
-        Runs the complete trace of instructions
+        Runs the complete trace of instructions, continuing from the current cycle (e.g. after
+        checkpoint.restore). The run stops early once the cycle count reaches max_cycles, once
+        max_instructions instructions have executed, or after about max_seconds of host time.
+        With detect_stuck, it also stops when the processor's state recurs, which proves it
+        would never reach Halt (see watchdog.StuckDetector).
+        Returns True if the run reached Halt, False if it stopped early; stop_reason says why.
+        '''
+        budgets = max_cycles is not None or max_instructions is not None or max_seconds is not None
+        if (self.result_cache is not None and not budgets and self.cycles == 0
+                and self.trace_sink is None and self.profiler is None and not self.debug):
+            return self._run_cached(detect_stuck)
+        if max_instructions is not None or max_seconds is not None or detect_stuck:
+            return self._run_guarded(max_cycles,max_instructions,max_seconds,detect_stuck)
+        halted = self._run_cycles(max_cycles)
+        self.stop_reason = 'halt' if halted else 'max_cycles'
+        return halted
+
+    def _run_guarded(self,max_cycles,max_instructions,max_seconds,detect_stuck):
+        '''
+        Runs with budgets or stuck detection. The cycles between two checks of the budgets run
+        as one slice, so the budgets cost nothing per cycle.
         '''
-        self.cycles = 0
-        while self.data_list[4].opcode!='Halt':
+        deadline = None if max_seconds is None else time.monotonic() + max_seconds
+        if detect_stuck and self.stuck_detector is None:
+            self.stuck_detector = StuckDetector(self)
+        while True:
+            if max_cycles is not None and self.cycles >= max_cycles:
+                self.stop_reason = 'max_cycles'
+                return False
+            if max_instructions is not None and self.num_instructions >= max_instructions:
+                self.stop_reason = 'max_instructions'
+                return False
+            if deadline is not None and time.monotonic() >= deadline:
+                self.stop_reason = 'max_seconds'
+                return False
+            limit = max_cycles
+            if deadline is not None:
+                limit = _earliest(limit, self.cycles + WATCHDOG_CYCLES)
+            if max_instructions is not None:
+                # Every instruction takes at least a cycle, so the slice cannot overshoot
+                limit = _earliest(limit, self.cycles + max_instructions - self.num_instructions)
+            halted = self._run_watched(limit) if detect_stuck else self._run_cycles(limit)
+            if halted:
+                self.stop_reason = 'halt'
+                return True
+            if detect_stuck and self.stop_reason == 'stuck':
+                return False
+
+    def _run_watched(self,max_cycles):
+        '''
+        Runs like _run_cycles, checking the stuck detector after every cycle in which a branch
+        was taken. Sets stop_reason to 'stuck' and returns False if the state recurred.
+        '''
+        max_cycles = _limit(max_cycles)
+        detector = self.stuck_detector
+        data_list = self.data_list
+        branches = self.branches_taken
+        self.stop_reason = None
+        while data_list[4].opcode!=Opcode.Halt:
+            if self.cycles >= max_cycles:
+                return False
+            if self.trace_sink is not None:
+                # The traced cycle counts the final Halt cycle itself
+                if self._run_traced(self.cycles + 1):
+                    return True
+            else:
+                self.Write_back()
+                self.Memory_op()
+                self.Execute()
+                self.Instruction_decode()
+                self.Fetch()
+                data_list[0]=self.pc
+                self.cycles += 1
+            if self.branches_taken != branches:
+                branches = self.branches_taken
+                if detector.check():
+                    self.stop_reason = 'stuck'
+                    return False
+        self.cycles += 1
+        return True
+
+    def _run_cycles(self,max_cycles):
+        '''
+        Runs until Halt or until the cycle count reaches max_cycles. Returns True on Halt.
+        '''
+        max_cycles = _limit(max_cycles)
+        if self.trace_sink is not None:
+            return self._run_traced(max_cycles)
+        while self.data_list[4].opcode!=Opcode.Halt:
+            if self.cycles >= max_cycles:
+                return False
             self.Write_back()
             self.Memory_op()
             self.Execute()
@@ -59,7 +222,110 @@ class Processor(object):
             self.data_list[0]=self.pc 
             self.cycles += 1
         self.cycles += 1
-        return
+        return True
+
+    def _run_cached(self,detect_stuck):
+        '''
+        Loads the result of the complete run from the result cache, or simulates the run
+        and stores its result there if it reaches Halt.
+        '''
+        cache = self.result_cache
+        key = cache.key(self.original_mem, self.forwarding, self._timing_config())
+        entry = cache.get(key)
+        if entry is not None:
+            self._load_result(entry['state'])
+            return True
+        self.result_cache = None
+        try:
+            halted = self.run(detect_stuck=detect_stuck)
+        finally:
+            self.result_cache = cache
+        if halted:
+            cache.put(key, {'stats': self.store_stats(), 'state': self._result_state()})
+        return halted
+
+    def _timing_models(self):
+        '''
+        Returns the caches and the branch predictor the processor has, by attribute name.
+        '''
+        models = (('icache', self.icache), ('dcache', self.dcache), ('predictor', self.predictor))
+        return {name: model for name, model in models if model is not None}
+
+    def _timing_config(self):
+        '''
+        Returns the configurations of the caches and the branch predictor, or None if the
+        processor has none of them.
+        '''
+        return {name: model.config for name, model in self._timing_models().items()} or None
+
+    def _result_state(self):
+        '''
+        Returns the final state of a complete run as a JSON-serializable dictionary.
+        '''
+        dirty = sorted(self.mem_image.dirty.items())
+        return {
+            'counters': {name: getattr(self, name) for name in COUNTERS},
+            'registers': [self.regs.regs[index] for index in range(32)],
+            'reg_change': self.reg_change,
+            'memory_words': [index for index, _ in dirty],
+            'memory_values': [value for _, value in dirty],
+            'stalls': self.st_count,
+            'models': {name: model.state() for name, model in self._timing_models().items()},
+        }
+
+    def _load_result(self,state):
+        '''
+        Puts the processor in the final state of a complete run, as returned by _result_state.
+        '''
+        for name, value in state['counters'].items():
+            setattr(self, name, value)
+        for index, value in enumerate(state['registers']):
+            self.regs.regs[index] = value
+        self.reg_change = state['reg_change']
+        self.mem_image.dirty.update(zip(state['memory_words'], state['memory_values']))
+        self.st_count = state['stalls']
+        for name, model_state in state['models'].items():
+            getattr(self, name).load_state(model_state)
+        # Leave the Halt in WB, as a simulated run does, so that run() returns at once
+        halt = Instruction(Opcode.Halt << 26)
+        halt.decode()
+        self.data_list = [self.pc, BUBBLE, BUBBLE, BUBBLE, halt]
+
+    def _run_traced(self,max_cycles):
+        '''
+        Runs the complete trace like run, recording the stage occupancy, stalls, hazards,
+        forwards and flushes of every cycle to the trace sink.
+        '''
+        max_cycles = _limit(max_cycles)
+        sink = self.trace_sink
+        data_list = self.data_list
+        while data_list[4].opcode!=Opcode.Halt:
+            if self.cycles >= max_cycles:
+                return False
+            wb, mem, ex = data_list[4], data_list[3], data_list[2]
+            hazards = self.hazards
+            mispredictions = self.mispredictions
+            self.Write_back()
+            self.Memory_op()
+            self.Execute()
+            decoding = data_list[1]
+            self.Instruction_decode()
+            self.Fetch()
+            fetched = data_list[1] if data_list[1] is not decoding else None
+            flags = 0
+            if self.hazards != hazards:
+                flags |= HAZARD
+            if data_list[2].frwd_rs:
+                flags |= FORWARD_RS
+            if data_list[2].frwd_rt:
+                flags |= FORWARD_RT
+            if self.mispredictions != mispredictions:
+                flags |= FLUSH
+            sink.record(self.cycles, self.pc, (fetched, decoding, ex, mem, wb), self.stall_cycle, flags)
+            data_list[0]=self.pc
+            self.cycles += 1
+        self.cycles += 1
+        return True
 
     def print_stats(self):
         '''
@@ -67,6 +333,8 @@ class Processor(object):
         and information on stalls and hazards.
         '''
         print("\nSimulating the MIPS-lite processor with Forwarding: " + str(self.forwarding) + "\n")
+        if self.stop_reason not in (None, 'halt'):
+            print(f"Stopped before Halt ({self.stop_reason}); the statistics are partial\n")
         print("*" * 5 + " PC, Memory and Register state " + "*" * 5 + "\n")
         print("Program counter state: ", self.pc)
         self.print_mem()
@@ -89,6 +357,20 @@ class Processor(object):
         print("Total branch penalties: ", self.branch_penalties)
         if self.branches_taken > 0:
             print("Average branch penalty: ", (self.branch_penalties / self.branches_taken), " cycles")
+        if self.predictor is not None:
+            print("Branch predictor: ", self.predictor.kind)
+            print("Branch mispredictions: ", self.mispredictions)
+            print("Prediction accuracy: ", 1 - self.mispredictions / self.total_branches if self.total_branches > 0 else 0)
+            print("Mispredictions per 1000 instructions: ", 1000 * self.mispredictions / self.num_instructions if self.num_instructions > 0 else 0)
+        if self.icache is not None or self.dcache is not None:
+            print("\n" + "*" * 5 + " Cache Information " + "*" * 5 + "\n")
+            for label, cache in (("Instruction", self.icache), ("Data", self.dcache)):
+                if cache is not None:
+                    accesses = cache.hits + cache.misses
+                    print(f"{label} cache hits: ", cache.hits)
+                    print(f"{label} cache misses: ", cache.misses)
+                    print(f"{label} cache hit rate: ", cache.hits / accesses if accesses > 0 else 0)
+                    print(f"{label} cache stall cycles: ", cache.stall_cycles)
         print("\n" + "*" * 5 + " Performance of MIPS-lite " + "*" * 5 + "\n")
         # Calculate and print CPI (Cycles Per Instruction) and IPC (Instructions Per Cycle)
         self.cpi = self.cycles / self.num_instructions if self.num_instructions > 0 else 0
@@ -115,11 +397,24 @@ class Processor(object):
             "branches_taken": self.branches_taken,
             "branch_penalties": self.branch_penalties,
             "average_branch_penalty": self.branch_penalties / self.total_branches if self.total_branches > 0 else 0,
-            "cpi": self.cpi,
-            "ipc": self.ipc
+            "branch_mispredictions": self.mispredictions,
+            "prediction_accuracy": 1 - self.mispredictions / self.total_branches if self.total_branches > 0 else 0,
+            "mpki": 1000 * self.mispredictions / self.num_instructions if self.num_instructions > 0 else 0,
+            "cpi": self.cycles / self.num_instructions if self.num_instructions > 0 else 0,
+            "ipc": self.num_instructions / self.cycles if self.cycles > 0 else 0,
+            "decode_cache_hits": self.decode_hits,
+            "decode_cache_misses": self.decode_misses,
+            "stop_reason": self.stop_reason
         }
         if not self.forwarding:
             stats["average_stalls"] = sum(self.st_count) / self.hazards if self.hazards > 0 else 0
+        for name, cache in (("icache", self.icache), ("dcache", self.dcache)):
+            if cache is not None:
+                stats.update(cache.stats(name))
+        if self.predictor is not None:
+            stats["predictor"] = self.predictor.kind
+        if self.profiler is not None:
+            stats["profile"] = self.profiler.stats()
         
         return stats
 
@@ -127,11 +422,9 @@ class Processor(object):
         '''
         Prints the state of memory locations that have changed during execution, each on a new line.
         '''
-        keys = [k for k in self.original_mem.mem_trace if self.mem_image.mem_trace[k] != self.original_mem.mem_trace[k]]
-        changed_memory = {k: self.mem_image.mem_trace[k] for k in keys}
         print("\nChanged memory state:")
-        for address, value in changed_memory.items():
-            print(f"Address {address}: {value}")
+        for address, value in self.mem_image.changed_words():
+            print(f"Address {address}: {self._getSignedNum(value, 32)}")
     
     def print_reg(self):
         '''
@@ -144,111 +437,34 @@ class Processor(object):
     def _check_target(self,instr):
         '''
         Checks stalls in the Instruction Decode stage.
+        Resolves each source operand against the register scoreboard: with forwarding, a value
+        produced one or two instructions ahead is forwarded, except a load one instruction ahead,
+        which stalls for a cycle. Without forwarding, any pending producer stalls until it has
+        written back.
         Input: instr: object of class Instruction
         '''
-        if instr.opcode=='Halt':
+        if instr.opcode==Opcode.Halt:
+            return
+        cycle = self.cycles
+        rs_producer, rs_distance = self.scoreboard.lookup(instr.reg_rs,cycle)
+        if instr.flags & READS_RT:
+            rt_producer, rt_distance = self.scoreboard.lookup(instr.reg_rt,cycle)
+        else:
+            rt_producer, rt_distance = None, 0
+        if not self.forwarding:
+            distance = min(d for d in (rs_distance, rt_distance, 3) if d)
+            if distance < 3:
+                self.stall_cycle = 3 - distance
+            return
+        if (rs_distance==1 and Scoreboard.is_load(rs_producer)) or (rt_distance==1 and Scoreboard.is_load(rt_producer)):
+            self.stall_cycle = 1
             return
-        if self.forwarding and ((instr.type=='R') or (instr.opcode in ['Beq','Stw'])):
-            for obj in self.data_list[3:]:
-                if obj.type=='I' and obj.opcode!='Ldw':
-                    if obj.reg_rt==instr.reg_rs:
-                        instr.rs = obj.rt
-                        instr.frwd_rs = True
-                    elif obj.reg_rt==instr.reg_rt:
-                        instr.rt = obj.rt
-                        instr.frwd_rt = True
-                    elif obj.reg_rt==instr.reg_rs==instr.reg_rt:
-                        instr.rs = obj.rt
-                        instr.frwd_rs = True
-                        instr.rt = obj.rt
-                        instr.frwd_rt = True
-                elif obj.type=='R':
-                    if obj.reg_rd==instr.reg_rs:
-                        instr.rs = obj.rd
-                        instr.frwd_rs = True
-                    elif obj.reg_rd==instr.reg_rt:
-                        instr.rt = obj.rd
-                        instr.frwd_rt = True
-                    elif obj.reg_rd==instr.reg_rs==instr.reg_rt:
-                        instr.rs = obj.rd
-                        instr.frwd_rs = True
-                        instr.rt = obj.rd
-                        instr.frwd_rt = True
-                elif obj.opcode=='Ldw':
-                    if obj.reg_rt==instr.reg_rs:
-                        if self.data_list[3:].index(obj)==1:
-                            instr.rs = obj.rt
-                            instr.frwd_rs = True
-                        else:
-                            self.stall_cycle = len(self.data_list[3:]) - self.data_list[3:].index(obj)-1
-                            return
-                    elif obj.reg_rt==instr.reg_rt:
-                        if self.data_list[3:].index(obj)==1:
-                            instr.rt = obj.rt
-                            instr.frwd_rt = True
-                        else:
-                            self.stall_cycle = len(self.data_list[3:]) - self.data_list[3:].index(obj)-1
-                            return
-                    elif obj.reg_rt==instr.reg_rs==instr.reg_rt:
-                        if self.data_list[3:].index(obj)==1:
-                            instr.rs = obj.rt
-                            instr.frwd_rs = True
-                            instr.rt = obj.rt
-                            instr.frwd_rt = True
-                        else:
-                            self.stall_cycle = len(self.data_list[3:]) - self.data_list[3:].index(obj)-1
-                            return
-                    
-        elif self.forwarding and instr.type=='I':
-            for obj in self.data_list[3:]:
-                if obj.type=='I'and obj.opcode!='Ldw':
-                    if obj.reg_rt==instr.reg_rs:
-                        instr.rs = obj.rt
-                        instr.frwd_rs =True
-                        break
-                elif obj.type=='R':
-                    if obj.reg_rd==instr.reg_rs:
-                        instr.rs = obj.rd
-                        instr.frwd_rs =True
-                        break
-                elif obj.opcode=='Ldw':
-                    if obj.reg_rt==instr.reg_rs:
-                        if self.data_list[3:].index(obj)==1:
-                            instr.rs = obj.rt
-                            instr.frwd_rs = True
-                        else:
-                            self.stall_cycle = len(self.data_list[3:]) - self.data_list[3:].index(obj)-1
-                            return
-        elif (instr.type=='R') or (instr.opcode in ['Beq','Stw']):
-            for obj in self.data_list[3:]:
-                if obj.type=='I':
-                    if obj.reg_rt in [instr.reg_rs,instr.reg_rt]:
-                        self.stall_cycle = len(self.data_list[3:]) - self.data_list[3:].index(obj) 
-                        return
-                elif obj.type=='R':
-                    if obj.reg_rd in [instr.reg_rs,instr.reg_rt]:
-                        self.stall_cycle = len(self.data_list[3:]) - self.data_list[3:].index(obj)
-                        return
-        elif instr.type=='I':
-            for obj in self.data_list[3:]:
-                if obj.type=='I':
-                    if obj.reg_rt==instr.reg_rs:
-                        if self.forwarding:
-                            instr.rs = obj.rt
-                            instr.frwd_rs =True
-                            break
-                        else:
-                            self.stall_cycle = len(self.data_list[3:]) - self.data_list[3:].index(obj) 
-                        return
-                elif obj.type=='R':
-                    if obj.reg_rd==instr.reg_rs:
-                        if self.forwarding:
-                            instr.rs = obj.rd
-                            instr.frwd_rs =True
-                            break
-                        else:
-                            self.stall_cycle = len(self.data_list[3:]) - self.data_list[3:].index(obj)
-                        return
+        if rs_producer is not None:
+            instr.rs = Scoreboard.value(rs_producer)
+            instr.frwd_rs = True
+        if rt_producer is not None:
+            instr.rt = Scoreboard.value(rt_producer)
+            instr.frwd_rt = True
         return
 
     def _getSignedNum(self,num, bitLength):
@@ -257,6 +473,11 @@ class Processor(object):
         Inputs: num: number
         bitlength: number of bits for signed number
         '''
+        if bitLength == 32:
+            # Constant masks, so the common case builds no temporary integers
+            if num & 0x80000000:
+                return (num & 0xFFFFFFFF) - 0x100000000
+            return num & 0xFFFFFFFF
         mask = (2 ** bitLength) - 1
         if num & (1 << (bitLength - 1)):
             return num | ~mask
@@ -272,7 +493,7 @@ class Processor(object):
         if self.Halt:
             return
         if self.data_list[0]==None:
-            self.data_list[1] = Instruction(None)
+            self.data_list[1] = BUBBLE
             return
         if self.stall_cycle>0:
             self.stall_cycle = self.stall_cycle - 1
@@ -280,9 +501,12 @@ class Processor(object):
                 print('stall cycles in IF: ',self.stall_cycle)
             return
         for inst in self.data_list[1:]:
-            if (self.data_list[0] == inst.x_addr) and inst.opcode=='Stw':
+            if (self.data_list[0] == inst.x_addr) and inst.opcode==Opcode.Stw:
                 if self.forwarding:
-                    self.data_list[1] = Instruction(hex(inst.rt)[2:])
+                    latch = self._next_latch()
+                    latch.reset(inst.rt & 0xFFFFFFFF)
+                    latch.pc = self.data_list[0]
+                    self.data_list[1] = latch
                     self.pc +=4
                     return
                 else:
@@ -293,10 +517,69 @@ class Processor(object):
             if self.debug:
                 print('stall cycles in IF: ',self.stall_cycle)
             return
-        instr = self.mem_image.read_word(self.data_list[0])
-        self.data_list[1] = Instruction(instr)
-        self.pc += 4
+        if self.icache is not None and not self._icache_fetch(self.data_list[0]):
+            if self.debug:
+                print('waiting for the instruction cache until cycle ',self.fetch_ready)
+            self.data_list[1] = BUBBLE
+            return
+        template = self.decode_cache.get(self.data_list[0])
+        if template is None:
+            self.decode_misses += 1
+            template = Instruction(self.mem_image.read_word(self.data_list[0]))
+            template.decode()
+            template.pc = self.data_list[0]
+            # A store can only invalidate the word's aligned address, so other PCs stay uncached
+            if memory.code_key(template.pc) == template.pc:
+                self.decode_cache[template.pc] = template
+        else:
+            self.decode_hits += 1
+        latch = self._next_latch()
+        latch.copy_from(template)
+        self.data_list[1] = latch
+        if self.predictor is not None and latch.flags & BRANCH:
+            self.pc = latch.predicted = self.predictor.predict(latch)
+        else:
+            self.pc += 4
         return
+
+    def _icache_fetch(self,pc):
+        '''
+        Times the fetch from pc through the instruction cache. Returns True if the
+        instruction is available in this cycle. A fetch that misses waits until the
+        line is filled; a branch that redirects the PC meanwhile abandons the wait.
+        '''
+        line = self.icache.line(pc)
+        if line == self.fetch_line:
+            if self.cycles < self.fetch_ready:
+                return False
+            self.fetch_line = None
+            return True
+        self.fetch_line = None
+        penalty = self.icache.access(pc)
+        if penalty == 0:
+            return True
+        self.fetch_line = line
+        self.fetch_ready = self.cycles + penalty
+        return False
+
+    def _dcache_stall(self,addr):
+        '''
+        Times a load or store to addr through the data cache. The whole pipeline waits for
+        a slow access, so the cycle count advances by its extra cycles, and so do the
+        scoreboard's issue cycles, which keeps every in-flight instruction at its distance.
+        '''
+        penalty = self.dcache.access(addr)
+        if penalty:
+            self.cycles += penalty
+            self.scoreboard.issue_cycle = [cycle + penalty for cycle in self.scoreboard.issue_cycle]
+
+    def _next_latch(self):
+        '''
+        Returns the next reusable instruction record for the IF stage.
+        '''
+        latch = self.latches[self.latch_index]
+        self.latch_index = (self.latch_index + 1) % LATCH_COUNT
+        return latch
         
     def Instruction_decode(self,):
         '''
@@ -310,12 +593,12 @@ class Processor(object):
             self.data_list[2] = instr
             return
         if self.Halt:
-            self.data_list[2] = Instruction(None)
+            self.data_list[2] = BUBBLE
             return
         if self.stall_cycle>0:
             if self.debug:
                 print('stall cycles in ID: ',self.stall_cycle)
-            self.data_list[2] = Instruction(None)
+            self.data_list[2] = BUBBLE
             return
         self._check_target(instr)
         if self.stall_cycle>0:
@@ -323,31 +606,29 @@ class Processor(object):
                 print('stall cycles in ID: ',self.stall_cycle)
             self.hazards += 1
             self.st_count.append(self.stall_cycle)
-            self.data_list[2] = Instruction(None)
+            self.data_list[2] = BUBBLE
             return
-        if instr.opcode in self.arith_opcode:
+        flags = instr.flags
+        if flags & ARITH:
             self.ari_count += 1
-        elif instr.opcode in self.logic_opcode:
+        elif flags & LOGIC:
             self.logic_count += 1
-        elif instr.opcode in self.ctrl_opcode:
+        elif flags & CTRL:
             self.ctrl_count += 1
-        elif instr.opcode in self.ld_opcode:
+        elif flags & MEM:
             self.ld_count += 1
-        if instr.opcode=='Halt':
+        if instr.opcode==Opcode.Halt:
             self.Halt = True
             self.data_list[2] = instr
             return
         if instr.frwd_rs==False:
-            instr.rs = self.regs.read_reg(instr.reg_rs) if instr.opcode in self.logic_opcode else self._getSignedNum(self.regs.read_reg(instr.reg_rs),32)        
-        if instr.opcode in ['Jr','Bz']:
-            self.data_list[2] = instr
-            return
-        if instr.frwd_rt==False:
-            if instr.opcode in self.r_type:
+            instr.rs = self.regs.read_reg(instr.reg_rs) if flags & LOGIC else self._getSignedNum(self.regs.read_reg(instr.reg_rs),32)
+        if instr.frwd_rt==False and flags & READS_RT:
+            # R-type operands are signed; Stw and Beq use rt as stored
+            if flags & R_TYPE:
                 instr.rt = self._getSignedNum(self.regs.read_reg(instr.reg_rt), 32)
             else:
-                if instr.opcode in ['Stw','Beq']:
-                    instr.rt = self.regs.read_reg(instr.reg_rt)
+                instr.rt = self.regs.read_reg(instr.reg_rt)
         self.data_list[2] = instr
         return
 
@@ -364,63 +645,92 @@ class Processor(object):
             return
         else:
             self.num_instructions += 1            
-        if instr.opcode=='Halt':
+        if instr.opcode==Opcode.Halt:
             self.data_list[3] = instr
             return
         if self.Halt:
             return
-        if instr.opcode in ['Jr', 'Bz', 'Beq']:
-            self.total_branches += 1
-            branch_taken = False
-            if instr.opcode == 'Jr':
-                self.pc = instr.rs
-                branch_taken = True
-            elif instr.opcode == 'Bz' and instr.rs == 0:
-                self.pc = self.pc - 8 + 4 * instr.x_addr
-                branch_taken = True
-            elif instr.opcode == 'Beq' and instr.rs == instr.rt:
-                self.pc = self.pc - 8 + 4 * instr.imm
-                branch_taken = True
-
-            if branch_taken:
-                self.branches_taken += 1
-                self.branch_penalties += 2  # Assuming a fixed penalty of 2 cycles for taken branches
-
-            # Clear the pipeline if a branch is taken
-            if branch_taken:
-                self.data_list[1] = Instruction(None)
-                self.data_list[0] = None
-        if instr.opcode=='Add':
-            instr.rd = self._getSignedNum(instr.rs + instr.rt,32)
-        elif instr.opcode=='Addi':
-            instr.rt = self._getSignedNum(instr.rs + instr.imm,32)
-        elif instr.opcode=='Sub':
-            instr.rd = self._getSignedNum(instr.rs - instr.rt,32)
-        elif instr.opcode=='Subi':
-            instr.rt = self._getSignedNum(instr.rs - instr.imm,32)
-        elif instr.opcode=='Mul':
-            instr.rd = self._getSignedNum(instr.rs * instr.rt,32)
-        elif instr.opcode=='Muli':
-            instr.rt = self._getSignedNum(instr.rs * instr.imm,32)
-        elif instr.opcode=='Or':
-            instr.rd = instr.rs | instr.rt
-        elif instr.opcode=='Ori':
-            instr.rt = instr.rs | instr.imm
-        elif instr.opcode=='And':
-            instr.rd = instr.rs & instr.rt
-        elif instr.opcode=='Andi':
-            instr.rt = instr.rs & instr.imm
-        elif instr.opcode=='Xor':
-            instr.rd = instr.rs ^ instr.rt
-        elif instr.opcode=='Xori':
-            instr.rt = instr.rs ^ instr.imm
-        elif instr.opcode=='Ldw':
-            instr.x_addr = self._getSignedNum(instr.rs + instr.imm,32)
-        elif instr.opcode=='Stw':
-            instr.x_addr = self._getSignedNum(instr.rs + instr.imm,32)
+        self.execute_table[instr.opcode](instr)
+        self.scoreboard.issue(instr,self.cycles)
         self.data_list[3] = instr
         return
 
+    def _resolve_branch(self,instr,taken,target):
+        '''
+        Resolves a branch in EX, training the predictor with its outcome. If the fetch stage did
+        not follow the branch to the right address, redirects the PC and flushes the
+        instruction fetched behind the branch.
+        '''
+        self.total_branches += 1
+        if taken:
+            self.branches_taken += 1
+        else:
+            target = instr.pc + 4
+        if self.predictor is not None:
+            self.predictor.update(instr,taken,target)
+        if instr.predicted is None:
+            # The fetch went on sequentially, which only a taken branch contradicts
+            mispredicted = taken
+        else:
+            mispredicted = target != instr.predicted
+        if mispredicted:
+            self.pc = target
+            self.mispredictions += 1
+            self.branch_penalties += 2  # The flushed fetch and the fetch of the target
+            self.data_list[1] = BUBBLE
+            self.data_list[0] = None
+
+    def _ex_jr(self,instr):
+        self._resolve_branch(instr, True, instr.rs)
+
+    # Branch offsets count instructions from the branch itself. Its own PC is used rather than
+    # the fetch PC, which instruction cache misses and predictions move.
+    def _ex_bz(self,instr):
+        self._resolve_branch(instr, instr.rs == 0, instr.pc + 4 * instr.x_addr)
+
+    def _ex_beq(self,instr):
+        self._resolve_branch(instr, instr.rs == instr.rt, instr.pc + 4 * instr.imm)
+
+    def _ex_add(self,instr):
+        instr.rd = self._getSignedNum(instr.rs + instr.rt,32)
+
+    def _ex_addi(self,instr):
+        instr.rt = self._getSignedNum(instr.rs + instr.imm,32)
+
+    def _ex_sub(self,instr):
+        instr.rd = self._getSignedNum(instr.rs - instr.rt,32)
+
+    def _ex_subi(self,instr):
+        instr.rt = self._getSignedNum(instr.rs - instr.imm,32)
+
+    def _ex_mul(self,instr):
+        instr.rd = self._getSignedNum(instr.rs * instr.rt,32)
+
+    def _ex_muli(self,instr):
+        instr.rt = self._getSignedNum(instr.rs * instr.imm,32)
+
+    def _ex_or(self,instr):
+        instr.rd = instr.rs | instr.rt
+
+    def _ex_ori(self,instr):
+        instr.rt = instr.rs | instr.imm
+
+    def _ex_and(self,instr):
+        instr.rd = instr.rs & instr.rt
+
+    def _ex_andi(self,instr):
+        instr.rt = instr.rs & instr.imm
+
+    def _ex_xor(self,instr):
+        instr.rd = instr.rs ^ instr.rt
+
+    def _ex_xori(self,instr):
+        instr.rt = instr.rs ^ instr.imm
+
+    def _ex_mem(self,instr):
+        # Ldw and Stw compute their effective address
+        instr.x_addr = self._getSignedNum(instr.rs + instr.imm,32)
+
     def Memory_op(self,):
         '''
         Memory stage of the processor. It loads or stores data from the memory.
@@ -431,13 +741,17 @@ class Processor(object):
         if instr.opcode==None:
             self.data_list[4] = instr
             return
-        if instr.opcode=='Ldw':
+        if instr.opcode==Opcode.Ldw:
             addr = instr.x_addr
-            instr.rt = int('{0:032b}'.format(int.from_bytes(bytes.fromhex(self.mem_image.read_word(addr)),byteorder='big',signed=True)),2)
-        elif instr.opcode=='Stw':
+            instr.rt = self._getSignedNum(self.mem_image.read_word(addr),32)
+            if self.dcache is not None:
+                self._dcache_stall(addr)
+        elif instr.opcode==Opcode.Stw:
             addr = instr.x_addr
             data = instr.rt
             self.mem_image.write_word(addr,data)           
+            if self.dcache is not None:
+                self._dcache_stall(addr)
         self.data_list[4] = instr
         return
         
@@ -451,13 +765,10 @@ class Processor(object):
         if instr.opcode==None:
             pass
             return
-        if (instr.opcode in ['Stw','Jr','Halt','Bz','Beq']):
-            pass
-        else:
-            if instr.opcode in self.r_type:
-                self.reg_change['R'+str(instr.reg_rd)] = instr.rd
-                self.regs.write_reg(instr.reg_rd,instr.rd)
-            else:
-                self.reg_change['R'+str(instr.reg_rt)] = instr.rt
-                self.regs.write_reg(instr.reg_rt,instr.rt)
+        if instr.flags & WRITES_RD:
+            self.reg_change[REG_NAMES[instr.reg_rd]] = instr.rd
+            self.regs.write_reg(instr.reg_rd,instr.rd)
+        elif instr.flags & WRITES_RT:
+            self.reg_change[REG_NAMES[instr.reg_rt]] = instr.rt
+            self.regs.write_reg(instr.reg_rt,instr.rt)
         return
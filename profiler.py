@@ -0,0 +1,111 @@
+import time
+
+# Stage methods of Processor, in the order run() calls them
+STAGES = ('Write_back', 'Memory_op', 'Execute', 'Instruction_decode', 'Fetch')
+
+class StageProfiler(object):
+    '''
+    Profiles a Processor by replacing its stage methods with instrumented versions, stored as
+    instance attributes that shadow the class methods. An unprofiled Processor runs the plain
+    methods and pays nothing.
+
+    For every stage it accumulates the host time spent and the number of calls. It also
+    attributes simulated costs to the PC of the instruction that caused them: stall cycles
+    and hazards to the instruction held in ID (or being fetched, for the IF-stage store
+    check), and branch penalties to the branch.
+
+    Attributes:
+    - processor: The profiled Processor.
+    - seconds, calls: Host seconds and calls per stage method name.
+    - pcs: Per-PC dictionaries with 'hazards', 'stall_cycles' and 'branch_penalties'.
+    '''
+    def __init__(self, processor):
+        '''
+        Instruments processor's stage methods.
+        '''
+        self.processor = processor
+        self.seconds = dict.fromkeys(STAGES, 0.0)
+        self.calls = dict.fromkeys(STAGES, 0)
+        self.pcs = dict()
+        for stage in STAGES:
+            setattr(processor, stage, self._instrument(stage, getattr(processor, stage)))
+
+    def detach(self):
+        '''
+        Restores the plain stage methods.
+        '''
+        for stage in STAGES:
+            self.processor.__dict__.pop(stage, None)
+
+    def _costs(self, pc):
+        costs = self.pcs.get(pc)
+        if costs is None:
+            costs = self.pcs[pc] = {'hazards': 0, 'stall_cycles': 0, 'branch_penalties': 0}
+        return costs
+
+    def _instrument(self, stage, method):
+        p = self.processor
+        seconds, calls = self.seconds, self.calls
+        clock = time.perf_counter
+        if stage in ('Instruction_decode', 'Fetch'):
+            # Stalls are appended to st_count by ID, and by IF for its store check
+            def instrumented():
+                stalls = len(p.st_count)
+                pc = p.data_list[1].pc if stage == 'Instruction_decode' else p.data_list[0]
+                start = clock()
+                method()
+                seconds[stage] += clock() - start
+                calls[stage] += 1
+                if len(p.st_count) != stalls:
+                    costs = self._costs(pc)
+                    costs['hazards'] += len(p.st_count) - stalls
+                    costs['stall_cycles'] += sum(p.st_count[stalls:])
+        elif stage == 'Execute':
+            def instrumented():
+                penalties = p.branch_penalties
+                pc = p.data_list[2].pc
+                start = clock()
+                method()
+                seconds[stage] += clock() - start
+                calls[stage] += 1
+                if p.branch_penalties != penalties:
+                    self._costs(pc)['branch_penalties'] += p.branch_penalties - penalties
+        else:
+            def instrumented():
+                start = clock()
+                method()
+                seconds[stage] += clock() - start
+                calls[stage] += 1
+        return instrumented
+
+    def hot_spots(self, key='stall_cycles', top=10):
+        '''
+        Returns the top PCs by one of the per-PC costs as (pc, costs) tuples.
+        '''
+        ranked = sorted(self.pcs.items(), key=lambda item: item[1][key], reverse=True)
+        return [(pc, costs) for pc, costs in ranked[:top] if costs[key]]
+
+    def stats(self):
+        '''
+        Returns the profile as a dictionary for Processor.store_stats().
+        '''
+        return {
+            'stage_seconds': dict(self.seconds),
+            'stage_calls': dict(self.calls),
+            'pcs': {pc: dict(costs) for pc, costs in sorted(self.pcs.items())},
+        }
+
+def print_profile(profile, top=10):
+    '''
+    Prints a profile as returned by StageProfiler.stats().
+    '''
+    total = sum(profile['stage_seconds'].values())
+    print("Host time per stage:")
+    for stage in STAGES:
+        seconds = profile['stage_seconds'][stage]
+        share = seconds / total * 100 if total > 0 else 0
+        print(f"  {stage}: {seconds:.4f} s ({share:.1f}%), {profile['stage_calls'][stage]} calls")
+    ranked = sorted(profile['pcs'].items(), key=lambda item: (item[1]['stall_cycles'], item[1]['branch_penalties']), reverse=True)
+    print("Costliest PCs (stall cycles, hazards, branch penalties):")
+    for pc, costs in ranked[:top]:
+        print(f"  PC {pc}: {costs['stall_cycles']}, {costs['hazards']}, {costs['branch_penalties']}")
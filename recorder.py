@@ -0,0 +1,88 @@
+try:
+    import numpy as np
+except ImportError:  # NumPy is only needed to record and analyze dynamic traces
+    np = None
+
+# Column names and NumPy types of a recorded dynamic trace
+FIELDS = (('pc', 'int64'), ('opcode', 'int8'), ('rs', 'int8'), ('rt', 'int8'), ('rd', 'int8'), ('taken', 'bool'))
+
+# Default number of instructions per chunk
+CHUNK_SIZE = 1 << 20
+
+class TraceRecorder(object):
+    '''
+    Records the dynamic instruction stream of a FunctionalProcessor into preallocated NumPy
+    arrays, one column per field of FIELDS, in chunks of chunk_size instructions.
+    Undecodable words are recorded with opcode -1 and absent registers as -1.
+
+    A full chunk is passed to on_chunk if given and otherwise kept in chunks, so a callback
+    such as TraceAnalysis.update can consume arbitrarily long traces in constant memory.
+
+    Attributes:
+    - chunk_size: Number of instructions per chunk.
+    - on_chunk: Callable receiving each completed chunk as a dictionary of column arrays.
+    - chunks: Completed chunks kept when there is no on_chunk callback.
+    '''
+    def __init__(self, chunk_size=CHUNK_SIZE, on_chunk=None):
+        '''
+        Initializes an empty recorder and allocates its first chunk.
+        '''
+        if np is None:
+            raise ImportError('recording dynamic traces requires NumPy')
+        self.chunk_size = chunk_size
+        self.on_chunk = on_chunk
+        self.chunks = []
+        self.recorded = 0
+        self._allocate()
+
+    def _allocate(self):
+        self._columns = {name: np.empty(self.chunk_size, dtype) for name, dtype in FIELDS}
+        self._pc = self._columns['pc']
+        self._opcode = self._columns['opcode']
+        self._rs = self._columns['rs']
+        self._rt = self._columns['rt']
+        self._rd = self._columns['rd']
+        self._taken = self._columns['taken']
+        self._fill = 0
+
+    def __len__(self):
+        return self.recorded
+
+    def record(self, pc, instr, taken):
+        '''
+        Appends one executed instruction. taken is True for a taken branch or jump.
+        '''
+        i = self._fill
+        opcode = instr.opcode
+        self._pc[i] = pc
+        self._opcode[i] = -1 if opcode is None else opcode
+        self._rs[i] = -1 if instr.reg_rs is None else instr.reg_rs
+        self._rt[i] = -1 if instr.reg_rt is None else instr.reg_rt
+        self._rd[i] = -1 if instr.reg_rd is None else instr.reg_rd
+        self._taken[i] = taken
+        self._fill = i + 1
+        self.recorded += 1
+        if self._fill == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Completes the current chunk, even if partially filled, and starts a new one.
+        '''
+        if self._fill == 0:
+            return
+        chunk = {name: column[:self._fill] for name, column in self._columns.items()}
+        if self.on_chunk is not None:
+            self.on_chunk(chunk)
+        else:
+            self.chunks.append(chunk)
+        self._allocate()
+
+    def arrays(self):
+        '''
+        Returns the complete trace kept in chunks as one dictionary of column arrays.
+        '''
+        self.flush()
+        if not self.chunks:
+            return {name: np.empty(0, dtype) for name, dtype in FIELDS}
+        return {name: np.concatenate([chunk[name] for chunk in self.chunks]) for name, _ in FIELDS}
@@ -0,0 +1,133 @@
+from memory import image_digest
+import argparse
+import glob
+import gzip
+import hashlib
+import json
+import os
+
+# Default directory of the cache and its size limit in bytes
+CACHE_DIR = os.path.join('.simcache', 'results')
+MAX_BYTES = 64 * 1024 * 1024
+
+# Version of the entry layout, part of every key
+FORMAT_VERSION = 1
+
+# Modules whose source determines the results of a run
+SIMULATOR_SOURCES = ('processor.py', 'instruction.py', 'memory.py', 'scoreboard.py', 'cache.py', 'predictor.py')
+
+_version = None
+
+def simulator_version():
+    '''
+    Returns a hash of the simulator's source, so that any change to the timing model
+    invalidates every cached result.
+    '''
+    global _version
+    if _version is None:
+        digest = hashlib.sha256(str(FORMAT_VERSION).encode())
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in SIMULATOR_SOURCES:
+            with open(os.path.join(directory, name), 'rb') as source:
+                digest.update(source.read())
+        _version = digest.hexdigest()
+    return _version
+
+class ResultCache(object):
+    '''
+    On-disk cache of the results of complete Processor runs, keyed by the hash of the memory
+    image, the forwarding setting, the cache and branch predictor configuration and the
+    simulator version. Each entry holds the store_stats() dictionary and the final state
+    print_stats() reports: counters, registers, register changes, written memory words and
+    the contents of the caches and predictor. Entries are gzip-compressed JSON files. Once
+    they exceed max_bytes, the least recently used are evicted; a hit counts as a use.
+    '''
+    def __init__(self, directory=CACHE_DIR, max_bytes=MAX_BYTES):
+        '''
+        Opens the cache in directory, creating it if needed.
+        '''
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, memory_image, forwarding, timing=None):
+        '''
+        Returns the cache key of a run of memory_image. timing is a JSON-serializable
+        description of the processor's caches and branch predictor, if it has any.
+        '''
+        parts = (image_digest(memory_image), str(bool(forwarding)), simulator_version())
+        if timing is not None:
+            parts += (json.dumps(timing, sort_keys=True),)
+        return hashlib.sha256(' '.join(parts).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.json.gz')
+
+    def get(self, key):
+        '''
+        Returns the entry stored under key, or None.
+        '''
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt') as entry:
+                result = json.load(entry)
+            os.utime(path)
+        except (OSError, ValueError):
+            # Missing, evicted by another process meanwhile, or unreadable
+            return None
+        return result
+
+    def put(self, key, entry):
+        '''
+        Stores entry under key, then evicts the least recently used entries over the size limit.
+        '''
+        path = self._path(key)
+        staging = f'{path}.{os.getpid()}.tmp'
+        with gzip.open(staging, 'wt') as out:
+            out.write(json.dumps(entry, separators=(',', ':')))
+        os.replace(staging, path)
+        self.evict()
+
+    def entries(self):
+        '''
+        Returns (mtime, size, path) for every entry, least recently used first.
+        '''
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, '*.json.gz')):
+            try:
+                status = os.stat(path)
+            except OSError:
+                continue
+            entries.append((status.st_mtime, status.st_size, path))
+        return sorted(entries)
+
+    def evict(self, max_bytes=None):
+        '''
+        Deletes the least recently used entries until the cache holds at most max_bytes,
+        by default the cache's limit.
+        '''
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the simulation result cache.")
+    parser.add_argument("--dir", default=CACHE_DIR, help=f"cache directory (default: {CACHE_DIR})")
+    parser.add_argument("--clear", action="store_true", help="delete every entry")
+    args = parser.parse_args()
+    cache = ResultCache(args.dir)
+    if args.clear:
+        cache.evict(0)
+    entries = cache.entries()
+    print(f"{len(entries)} entries, {sum(size for _, size, _ in entries)} bytes in '{args.dir}'")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import io
+import os
+from processor import Processor
+from tracesink import TraceSink
+from resultcache import ResultCache
+from analytical import record_trace, AnalyticalProcessor, UnsupportedTrace
+from memory import load_image
+import cache
+import predictor
+import argparse
+
+# Instructions the analytical mode executes before it treats a program as possibly endless
+ANALYTICAL_MAX_INSTRUCTIONS = 5 * 10**6
+
+def add_budget_arguments(parser):
+    '''
+    Adds the options that bound each run to an argparse parser; see budget_from_args.
+    '''
+    parser.add_argument("--max-cycles", type=int, help="stop each run after this many cycles")
+    parser.add_argument("--max-instructions", type=int, help="stop each run after this many instructions")
+    parser.add_argument("--max-seconds", type=float, help="stop each run after about this many seconds")
+    parser.add_argument("--no-stuck-detection", action="store_true",
+        help="keep simulating a program whose state has recurred, which would otherwise stop as stuck")
+
+def budget_from_args(args):
+    '''
+    Returns the keyword arguments for Processor.run given by the options of add_budget_arguments.
+    '''
+    budget = {'detect_stuck': not args.no_stuck_detection}
+    for name in ('max_cycles', 'max_instructions', 'max_seconds'):
+        if getattr(args, name) is not None:
+            budget[name] = getattr(args, name)
+    return budget
+
+def _spec_parser(parse):
+    '''
+    Wraps a specification parser that raises ValueError as an argparse type.
+    '''
+    def parse_argument(text):
+        try:
+            return parse(text)
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return parse_argument
+
+# Processor arguments set by the options of add_timing_arguments
+TIMING_OPTIONS = ('icache', 'dcache', 'predictor')
+
+def add_timing_arguments(parser):
+    '''
+    Adds the options that give each run caches or a branch predictor to an argparse parser;
+    see timing_from_args.
+    '''
+    spec = "SPEC is a comma-separated list of size=BYTES, ways=N, line=BYTES, policy=lru|fifo, hit=CYCLES and miss=CYCLES"
+    parser.add_argument("--icache", type=_spec_parser(cache.parse_spec), nargs="?", const="", metavar="SPEC",
+        help="time instruction fetches with a cache (default: 4 KiB, 2 ways, 32-byte lines, LRU, hit 1, miss 10 cycles); " + spec)
+    parser.add_argument("--dcache", type=_spec_parser(cache.parse_spec), nargs="?", const="", metavar="SPEC",
+        help="time loads and stores with a cache, specified like --icache")
+    parser.add_argument("--predictor", type=_spec_parser(predictor.parse_spec), metavar="SPEC",
+        help="predict branches in the fetch stage, so that only mispredicted ones flush; SPEC is not-taken, btfn, "
+            "bimodal or gshare, optionally followed by ,entries=N ,bits=1|2 (bimodal) ,history=N (gshare) and ,btb=N "
+            "for a branch target buffer that predicts Jr")
+
+def timing_from_args(args):
+    '''
+    Returns the keyword arguments for Processor given by the options of add_timing_arguments.
+    '''
+    return {name: getattr(args, name) for name in TIMING_OPTIONS if getattr(args, name) is not None}
+
+def run_config(image_file, config):
+    '''
+    Simulates one memory image with one processor configuration.
+    The image is loaded from image_file here, so only the path and the configuration
+    need to be sent to a worker process.
+
+    :param image_file: The memory image file to simulate.
+    :param config: Keyword arguments for Processor, e.g. {'forwarding': True}. A 'trace' entry
+        holds keyword arguments for a TraceSink (e.g. {'path': 'run.jsonl.gz'}) that records the run,
+        a 'result_cache' entry the directory of a ResultCache to consult, and a 'budget' entry
+        keyword arguments for Processor.run, e.g. {'max_cycles': 10**6, 'detect_stuck': True}.
+    :return: A tuple (report, stats) of the print_stats() text and the store_stats() dictionary.
+    '''
+    config = dict(config)
+    trace = config.pop('trace', None)
+    budget = config.pop('budget', None) or {}
+    cache_dir = config.pop('result_cache', None)
+    if cache_dir:
+        config['result_cache'] = ResultCache(cache_dir)
+    mem_image = load_image(image_file)
+    report = io.StringIO()
+    sink = TraceSink(**trace) if trace else None
+    try:
+        with contextlib.redirect_stdout(report):
+            p = Processor(mem_image, trace_sink=sink, **config)
+            p.run(**budget)
+            p.print_stats()
+    finally:
+        if sink is not None:
+            sink.close()
+    return report.getvalue(), p.store_stats()
+
+def run_configs(image_file, configs, jobs=None):
+    '''
+    Simulates one memory image with several processor configurations, running them
+    concurrently in a process pool.
+
+    :param image_file: The memory image file to simulate.
+    :param configs: A list of configuration dictionaries for Processor.
+    :param jobs: Number of worker processes. Defaults to one per configuration, capped at
+        the CPU count. With jobs=1 the configurations run sequentially in this process.
+    :return: A list of (report, stats) tuples in the order of configs.
+    '''
+    if jobs is None:
+        jobs = min(len(configs), os.cpu_count() or 1)
+    if jobs <= 1 or len(configs) <= 1:
+        return [run_config(image_file, config) for config in configs]
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(run_config, [image_file] * len(configs), configs))
+
+def run_analytical(image_file, configs, budget=None, max_instructions=ANALYTICAL_MAX_INSTRUCTIONS):
+    '''
+    Produces the same results as run_configs from a single functional execution of the image,
+    timing every configuration from its dynamic trace with AnalyticalProcessor. Falls back to
+    run_configs if the program modifies code that is about to be fetched, or if it does not
+    reach Halt within max_instructions, which may mean it never halts.
+
+    :param image_file: The memory image file to simulate.
+    :param configs: A list of configuration dictionaries for Processor.
+    :param budget: Keyword arguments for Processor.run for the fallback, e.g. {'detect_stuck': True}.
+    :param max_instructions: Bound on the functional execution.
+    :return: A list of (report, stats) tuples in the order of configs.
+    '''
+    fallback = [dict(config, budget=budget) for config in configs]
+    try:
+        reference, trace = record_trace(load_image(image_file), max_instructions)
+    except UnsupportedTrace:
+        return run_configs(image_file, fallback)
+    if not reference.Halt:
+        return run_configs(image_file, fallback)
+    results = []
+    for config in configs:
+        report = io.StringIO()
+        with contextlib.redirect_stdout(report):
+            p = AnalyticalProcessor(reference, trace, **config)
+            p.run()
+            p.print_stats()
+        results.append((report.getvalue(), p.store_stats()))
+    return results
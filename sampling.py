@@ -0,0 +1,149 @@
+from functional import FunctionalProcessor
+from processor import Processor
+from memory import load_image
+import argparse
+import math
+import os
+import statistics
+import sys
+
+# Two-sided 95% Student t quantiles for 1 to 30 degrees of freedom; 1.96 beyond
+T_95 = (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+        2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+        2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042)
+
+# Cycles a complete run spends filling and draining the pipeline on top of CPI x instructions
+PIPELINE_FILL_CYCLES = 4
+
+def _advance(p, instructions):
+    '''
+    Runs processor p until it has executed `instructions` more instructions.
+    Returns True if it reached Halt first.
+    '''
+    target = p.num_instructions + instructions
+    while p.num_instructions < target:
+        # Every instruction takes at least a cycle, so this cannot overshoot the target
+        if p.run(max_cycles=p.cycles + target - p.num_instructions):
+            return True
+    return False
+
+def _measure(f, forwarding, warmup, window):
+    '''
+    Starts a detailed Processor from the architectural state of FunctionalProcessor f, warms
+    it up for `warmup` instructions and measures the CPI of the next `window` instructions.
+    Returns None if the program halts before the window is complete.
+    '''
+    p = Processor(f.mem_image, forwarding=forwarding)
+    p.regs.regs.update(f.regs.regs)
+    p.pc = p.data_list[0] = f.pc
+    if _advance(p, warmup):
+        return None
+    cycles, instructions = p.cycles, p.num_instructions
+    if _advance(p, window):
+        return None
+    return (p.cycles - cycles) / (p.num_instructions - instructions)
+
+def _interval(mean, samples):
+    '''
+    Returns the 95% confidence interval of the mean of samples.
+    '''
+    if len(samples) < 2:
+        return (mean, mean) if samples else (None, None)
+    t = T_95[len(samples) - 2] if len(samples) - 1 <= len(T_95) else 1.96
+    half = t * statistics.stdev(samples) / math.sqrt(len(samples))
+    return (mean - half, mean + half)
+
+def sample(memory_image, forwarding=False, interval=10000, warmup=1000, window=1000):
+    '''
+    Estimates the timing of a full Processor run by systematic sampling. The program runs on
+    the functional model; at the start of every interval of `interval` instructions a detailed
+    Processor is started from the functional state, warmed up for `warmup` instructions and
+    measured for `window` instructions. The mean CPI of the windows is extrapolated to the
+    exact instruction count, with a 95% confidence interval from the spread of the windows.
+
+    :return: A dictionary with the exact counters of FunctionalProcessor.store_stats() and
+        the estimated 'cpi', 'ipc' and 'cycles', each with an '_interval' (low, high) entry.
+    '''
+    if warmup + window > interval:
+        raise ValueError('warmup + window must not exceed the sampling interval')
+    f = FunctionalProcessor(memory_image, translate=True)
+    samples = []
+    while not f.Halt:
+        f.run(interval - warmup - window)
+        if f.Halt:
+            break
+        cpi = _measure(f, forwarding, warmup, window)
+        if cpi is not None:
+            samples.append(cpi)
+        # The functional model executes the sampled instructions too
+        f.run(warmup + window)
+
+    stats = f.store_stats()
+    stats['mode'] = 'sampled'
+    stats['forwarding'] = forwarding
+    stats['samples'] = len(samples)
+    stats['detailed_instructions'] = len(samples) * (warmup + window)
+    cpi = statistics.fmean(samples) if samples else None
+    low, high = _interval(cpi, samples)
+    instructions = f.num_instructions
+    stats['cpi'] = cpi
+    stats['cpi_interval'] = (low, high)
+    stats['ipc'] = 1 / cpi if cpi else None
+    stats['ipc_interval'] = (1 / high if high else None, 1 / low if low and low > 0 else None)
+    stats['cycles'] = cpi * instructions + PIPELINE_FILL_CYCLES if cpi is not None else None
+    stats['cycles_interval'] = tuple(None if bound is None else bound * instructions + PIPELINE_FILL_CYCLES
+                                     for bound in (low, high))
+    return stats
+
+def print_stats(stats, exact=None):
+    '''
+    Prints sampled statistics, and the error against the statistics of a full Processor run if given.
+    '''
+    print(f"\nSampled simulation of the MIPS-lite processor with Forwarding: {stats['forwarding']}\n")
+    print("Total Instruction count: ", stats['num_instructions'])
+    print("Arithmetic Instruction count: ", stats['arithmetic_instructions'])
+    print("Logical Instruction count: ", stats['logic_instructions'])
+    print("Memory Instruction count: ", stats['memory_instructions'])
+    print("Control Instruction count: ", stats['control_instructions'])
+    print("Total number of branches: ", stats['total_branches'])
+    print("Total number of branches taken: ", stats['branches_taken'])
+    print(f"Samples: {stats['samples']} ({stats['detailed_instructions']} instructions simulated in detail)")
+    if stats['cpi'] is None:
+        print("No complete sample; use a shorter interval, warm-up or window")
+        return
+    for name in ('cycles', 'cpi', 'ipc'):
+        low, high = stats[name + '_interval']
+        line = f"Estimated {name}: {stats[name]:.4f} (95% CI {low:.4f} .. {high:.4f})" if low is not None else \
+            f"Estimated {name}: {stats[name]:.4f}"
+        if exact is not None:
+            error = (stats[name] - exact[name]) / exact[name] * 100
+            inside = low is not None and low <= exact[name] <= high
+            line += f", full run {exact[name]:.4f}, error {error:+.2f}%" + (" (inside CI)" if inside else "")
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate the timing of a long run by sampled detailed simulation.")
+    parser.add_argument("image_file", help="memory image file")
+    parser.add_argument("--forwarding", action="store_true", help="simulate with forwarding enabled")
+    parser.add_argument("--interval", type=int, default=10000, help="instructions per sampling interval (default: 10000)")
+    parser.add_argument("--warmup", type=int, default=1000, help="detailed instructions before each window (default: 1000)")
+    parser.add_argument("--window", type=int, default=1000, help="measured instructions per sample (default: 1000)")
+    parser.add_argument("--validate", action="store_true", help="also run the full pipeline and report the error")
+    args = parser.parse_args()
+    if not os.path.exists(args.image_file):
+        print(f"Error: The file '{args.image_file}' does not exist. Please provide a correct file.")
+        sys.exit(1)
+    mem_image = load_image(args.image_file)
+    try:
+        stats = sample(mem_image, args.forwarding, args.interval, args.warmup, args.window)
+    except ValueError as e:
+        parser.error(str(e))
+    exact = None
+    if args.validate:
+        p = Processor(mem_image, forwarding=args.forwarding)
+        p.run()
+        exact = {'cycles': p.cycles, 'cpi': p.cycles / p.num_instructions, 'ipc': p.num_instructions / p.cycles}
+    print_stats(stats, exact)
+
+if __name__ == "__main__":
+    main()
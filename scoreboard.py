@@ -0,0 +1,54 @@
+from instruction import R_TYPE, Opcode
+
+class Scoreboard(object):
+    '''
+    Register scoreboard for the ID stage hazard check. For every register it records the most
+    recent in-flight instruction that names it as a destination and the cycle in which that
+    instruction executed, so each source operand is resolved with one lookup instead of a
+    scan over the EX/MEM and MEM/WB latches.
+
+    An instruction that executes in cycle c sits in the EX/MEM latch during cycle c (distance 1
+    from the instruction in ID) and in the MEM/WB latch during cycle c + 1 (distance 2). It has
+    written back by cycle c + 2, when the register file holds its result.
+    '''
+    def __init__(self):
+        '''
+        Initializes an empty scoreboard for 32 registers.
+        '''
+        self.producer = [None] * 32
+        self.issue_cycle = [-2] * 32
+
+    def issue(self,instr,cycle):
+        '''
+        Records instr, which executed in cycle, as the latest producer of its destination register.
+        As in the pipeline's latches, an R-type instruction names rd and any other instruction
+        names rt (which may be None).
+        '''
+        reg = instr.reg_rd if instr.flags & R_TYPE else instr.reg_rt
+        if reg is not None:
+            self.producer[reg] = instr
+            self.issue_cycle[reg] = cycle
+
+    def lookup(self,reg,cycle):
+        '''
+        Returns the in-flight producer of reg as seen from the ID stage in cycle and its distance
+        (1 or 2), or (None, 0) if the register file already holds the latest value.
+        '''
+        distance = cycle - self.issue_cycle[reg] + 1
+        if distance > 2:
+            return None, 0
+        return self.producer[reg], distance
+
+    @staticmethod
+    def value(instr):
+        '''
+        Returns the result an in-flight producer forwards.
+        '''
+        return instr.rd if instr.flags & R_TYPE else instr.rt
+
+    @staticmethod
+    def is_load(instr):
+        '''
+        True if the producer is a load, whose value is available only after the MEM stage.
+        '''
+        return instr.opcode == Opcode.Ldw
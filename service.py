@@ -0,0 +1,370 @@
+from concurrent.futures import ProcessPoolExecutor
+from processor import Processor
+from memory import load_image, image_hash, WORD_TYPECODE
+from array import array
+import argparse
+import asyncio
+import collections
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+# Cycles a worker simulates between checks for cancellation and timeout
+SLICE_CYCLES = 20000
+
+# Defaults for the service limits
+MAX_PENDING = 64
+TIMEOUT = 60.0
+MAX_FINISHED = 1024
+
+# Processor options a job may set
+JOB_OPTIONS = ('forwarding', 'profile')
+
+# Largest request body accepted, in bytes
+MAX_BODY = 64 * 1024 * 1024
+
+# How worker processes are started; forked workers would share the server's sockets
+WORKER_START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+REASONS = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 503: 'Service Unavailable'}
+
+class RequestError(Exception):
+    '''
+    A request the service rejects, with the HTTP status to answer it with.
+    '''
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+def run_job(image_path, config, timeout, cancel):
+    '''
+    Worker entry point: simulates an image to Halt, in slices of SLICE_CYCLES cycles. It stops
+    early if the program's state recurs (see watchdog.StuckDetector) and, between slices, if
+    the cancel event is set or the run has taken longer than timeout seconds.
+
+    :return: A dictionary with the final 'status' ('done', 'stuck', 'cancelled' or 'timeout'),
+        the 'cycles' simulated, 'stats' from store_stats() (partial unless done) and the
+        register and memory 'deltas'.
+    '''
+    p = Processor(load_image(image_path), **config)
+    deadline = time.monotonic() + timeout if timeout else None
+    status = 'done'
+    while not p.run(max_cycles=p.cycles + SLICE_CYCLES, detect_stuck=True):
+        if p.stop_reason == 'stuck':
+            status = 'stuck'
+            break
+        if cancel.is_set():
+            status = 'cancelled'
+            break
+        if deadline is not None and time.monotonic() > deadline:
+            status = 'timeout'
+            break
+    deltas = {
+        'registers': p.reg_change,
+        'memory': {address: value - (1 << 32) if value & 0x80000000 else value
+                   for address, value in p.mem_image.changed_words()},
+    }
+    return {'status': status, 'cycles': p.cycles, 'stats': p.store_stats(), 'deltas': deltas}
+
+def parse_image(image):
+    '''
+    Converts an uploaded image, either text with one hex word per line or a list of integers,
+    into an array of words. Raises RequestError if it is malformed.
+    '''
+    try:
+        if isinstance(image, str):
+            words = [int(line, 16) for line in image.split()]
+        elif isinstance(image, list):
+            words = [int(word) for word in image]
+        else:
+            raise ValueError
+        return array(WORD_TYPECODE, (word & 0xFFFFFFFF for word in words))
+    except (ValueError, TypeError):
+        raise RequestError(400, "'image' must be hex words, one per line, or a list of integers")
+
+class Job(object):
+    '''
+    A simulation submitted to the service.
+
+    Attributes:
+    - id: The job id.
+    - key: Image hash and configuration; identical in-flight submissions share one job.
+    - config: Keyword arguments for Processor.
+    - timeout: Seconds the run may take, or None.
+    - status: 'queued', 'running', 'done', 'stuck', 'cancelled', 'timeout' or 'failed'.
+    - result: The worker's result once finished, or {'error': ...} if it failed.
+    '''
+    def __init__(self, key, image_path, config, timeout, cancel):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.image_path = image_path
+        self.config = config
+        self.timeout = timeout
+        self.cancel = cancel
+        self.status = 'queued'
+        self.result = None
+        self.finished = asyncio.Event()
+        self.task = None
+
+    def describe(self, deltas=False):
+        '''
+        Returns the job as a JSON-serializable dictionary, with the register and memory deltas if asked.
+        '''
+        state = {'id': self.id, 'status': self.status, 'config': self.config, 'timeout': self.timeout}
+        if self.result is not None:
+            state.update((name, value) for name, value in self.result.items() if name != 'deltas' or deltas)
+        return state
+
+class SimulationService(object):
+    '''
+    Runs simulation jobs on a process pool for asyncio clients.
+
+    At most `workers` jobs run at a time; others wait in the queue. The service holds at most
+    max_pending queued and running jobs, and rejects new submissions beyond that so clients
+    can back off. A submission identical to a job still in flight (same image words and
+    configuration) returns that job instead of simulating again. Cancelling a queued job
+    removes it; a running job stops at its next slice of SLICE_CYCLES cycles, as does a job
+    that exceeds its timeout. A program whose state recurs, and so can never reach Halt,
+    stops as soon as that is detected.
+    '''
+    def __init__(self, workers=None, max_pending=MAX_PENDING, timeout=TIMEOUT, upload_dir=None):
+        '''
+        Creates the service. Call start() from the event loop before submitting jobs.
+        '''
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.upload_dir = upload_dir
+        self.jobs = dict()
+        self.in_flight = dict()
+        self.finished = collections.deque()
+        self.pool = None
+        self.manager = None
+        self._slots = None
+        self._own_upload_dir = False
+
+    def start(self):
+        '''
+        Starts the worker processes. They are started with WORKER_START_METHOD, so a main
+        module that creates the service must guard its code with `if __name__ == '__main__'`.
+        '''
+        if self.upload_dir is None:
+            self.upload_dir = tempfile.mkdtemp(prefix='mips-service-')
+            self._own_upload_dir = True
+        # The pool starts its workers lazily, from a request handler. Forked there, they would
+        # inherit the listening socket and the client's connection and keep it open, so they
+        # are started from a clean server process instead.
+        context = multiprocessing.get_context(WORKER_START_METHOD)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        # Cancellation events must be shareable with the pool's worker processes
+        self.manager = context.Manager()
+        self._slots = asyncio.Semaphore(self.workers)
+
+    def close(self):
+        '''
+        Cancels every job and stops the worker processes.
+        '''
+        for job in list(self.in_flight.values()):
+            self.cancel(job.id)
+        self.pool.shutdown(wait=True, cancel_futures=True)
+        self.manager.shutdown()
+        if self._own_upload_dir:
+            shutil.rmtree(self.upload_dir, ignore_errors=True)
+
+    def submit(self, image, config=None, timeout=None):
+        '''
+        Submits a simulation of image (see parse_image) with a configuration of JOB_OPTIONS.
+        Returns the new Job, or the in-flight Job of an identical submission.
+        Raises RequestError if the submission is malformed or the queue is full.
+        '''
+        config = dict(config or {})
+        unknown = set(config) - set(JOB_OPTIONS)
+        if unknown:
+            raise RequestError(400, f"unknown configuration options: {', '.join(sorted(unknown))}")
+        config = {name: bool(config.get(name, False)) for name in JOB_OPTIONS}
+        if timeout is None:
+            timeout = self.timeout
+        elif not isinstance(timeout, (int, float)) or timeout <= 0:
+            raise RequestError(400, "'timeout' must be a positive number of seconds")
+        words = parse_image(image)
+        digest = image_hash(words)
+        key = (digest,) + tuple(config[name] for name in JOB_OPTIONS)
+        job = self.in_flight.get(key)
+        if job is not None:
+            return job
+        if len(self.in_flight) >= self.max_pending:
+            raise RequestError(503, f"{len(self.in_flight)} jobs pending; retry later")
+        image_path = os.path.join(self.upload_dir, digest + '.txt')
+        if not os.path.exists(image_path):
+            with open(image_path, 'w') as out:
+                out.write(''.join(f'{word:08x}\n' for word in words))
+        job = Job(key, image_path, config, timeout, self.manager.Event())
+        self.jobs[job.id] = job
+        self.in_flight[key] = job
+        job.task = asyncio.get_running_loop().create_task(self._execute(job))
+        return job
+
+    async def _execute(self, job):
+        try:
+            async with self._slots:
+                job.status = 'running'
+                loop = asyncio.get_running_loop()
+                job.result = await loop.run_in_executor(self.pool, run_job, job.image_path, job.config,
+                                                        job.timeout, job.cancel)
+                job.status = job.result['status']
+        except asyncio.CancelledError:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.status = 'failed'
+            job.result = {'error': f'{type(e).__name__}: {e}'}
+        finally:
+            self._finish(job)
+
+    def _finish(self, job):
+        if self.in_flight.get(job.key) is job:
+            del self.in_flight[job.key]
+        job.finished.set()
+        # Keep the results of the latest MAX_FINISHED jobs
+        self.finished.append(job.id)
+        while len(self.finished) > MAX_FINISHED:
+            self.jobs.pop(self.finished.popleft(), None)
+
+    def cancel(self, job_id):
+        '''
+        Cancels a job. Returns the Job, or None if there is no such job.
+        '''
+        job = self.jobs.get(job_id)
+        if job is None or job.finished.is_set():
+            return job
+        if job.status == 'queued':
+            job.task.cancel()
+        else:
+            job.cancel.set()
+        return job
+
+    async def wait(self, job_id):
+        '''
+        Waits until a job has finished and returns it, or None if there is no such job.
+        '''
+        job = self.jobs.get(job_id)
+        if job is not None:
+            await job.finished.wait()
+        return job
+
+    async def handle(self, reader, writer):
+        '''
+        Serves one HTTP request on a client connection:
+
+        - POST /jobs with a JSON body {"image": ..., "config": {...}, "timeout": seconds}
+          submits a job and answers 202 with its id and status. Add ?wait=1 to answer when
+          it has finished instead.
+        - GET /jobs/<id> returns the job's status and, once finished, its result. Add ?wait=1
+          to wait for it, and ?deltas=1 to include the register and memory deltas.
+        - DELETE /jobs/<id> cancels the job.
+        '''
+        try:
+            try:
+                method, path, query, body = await self._read_request(reader)
+                status, response = await self._route(method, path, query, body)
+            except RequestError as e:
+                status, response = e.status, {'error': str(e)}
+            body = json.dumps(response).encode()
+            writer.write(f'HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n'
+                         f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode() + body)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        request = (await reader.readline()).decode('latin-1').split()
+        if len(request) != 3:
+            raise RequestError(400, 'malformed request line')
+        method, target, _ = request
+        length = 0
+        while True:
+            line = (await reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            if name.strip().lower() == 'content-length':
+                try:
+                    length = int(value)
+                except ValueError:
+                    raise RequestError(400, 'invalid Content-Length')
+        if length > MAX_BODY:
+            raise RequestError(413, f'request bodies are limited to {MAX_BODY} bytes')
+        body = await reader.readexactly(length) if length else b''
+        path, _, query_string = target.partition('?')
+        query = dict(item.partition('=')[::2] for item in query_string.split('&') if item)
+        return method, path, query, body
+
+    async def _route(self, method, path, query, body):
+        wait = query.get('wait') in ('1', 'true')
+        deltas = query.get('deltas') in ('1', 'true')
+        parts = path.strip('/').split('/')
+        if parts == ['jobs']:
+            if method != 'POST':
+                raise RequestError(405, 'use POST to submit a job')
+            try:
+                request = json.loads(body)
+            except ValueError:
+                raise RequestError(400, 'the body must be a JSON object')
+            if not isinstance(request, dict) or 'image' not in request:
+                raise RequestError(400, "the body must be a JSON object with an 'image'")
+            job = self.submit(request['image'], request.get('config'), request.get('timeout'))
+            if not wait:
+                return 202, job.describe()
+            await job.finished.wait()
+            return 200, job.describe(deltas or request.get('deltas', False))
+        if len(parts) != 2 or parts[0] != 'jobs' or parts[1] not in self.jobs:
+            raise RequestError(404, f'no such job: {path}')
+        if method == 'GET':
+            job = await self.wait(parts[1]) if wait else self.jobs[parts[1]]
+        elif method == 'DELETE':
+            job = self.cancel(parts[1])
+        else:
+            raise RequestError(405, 'use GET or DELETE on a job')
+        return 200, job.describe(deltas)
+
+async def serve(service, host='127.0.0.1', port=8586, unix=None):
+    '''
+    Runs service on a localhost TCP port, or on a Unix socket if unix is given, until cancelled.
+    '''
+    service.start()
+    try:
+        if unix:
+            server = await asyncio.start_unix_server(service.handle, path=unix)
+        else:
+            server = await asyncio.start_server(service.handle, host, port)
+        print(f"Serving on {unix or f'http://{host}:{port}'}", flush=True)
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve MIPS-lite simulations over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=8586, help="port to listen on (default: 8586)")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING,
+        help=f"queued and running jobs before submissions are refused (default: {MAX_PENDING})")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT,
+        help=f"default seconds a job may run (default: {TIMEOUT:g})")
+    args = parser.parse_args()
+    service = SimulationService(args.workers, args.max_pending, args.timeout)
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
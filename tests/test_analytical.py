@@ -0,0 +1,62 @@
+import glob
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from analytical import AnalyticalProcessor, UnsupportedTrace, record_trace
+from benchmark import encode_i, synthetic_loop, write_image
+from instruction import Opcode
+from memory import load_image
+from processor import Processor
+from runner import run_analytical, run_configs
+
+TRACE_FILES = sorted(glob.glob(os.path.join(ROOT, 'trace_files', '*.txt')))
+CONFIGS = [{'forwarding': False}, {'forwarding': True}]
+
+class AnalyticalTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def image_file(self, words):
+        path = os.path.join(self.directory.name, 'image.txt')
+        write_image(words, path)
+        return path
+
+    def test_stats_match_pipelined_model(self):
+        paths = TRACE_FILES + [self.image_file(synthetic_loop(200))]
+        for path in paths:
+            image = load_image(path)
+            reference, trace = record_trace(image)
+            for forwarding in (False, True):
+                p = Processor(image, forwarding=forwarding)
+                p.run()
+                a = AnalyticalProcessor(reference, trace, forwarding=forwarding)
+                a.run()
+                with self.subTest(image=os.path.basename(path), forwarding=forwarding):
+                    self.assertEqual(a.store_stats(), p.store_stats())
+                    self.assertEqual(a.reg_change, p.reg_change)
+
+    def test_reports_match_run_configs(self):
+        self.assertEqual(run_analytical(TRACE_FILES[0], CONFIGS), run_configs(TRACE_FILES[0], CONFIGS, jobs=1))
+
+    def test_fetch_of_code_being_stored_is_unsupported(self):
+        # The store rewrites the instruction right behind it, which the pipeline has fetched
+        words = [encode_i(Opcode.Ldw, 0, 1, 20), encode_i(Opcode.Stw, 0, 1, 8),
+                 encode_i(Opcode.Addi, 5, 5, 1), Opcode.Halt << 26, 0, encode_i(Opcode.Addi, 5, 5, 100)]
+        path = self.image_file(words)
+        with self.assertRaises(UnsupportedTrace):
+            record_trace(load_image(path))
+        self.assertEqual(run_analytical(path, CONFIGS), run_configs(path, CONFIGS, jobs=1))
+
+    def test_program_that_never_halts_falls_back_to_bounded_run(self):
+        path = self.image_file([encode_i(Opcode.Beq, 0, 0, -1), 0])
+        results = run_analytical(path, CONFIGS, budget={'detect_stuck': True}, max_instructions=1000)
+        self.assertEqual([stats['stop_reason'] for _, stats in results], ['stuck', 'stuck'])
+
+if __name__ == '__main__':
+    unittest.main()
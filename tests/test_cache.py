@@ -0,0 +1,97 @@
+import collections
+import glob
+import os
+import random
+import sys
+import unittest
+from array import array
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cache import DEFAULTS, Cache, parse_spec
+from functional import FunctionalProcessor, compare
+from memory import load_image
+from processor import Processor
+
+TRACE_FILES = sorted(glob.glob(os.path.join(ROOT, 'trace_files', '*.txt')))
+
+class CacheModelTest(unittest.TestCase):
+    def test_hits_follow_replacement_policy(self):
+        # Each set of the reference model is an OrderedDict of its lines, the victim first
+        for trial in range(60):
+            r = random.Random(trial)
+            ways, line_size, sets = r.choice([1, 2, 4]), r.choice([4, 16, 32]), r.choice([1, 2, 8])
+            policy = r.choice(['lru', 'fifo'])
+            cache = Cache(sets * ways * line_size, ways, line_size, policy, 1, 5)
+            model = [collections.OrderedDict() for _ in range(sets)]
+            for _ in range(300):
+                address = r.randrange(2048) * 4
+                line = address // line_size
+                lines = model[line % sets]
+                hit = line in lines
+                if hit and policy == 'lru':
+                    lines.move_to_end(line)
+                elif not hit:
+                    if len(lines) == ways:
+                        lines.popitem(last=False)
+                    lines[line] = True
+                self.assertEqual(cache.access(address), 0 if hit else 4)
+            self.assertEqual(cache.stall_cycles, 4 * cache.misses)
+
+    def test_state_round_trip_keeps_arrays(self):
+        cache = Cache(size=256, ways=2, line_size=16)
+        for address in range(0, 1024, 12):
+            cache.access(address)
+        restored = Cache(size=256, ways=2, line_size=16)
+        restored.load_state(cache.state())
+        self.assertIsInstance(restored.tags, array)
+        self.assertIsInstance(restored.stamps, array)
+        self.assertEqual(restored.tags.typecode, 'q')
+        self.assertEqual(restored.state(), cache.state())
+        self.assertEqual([restored.access(a) for a in range(0, 512, 8)], [cache.access(a) for a in range(0, 512, 8)])
+        with self.assertRaises(ValueError):
+            Cache(size=512, ways=2, line_size=16).load_state(cache.state())
+
+    def test_parse_spec(self):
+        self.assertEqual(parse_spec(''), DEFAULTS)
+        self.assertEqual(parse_spec('size=8192,ways=4,line=64,policy=fifo,hit=2,miss=20'),
+                         {'size': 8192, 'ways': 4, 'line_size': 64, 'policy': 'fifo', 'hit_latency': 2, 'miss_latency': 20})
+        for spec in ('assoc=2', 'size=1000', 'line=2', 'policy=random', 'hit=5,miss=2'):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                parse_spec(spec)
+
+class CachedPipelineTest(unittest.TestCase):
+    def test_architectural_state_is_unchanged(self):
+        configs = [{'icache': {'size': 128, 'ways': 1, 'line_size': 16}},
+                   {'dcache': {'size': 64, 'ways': 2, 'line_size': 8, 'policy': 'fifo', 'miss_latency': 20}},
+                   {'icache': {}, 'dcache': {'hit_latency': 2}}]
+        for path in TRACE_FILES:
+            image = load_image(path)
+            reference = FunctionalProcessor(image)
+            reference.run()
+            for forwarding in (False, True):
+                plain = Processor(image, forwarding=forwarding)
+                plain.run()
+                for config in configs:
+                    p = Processor(image, forwarding=forwarding, **config)
+                    p.run()
+                    stats = p.store_stats()
+                    with self.subTest(image=os.path.basename(path), forwarding=forwarding, config=config):
+                        self.assertEqual(compare(reference, p), [])
+                        self.assertGreaterEqual(stats['cycles'], plain.cycles)
+                        for name in ('icache', 'dcache'):
+                            if name in config:
+                                self.assertGreater(stats[name + '_hits'] + stats[name + '_misses'], 0)
+
+    def test_single_cycle_cache_keeps_timing(self):
+        image = load_image(TRACE_FILES[0])
+        plain = Processor(image)
+        plain.run()
+        p = Processor(image, icache={'size': 1 << 16, 'ways': 1, 'line_size': 4, 'hit_latency': 1, 'miss_latency': 1})
+        p.run()
+        self.assertEqual(p.cycles, plain.cycles)
+        self.assertEqual(p.store_stats()['icache_stall_cycles'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
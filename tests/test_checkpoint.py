@@ -0,0 +1,57 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import checkpoint
+from memory import load_image
+from processor import Processor
+
+TRACE_FILES = [os.path.join(ROOT, 'trace_files', name)
+               for name in ('final_proj_trace.txt', 'hazardTest4.txt', 'sample_memory_image.txt')]
+
+CONFIGS = [
+    {'forwarding': False},
+    {'forwarding': True},
+    {'forwarding': True, 'icache': {'size': 256, 'ways': 2, 'line_size': 16},
+     'dcache': {'size': 128, 'ways': 1, 'line_size': 16, 'policy': 'fifo'},
+     'predictor': {'kind': 'gshare', 'entries': 64, 'history_bits': 4, 'btb_entries': 8}},
+]
+
+def final_state(p):
+    return p.store_stats(), p.reg_change, list(p.mem_image.changed_words())
+
+class CheckpointTest(unittest.TestCase):
+    def test_restored_runs_finish_like_full_run(self):
+        for path in TRACE_FILES:
+            image = load_image(path)
+            for config in CONFIGS:
+                full = Processor(image, **config)
+                full.run()
+                with tempfile.TemporaryDirectory() as directory:
+                    p = Processor(image, **config)
+                    paths = checkpoint.run_with_checkpoints(p, max(5, full.cycles // 8), directory)
+                    self.assertEqual(final_state(p), final_state(full))
+                    self.assertTrue(paths)
+                    for checkpoint_path in paths:
+                        restored = checkpoint.restore(image, checkpoint_path)
+                        restored.run()
+                        with self.subTest(image=os.path.basename(path), config=config,
+                                          checkpoint=os.path.basename(checkpoint_path)):
+                            self.assertEqual(final_state(restored), final_state(full))
+
+    def test_restore_rejects_another_image_size(self):
+        image = load_image(TRACE_FILES[0])
+        with tempfile.TemporaryDirectory() as directory:
+            p = Processor(image)
+            p.run(max_cycles=50)
+            path = os.path.join(directory, 'cycle.json.gz')
+            checkpoint.save(p, path)
+            with self.assertRaises(ValueError):
+                checkpoint.restore(load_image(os.path.join(ROOT, 'trace_files', 'hazardTest4.txt')), path)
+
+if __name__ == '__main__':
+    unittest.main()
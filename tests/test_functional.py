@@ -0,0 +1,52 @@
+import glob
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from functional import FunctionalProcessor, compare
+from memory import load_image
+from processor import Processor
+
+TRACE_FILES = sorted(glob.glob(os.path.join(ROOT, 'trace_files', '*.txt')))
+
+# Instruction-mix keys both models report
+MIX_KEYS = ('program_counter', 'num_instructions', 'arithmetic_instructions', 'logic_instructions',
+            'memory_instructions', 'control_instructions', 'total_branches', 'branches_taken')
+
+class FunctionalModelTest(unittest.TestCase):
+    def test_final_state_matches_pipelined_model(self):
+        for path in TRACE_FILES:
+            image = load_image(path)
+            reference = FunctionalProcessor(image)
+            reference.run()
+            self.assertTrue(reference.Halt)
+            for forwarding in (False, True):
+                p = Processor(image, forwarding=forwarding)
+                p.run()
+                with self.subTest(image=os.path.basename(path), forwarding=forwarding):
+                    self.assertEqual(compare(reference, p), [])
+                    stats = p.store_stats()
+                    self.assertEqual({key: stats[key] for key in MIX_KEYS},
+                                     {key: reference.store_stats()[key] for key in MIX_KEYS})
+
+    def test_compare_reports_a_diverging_run(self):
+        image = load_image(TRACE_FILES[0])
+        reference = FunctionalProcessor(image)
+        reference.run()
+        p = Processor(image)
+        p.run()
+        p.regs.write_reg(1, p.regs.read_reg(1) + 1)
+        p.reg_change['R1'] = p.regs.read_reg(1)
+        self.assertEqual(len(compare(reference, p)), 1)
+
+    def test_max_instructions_stops_early(self):
+        f = FunctionalProcessor(load_image(TRACE_FILES[0]))
+        f.run(max_instructions=10)
+        self.assertEqual(f.num_instructions, 10)
+        self.assertFalse(f.Halt)
+
+if __name__ == '__main__':
+    unittest.main()
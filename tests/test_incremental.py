@@ -0,0 +1,71 @@
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import encode_i, write_image
+from incremental import RunCache
+from instruction import Opcode
+from memory import load_image
+from processor import Processor
+
+def counted_loop(data):
+    # Counts R1 down from 200, then loads the data word at address 32 into R2 and adds 1
+    return [encode_i(Opcode.Addi, 0, 1, 200), encode_i(Opcode.Subi, 1, 1, 1), encode_i(Opcode.Bz, 1, 0, 2),
+            encode_i(Opcode.Beq, 0, 0, -2), encode_i(Opcode.Ldw, 0, 2, 32), encode_i(Opcode.Addi, 2, 3, 1),
+            Opcode.Halt << 26, 0, data]
+
+def final_state(p):
+    report = io.StringIO()
+    with contextlib.redirect_stdout(report):
+        p.print_stats()
+    return report.getvalue(), p.store_stats()
+
+class IncrementalTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.image_file = os.path.join(directory.name, 'image.txt')
+        self.cache = RunCache(os.path.join(directory.name, 'cache'), every=50)
+
+    def test_edited_image_resumes_and_matches_cold_run(self):
+        write_image(counted_loop(5), self.image_file)
+        for forwarding in (False, True):
+            _, resumed = self.cache.simulate(self.image_file, forwarding)
+            self.assertEqual(resumed, 0)
+        write_image(counted_loop(9), self.image_file)
+        # Each forwarding setting resumes from its own run of the previous image
+        for forwarding in (False, True):
+            cold = Processor(load_image(self.image_file), forwarding=forwarding)
+            cold.run()
+            p, resumed = self.cache.simulate(self.image_file, forwarding)
+            with self.subTest(forwarding=forwarding):
+                self.assertGreater(resumed, cold.cycles // 2)
+                self.assertEqual(final_state(p), final_state(cold))
+                self.assertEqual(p.regs.regs[3], 10)
+
+    def test_unchanged_image_resumes_from_last_checkpoint(self):
+        write_image(counted_loop(5), self.image_file)
+        first, _ = self.cache.simulate(self.image_file, True)
+        again, resumed = self.cache.simulate(self.image_file, True)
+        self.assertGreater(resumed, 0)
+        self.assertEqual(final_state(again), final_state(first))
+
+    def test_run_that_does_not_halt_is_not_stored(self):
+        write_image([encode_i(Opcode.Beq, 0, 0, -1), 0], self.image_file)
+        p, _ = self.cache.simulate(self.image_file, budget={'detect_stuck': True})
+        self.assertEqual(p.stop_reason, 'stuck')
+        index_path = os.path.join(self.cache.directory, 'index.json')
+        if os.path.exists(index_path):
+            with open(index_path) as index:
+                self.assertNotIn(os.path.abspath(self.image_file), json.load(index))
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+if __name__ == '__main__':
+    unittest.main()
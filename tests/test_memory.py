@@ -0,0 +1,73 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import encode_i, write_image
+from instruction import Opcode
+from memory import PAGE_WORDS, Memory, PagedMemory, load_image
+from processor import Processor
+
+TRACE_FILE = os.path.join(ROOT, 'trace_files', 'final_proj_trace.txt')
+
+class PagedMemoryTest(unittest.TestCase):
+    def test_reads_match_dense_memory(self):
+        paged, dense = PagedMemory(TRACE_FILE), Memory(TRACE_FILE)
+        self.assertEqual(len(paged), len(dense))
+        for index in range(len(dense)):
+            self.assertEqual(paged.read_word(index * 4), dense.read_word(index * 4))
+
+    def test_unwritten_addresses_read_zero(self):
+        memory = PagedMemory(TRACE_FILE)
+        self.assertEqual(memory.read_word(0x7FFFFFF0), 0)
+        self.assertEqual(memory.read_byte(0xFFFFFFFF), 0)
+
+    def test_write_allocates_one_page_and_marks_it_dirty(self):
+        memory = PagedMemory(TRACE_FILE)
+        resident = memory.resident_pages()
+        memory.write_word(0x40000000, -1)
+        self.assertEqual(memory.resident_pages(), resident + 1)
+        self.assertEqual(memory.dirty_pages, {0x40000000 >> 2 >> 10})
+        self.assertEqual(memory.read_word(0x40000000), 0xFFFFFFFF)
+        self.assertEqual(len(memory), (0x40000000 >> 2) + 1)
+
+    def test_addresses_wrap_to_32_bits(self):
+        memory = PagedMemory()
+        memory.write_word(-4, 7)
+        self.assertEqual(memory.read_word(0xFFFFFFFC), 7)
+
+    def test_write_byte_updates_one_byte(self):
+        memory = PagedMemory(TRACE_FILE)
+        word = memory.read_word(8)
+        memory.write_byte(9, 0xAB)
+        self.assertEqual(memory.read_word(8), word & 0xFF00FFFF | 0xAB0000)
+        self.assertEqual(memory.read_byte(9), 0xAB)
+
+    def test_changed_words_compares_dirty_pages_with_loaded_image(self):
+        memory = PagedMemory(TRACE_FILE)
+        first = memory.read_word(0)
+        memory.write_word(0, first ^ 1)
+        memory.write_word(4, memory.read_word(4))
+        memory.write_word(PAGE_WORDS * 4 * 3 + 8, 5)
+        self.assertEqual(list(memory.changed_words()), [(0, first ^ 1), (PAGE_WORDS * 4 * 3 + 8, 5)])
+        memory.write_word(0, first)
+        self.assertEqual(list(memory.changed_words()), [(PAGE_WORDS * 4 * 3 + 8, 5)])
+
+    def test_patched_image_is_simulated(self):
+        # R1 is loaded from word 4, which the image leaves zero until it is patched
+        words = [encode_i(Opcode.Ldw, 0, 1, 16), Opcode.Halt << 26]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'image.txt')
+            write_image(words, path)
+            memory = load_image(path)
+            memory.write_word(16, 42)
+            p = Processor(memory)
+            p.run()
+        self.assertEqual(p.regs.read_reg(1), 42)
+        self.assertEqual(list(memory.changed_words()), [(16, 42)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import glob
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import encode_i
+from functional import FunctionalProcessor, compare
+from instruction import Instruction, Opcode
+from memory import load_image
+from predictor import make_predictor, parse_spec
+from processor import Processor
+
+TRACE_FILES = sorted(glob.glob(os.path.join(ROOT, 'trace_files', '*.txt')))
+
+PREDICTORS = [{'kind': 'not-taken'}, {'kind': 'btfn'}, {'kind': 'bimodal', 'entries': 16, 'bits': 1},
+              {'kind': 'bimodal'}, {'kind': 'gshare', 'entries': 64, 'history_bits': 4, 'btb_entries': 8}]
+
+def branch(word, pc):
+    instr = Instruction(word)
+    instr.decode()
+    instr.pc = pc
+    return instr
+
+class PredictorModelTest(unittest.TestCase):
+    def test_static_predictions(self):
+        backward = branch(encode_i(Opcode.Bz, 1, 0, -3), 40)
+        forward = branch(encode_i(Opcode.Beq, 1, 2, 3), 40)
+        not_taken, btfn = make_predictor({'kind': 'not-taken'}), make_predictor({'kind': 'btfn'})
+        self.assertEqual([not_taken.predict(backward), not_taken.predict(forward)], [44, 44])
+        self.assertEqual([btfn.predict(backward), btfn.predict(forward)], [28, 44])
+
+    def test_two_bit_counter_needs_two_misses_to_flip(self):
+        predictor = make_predictor({'kind': 'bimodal', 'entries': 16, 'bits': 2})
+        instr = branch(encode_i(Opcode.Bz, 1, 0, 5), 8)
+        predictions = []
+        for taken in (True, True, False, True, False, False, False):
+            predictions.append(predictor.predict(instr) == 28)
+            predictor.update(instr, taken, 28)
+        self.assertEqual(predictions, [False, True, True, True, True, True, False])
+
+    def test_one_bit_counter_follows_last_outcome(self):
+        predictor = make_predictor({'kind': 'bimodal', 'entries': 16, 'bits': 1})
+        instr = branch(encode_i(Opcode.Bz, 1, 0, 5), 8)
+        predictions = []
+        for taken in (True, False, True, True):
+            predictions.append(predictor.predict(instr) == 28)
+            predictor.update(instr, taken, 28)
+        self.assertEqual(predictions, [False, True, False, True])
+
+    def test_btb_predicts_jr_target(self):
+        jr = branch(Opcode.Jr << 26 | 3 << 21, 12)
+        self.assertEqual(make_predictor({'kind': 'bimodal'}).predict(jr), 16)
+        predictor = make_predictor({'kind': 'gshare', 'btb_entries': 4})
+        self.assertEqual(predictor.predict(jr), 16)
+        predictor.update(jr, True, 400)
+        self.assertEqual(predictor.predict(jr), 400)
+        # An address mapping to the same entry does not hit it
+        self.assertEqual(predictor.predict(branch(Opcode.Jr << 26 | 3 << 21, 28)), 32)
+
+    def test_state_round_trip(self):
+        predictor = make_predictor({'kind': 'gshare', 'entries': 16, 'history_bits': 3, 'btb_entries': 4})
+        instr = branch(encode_i(Opcode.Bz, 1, 0, -2), 20)
+        for taken in (True, False, True, True):
+            predictor.predict(instr)
+            predictor.update(instr, taken, 12)
+        restored = make_predictor(predictor.config)
+        restored.load_state(predictor.state())
+        self.assertEqual(restored.state(), predictor.state())
+
+    def test_parse_spec(self):
+        self.assertEqual(parse_spec('gshare,entries=256,history=8,btb=16'),
+                         {'kind': 'gshare', 'entries': 256, 'history_bits': 8, 'btb_entries': 16})
+        for spec in ('perceptron', 'bimodal,entries=100', 'bimodal,bits=3', 'btfn,history=4', 'gshare,size=4'):
+            with self.subTest(spec=spec), self.assertRaises(ValueError):
+                parse_spec(spec)
+
+class PredictedPipelineTest(unittest.TestCase):
+    def test_architectural_state_is_unchanged(self):
+        for path in TRACE_FILES:
+            image = load_image(path)
+            reference = FunctionalProcessor(image)
+            reference.run()
+            for forwarding in (False, True):
+                for config in PREDICTORS:
+                    p = Processor(image, forwarding=forwarding, predictor=config)
+                    p.run()
+                    stats = p.store_stats()
+                    with self.subTest(image=os.path.basename(path), forwarding=forwarding, predictor=config):
+                        self.assertEqual(compare(reference, p), [])
+                        self.assertEqual(stats['branch_penalties'], 2 * stats['branch_mispredictions'])
+                        correct = stats['total_branches'] - stats['branch_mispredictions']
+                        self.assertAlmostEqual(stats['prediction_accuracy'] * stats['total_branches'], correct)
+                        self.assertAlmostEqual(stats['mpki'] * stats['num_instructions'],
+                                               1000 * stats['branch_mispredictions'])
+
+    def test_not_taken_predictor_keeps_fixed_penalty_timing(self):
+        for path in TRACE_FILES:
+            image = load_image(path)
+            for forwarding in (False, True):
+                plain = Processor(image, forwarding=forwarding)
+                plain.run()
+                p = Processor(image, forwarding=forwarding, predictor={'kind': 'not-taken'})
+                p.run()
+                stats = p.store_stats()
+                del stats['predictor']
+                with self.subTest(image=os.path.basename(path), forwarding=forwarding):
+                    self.assertEqual(stats, plain.store_stats())
+                    self.assertEqual(stats['branch_mispredictions'], stats['branches_taken'])
+
+    def test_loops_predicted_taken_save_cycles(self):
+        image = load_image(TRACE_FILES[0])
+        plain = Processor(image, forwarding=True)
+        plain.run()
+        p = Processor(image, forwarding=True, predictor={'kind': 'btfn'})
+        p.run()
+        self.assertLess(p.cycles, plain.cycles)
+        self.assertLess(p.store_stats()['branch_mispredictions'], plain.store_stats()['branch_mispredictions'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import encode_i, write_image
+from functional import FunctionalProcessor
+from instruction import Opcode
+from memory import load_image
+from processor import Processor
+from tracesink import TraceSink
+
+TRACE_FILE = os.path.join(ROOT, 'trace_files', 'final_proj_trace.txt')
+
+# (cycles, total_stalls, hazards, branch_penalties) without and with forwarding, as reported
+# by the pipeline model before the scoreboard replaced its scan of the latches
+HAZARD_COUNTS = {
+    'final_proj_trace.txt': [(1707, 554, 307, 238), (1213, 60, 60, 238)],
+    'hazardTest1.txt': [(19, 2, 1, 0), (17, 0, 0, 0)],
+    'hazardTest2.txt': [(20, 3, 2, 0), (17, 0, 0, 0)],
+    'hazardTest3.txt': [(26, 6, 4, 0), (20, 0, 0, 0)],
+    'hazardTest4.txt': [(29, 8, 5, 0), (22, 1, 1, 0)],
+    'hazardTest5.txt': [(29, 8, 5, 0), (22, 1, 1, 0)],
+    'sample_memory_image.txt': [(1095, 301, 151, 152), (844, 50, 50, 152)],
+}
+
+class HazardTest(unittest.TestCase):
+    def test_stalls_and_hazards_match_latch_scan(self):
+        for name, expected in HAZARD_COUNTS.items():
+            image = load_image(os.path.join(ROOT, 'trace_files', name))
+            for forwarding, counts in zip((False, True), expected):
+                p = Processor(image, forwarding=forwarding)
+                p.run()
+                stats = p.store_stats()
+                with self.subTest(image=name, forwarding=forwarding):
+                    self.assertEqual((stats['cycles'], stats['total_stalls'], stats['hazards'],
+                                      stats['branch_penalties']), counts)
+
+    def test_load_use_stalls_once_with_forwarding(self):
+        # R2 is used right after it is loaded, then R3 right after it is computed
+        words = [encode_i(Opcode.Ldw, 0, 2, 20), encode_i(Opcode.Addi, 2, 3, 1),
+                 encode_i(Opcode.Addi, 3, 4, 1), Opcode.Halt << 26, 0, 7]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'image.txt')
+            write_image(words, path)
+            image = load_image(path)
+        stalls = []
+        for forwarding in (False, True):
+            p = Processor(image, forwarding=forwarding)
+            p.run()
+            self.assertEqual(p.regs.regs[4], 9)
+            stalls.append(p.store_stats()['total_stalls'])
+        self.assertEqual(stalls, [4, 1])
+
+class TracedRunTest(unittest.TestCase):
+    def test_traced_watched_run_matches_untraced(self):
+        image = load_image(TRACE_FILE)
+        for forwarding in (False, True):
+            plain = Processor(image, forwarding=forwarding)
+            plain.run(detect_stuck=True)
+            with tempfile.TemporaryDirectory() as directory:
+                sink = TraceSink(os.path.join(directory, 'run.jsonl'))
+                traced = Processor(image, forwarding=forwarding, trace_sink=sink)
+                traced.run(detect_stuck=True)
+                sink.close()
+            self.assertEqual(traced.store_stats(), plain.store_stats())
+
+class SelfModifyingCodeTest(unittest.TestCase):
+    def test_unaligned_store_invalidates_decoded_instruction(self):
+        # The loop body's first instruction adds 1 to R5; the first pass stores an instruction
+        # adding 100 over it through the unaligned address 9, so the second pass adds 100
+        words = [encode_i(Opcode.Ldw, 0, 1, 60), encode_i(Opcode.Addi, 0, 2, 2),
+                 encode_i(Opcode.Addi, 5, 5, 1), encode_i(Opcode.Stw, 0, 1, 9),
+                 encode_i(Opcode.Subi, 2, 2, 1), encode_i(Opcode.Bz, 2, 0, 2),
+                 encode_i(Opcode.Beq, 0, 0, -4), Opcode.Halt << 26]
+        words += [0] * (15 - len(words)) + [encode_i(Opcode.Addi, 5, 5, 100)]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'image.txt')
+            write_image(words, path)
+            image = load_image(path)
+        for forwarding in (False, True):
+            p = Processor(image, forwarding=forwarding)
+            p.run()
+            self.assertEqual(p.regs.regs[5], 101)
+        for translate in (False, True):
+            f = FunctionalProcessor(image, translate=translate)
+            f.run()
+            self.assertEqual(f.regs.regs[5], 101)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import encode_i, write_image
+from instruction import Opcode
+from memory import convert_image, image_digest, image_words, load_image
+from processor import Processor
+from resultcache import ResultCache
+
+TRACE_FILE = os.path.join(ROOT, 'trace_files', 'final_proj_trace.txt')
+
+CONFIGS = [
+    {'forwarding': False},
+    {'forwarding': True},
+    {'forwarding': True, 'icache': {'size': 256, 'ways': 2, 'line_size': 16},
+     'dcache': {'size': 128, 'ways': 1, 'line_size': 16}, 'predictor': {'kind': 'bimodal', 'entries': 64}},
+]
+
+def final_state(p):
+    report = io.StringIO()
+    with contextlib.redirect_stdout(report):
+        p.print_stats()
+    return report.getvalue(), p.store_stats()
+
+class CountingCache(ResultCache):
+    '''
+    A ResultCache that counts the lookups it answers.
+    '''
+    hits = 0
+
+    def get(self, key):
+        entry = super().get(key)
+        if entry is not None:
+            self.hits += 1
+        return entry
+
+class ResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.cache = CountingCache(os.path.join(self.directory, 'results'))
+
+    def test_hit_matches_simulated_run(self):
+        image = load_image(TRACE_FILE)
+        for config in CONFIGS:
+            plain = Processor(image, **config)
+            plain.run()
+            miss = Processor(image, result_cache=self.cache, **config)
+            miss.run()
+            hit = Processor(image, result_cache=self.cache, **config)
+            hit.run()
+            with self.subTest(config=config):
+                self.assertEqual(final_state(miss), final_state(plain))
+                self.assertEqual(final_state(hit), final_state(plain))
+                self.assertEqual(list(hit.mem_image.changed_words()), list(plain.mem_image.changed_words()))
+        self.assertEqual(self.cache.hits, len(CONFIGS))
+        self.assertEqual(len(self.cache.entries()), len(CONFIGS))
+
+    def test_key_follows_image_and_configuration(self):
+        image = load_image(TRACE_FILE)
+        keys = {self.cache.key(image, False), self.cache.key(image, True),
+                self.cache.key(image, True, {'predictor': {'kind': 'btfn', 'btb_entries': 0}})}
+        path = os.path.join(self.directory, 'edited.txt')
+        words = image_words(image)
+        words[-1] ^= 1
+        write_image(words, path)
+        keys.add(self.cache.key(load_image(path), False))
+        self.assertEqual(len(keys), 4)
+
+    def test_binary_image_has_same_key_as_text_image(self):
+        expected = self.cache.key(load_image(TRACE_FILE), True)
+        for name, byteorder in (('image.bin', 'big'), ('image.le.bin', 'little')):
+            path = os.path.join(self.directory, name)
+            convert_image(TRACE_FILE, path, byteorder)
+            mapped = load_image(path)
+            with self.subTest(byteorder=byteorder):
+                self.assertEqual(image_digest(mapped), image_digest(load_image(TRACE_FILE)))
+                self.assertEqual(image_words(mapped), image_words(load_image(TRACE_FILE)))
+                self.assertEqual(self.cache.key(mapped, True), expected)
+            mapped.close()
+
+    def test_run_that_does_not_halt_is_not_stored(self):
+        path = os.path.join(self.directory, 'loop.txt')
+        write_image([encode_i(Opcode.Beq, 0, 0, -1), 0], path)
+        p = Processor(load_image(path), result_cache=self.cache)
+        self.assertFalse(p.run(detect_stuck=True))
+        self.assertEqual(self.cache.entries(), [])
+
+    def test_evicts_least_recently_used_entries(self):
+        image = load_image(TRACE_FILE)
+        for config in CONFIGS:
+            Processor(image, result_cache=self.cache, **config).run()
+        paths = [path for _, _, path in self.cache.entries()]
+        for used, path in enumerate(paths):
+            os.utime(path, (1000 + used, 1000 + used))
+        oldest = paths[0]
+        self.cache.evict(sum(size for _, size, _ in self.cache.entries()) - 1)
+        paths = [path for _, _, path in self.cache.entries()]
+        self.assertEqual(len(paths), len(CONFIGS) - 1)
+        self.assertNotIn(oldest, paths)
+
+if __name__ == '__main__':
+    unittest.main()
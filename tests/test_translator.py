@@ -0,0 +1,65 @@
+import glob
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmark import encode_i, synthetic_loop, write_image
+from functional import FunctionalProcessor
+from instruction import Opcode
+from memory import load_image
+
+TRACE_FILES = sorted(glob.glob(os.path.join(ROOT, 'trace_files', '*.txt')))
+
+def final_state(f):
+    return f.store_stats(), f.reg_change, list(f.mem_image.changed_words())
+
+def load_words(words):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'image.txt')
+        write_image(words, path)
+        return load_image(path)
+
+class TranslatorTest(unittest.TestCase):
+    def run_both(self, image, max_instructions=None):
+        states = []
+        for translate in (False, True):
+            f = FunctionalProcessor(image, translate=translate)
+            f.run(max_instructions)
+            states.append(final_state(f))
+        return states
+
+    def test_translated_runs_match_interpreter(self):
+        for path in TRACE_FILES:
+            interpreted, translated = self.run_both(load_image(path))
+            with self.subTest(image=os.path.basename(path)):
+                self.assertEqual(translated, interpreted)
+
+    def test_synthetic_loop_matches_interpreter(self):
+        interpreted, translated = self.run_both(load_words(synthetic_loop(500)))
+        self.assertEqual(translated, interpreted)
+
+    def test_max_instructions_is_exact(self):
+        image = load_image(TRACE_FILES[0])
+        for limit in (1, 7, 100, 333):
+            interpreted, translated = self.run_both(image, limit)
+            with self.subTest(limit=limit):
+                self.assertEqual(translated, interpreted)
+                self.assertEqual(translated[0]['num_instructions'], limit)
+
+    def test_store_into_running_block_is_retranslated(self):
+        # The store overwrites the block's fourth instruction, which adds 1 to R5, with one
+        # adding 100 before the block reaches it
+        words = [encode_i(Opcode.Ldw, 0, 1, 40), encode_i(Opcode.Stw, 0, 1, 12),
+                 encode_i(Opcode.Addi, 6, 6, 1), encode_i(Opcode.Addi, 5, 5, 1), Opcode.Halt << 26]
+        words += [0] * (10 - len(words)) + [encode_i(Opcode.Addi, 5, 5, 100)]
+        interpreted, translated = self.run_both(load_words(words))
+        self.assertEqual(translated, interpreted)
+        self.assertEqual(translated[1]['R5'], 100)
+        self.assertEqual(translated[0]['num_instructions'], 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+from instruction import OPCODES
+import bz2
+import gzip
+import json
+import lzma
+import queue
+import struct
+import threading
+
+# Record flags
+HAZARD = 0x1        # A hazard was detected in this cycle
+FORWARD_RS = 0x2    # The instruction leaving ID received rs by forwarding
+FORWARD_RT = 0x4    # The instruction leaving ID received rt by forwarding
+FLUSH = 0x8         # A mispredicted branch flushed the fetched instruction
+
+# Pipeline stages in record order
+STAGES = ('IF', 'ID', 'EX', 'MEM', 'WB')
+
+# Binary format: the magic bytes, then one fixed-size little-endian record per cycle with the
+# cycle, the PC, the PC of each stage's instruction, each stage's opcode, the remaining stall
+# cycles and the flags. Empty stages have PC -1 and opcode -1.
+MAGIC = b'MIPSTRC1'
+RECORD = struct.Struct('<qq5q5bbB')
+
+# Records handed to the writer thread at a time, and batches that may wait for it
+BATCH_SIZE = 4096
+MAX_BATCHES = 16
+
+# Compression by file suffix
+OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+# JSON fragments for the fast encoder
+_JSON_NAMES = {op: f'"{op}"' for op in OPCODES}
+_JSON_NAMES[None] = 'null'
+_JSON_BOOLS = {0: 'false', HAZARD: 'true', FLUSH: 'true'}
+_JSON_FORWARDS = {0: '[]', FORWARD_RS: '["rs"]', FORWARD_RT: '["rt"]', FORWARD_RS | FORWARD_RT: '["rs","rt"]'}
+
+def _line(cycle, pc, stages, stall, flags):
+    '''
+    Returns a record in the JSON lines layout. stages holds (pc, mnemonic) or None per stage.
+    '''
+    line = {'cycle': cycle, 'pc': pc}
+    for stage, entry in zip(STAGES, stages):
+        line[stage] = None if entry is None else list(entry)
+    line['stall'] = stall
+    line['hazard'] = bool(flags & HAZARD)
+    line['forward'] = [name for name, bit in (('rs', FORWARD_RS), ('rt', FORWARD_RT)) if flags & bit]
+    line['flush'] = bool(flags & FLUSH)
+    return line
+
+def _opener(path):
+    for suffix, opener in OPENERS.items():
+        if path.endswith(suffix):
+            return opener, path[:-len(suffix)]
+    return open, path
+
+class TraceSink(object):
+    '''
+    Streams per-cycle pipeline records to a file. Records are buffered in batches and
+    encoded and written by a background thread; at most max_batches batches wait for it,
+    so memory stays bounded however long the run is. If the writer falls behind, the
+    simulation blocks until a batch has been written.
+
+    Each record holds the cycle, the PC after the cycle, the instruction (PC and opcode) in
+    each stage, the remaining stall cycles and the HAZARD, FORWARD_RS, FORWARD_RT and FLUSH
+    flags. Files ending in .bin (before any compression suffix) are written in the binary
+    format described by RECORD, anything else as JSON lines. A .gz, .bz2 or .xz suffix
+    compresses the file.
+
+    Attributes:
+    - path: The output file.
+    - cycles: Optional (start, stop) range of cycles to record.
+    - pcs: Optional (low, high) range of PCs; a cycle is recorded if any stage holds one.
+    '''
+    def __init__(self, path, cycles=None, pcs=None, batch_size=BATCH_SIZE, max_batches=MAX_BATCHES):
+        '''
+        Opens path and starts the writer thread.
+        '''
+        opener, base = _opener(path)
+        self.path = path
+        self.binary = base.endswith('.bin')
+        self.cycles = cycles
+        self.pcs = pcs
+        self.batch_size = batch_size
+        self.error = None
+        self._file = opener(path, 'wb')
+        if self.binary:
+            self._file.write(MAGIC)
+        self._batch = []
+        self._queue = queue.Queue(max_batches)
+        self._thread = threading.Thread(target=self._write, name='trace-writer', daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, cycle, pc, stages, stall, flags):
+        '''
+        Records one cycle. stages holds the Instruction in IF, ID, EX, MEM and WB, or None
+        for an empty stage.
+        '''
+        if self.cycles is not None and not self.cycles[0] <= cycle < self.cycles[1]:
+            return
+        entries = tuple((s.pc, s.opcode) if s is not None and s.pc is not None else None for s in stages)
+        if self.pcs is not None and not any(e is not None and self.pcs[0] <= e[0] < self.pcs[1] for e in entries):
+            return
+        self._batch.append((cycle, pc, entries, stall, flags))
+        if len(self._batch) >= self.batch_size:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def close(self):
+        '''
+        Writes the remaining records, stops the writer thread and closes the file.
+        Raises the first error the writer thread hit, if any.
+        '''
+        if self._thread is None:
+            return
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+        if self.error is not None:
+            raise self.error
+
+    def _write(self):
+        encode = self._encode_binary if self.binary else self._encode_json
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                return
+            if self.error is not None:
+                continue  # Keep draining so that the simulation never blocks
+            try:
+                self._file.write(b''.join(encode(record) for record in batch))
+            except Exception as e:
+                self.error = e
+
+    @staticmethod
+    def _encode_binary(record):
+        cycle, pc, entries, stall, flags = record
+        return RECORD.pack(cycle, -1 if pc is None else pc,
+                           *(-1 if e is None else e[0] for e in entries),
+                           *(-1 if e is None or e[1] is None else e[1] for e in entries),
+                           stall, flags)
+
+    @staticmethod
+    def _encode_json(record):
+        # Formatted directly rather than with json.dumps, which is several times slower
+        cycle, pc, entries, stall, flags = record
+        stages = ','.join(f'"{stage}":null' if e is None else f'"{stage}":[{e[0]},{_JSON_NAMES[e[1]]}]'
+                          for stage, e in zip(STAGES, entries))
+        return (f'{{"cycle":{cycle},"pc":{"null" if pc is None else pc},{stages},"stall":{stall},'
+                f'"hazard":{_JSON_BOOLS[flags & HAZARD]},"forward":{_JSON_FORWARDS[flags & (FORWARD_RS | FORWARD_RT)]},'
+                f'"flush":{_JSON_BOOLS[flags & FLUSH]}}}\n').encode()
+
+def read_trace(path):
+    '''
+    Yields the records of a trace file written by TraceSink as dictionaries in the JSON
+    lines layout, whichever format the file is in.
+    '''
+    opener, base = _opener(path)
+    with opener(path, 'rb') as trace:
+        if not base.endswith('.bin'):
+            for line in trace:
+                yield json.loads(line)
+            return
+        if trace.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{path}' is not a binary pipeline trace")
+        while True:
+            data = trace.read(RECORD.size)
+            if len(data) < RECORD.size:
+                return
+            fields = RECORD.unpack(data)
+            cycle, pc, pcs, opcodes, stall, flags = fields[0], fields[1], fields[2:7], fields[7:12], fields[12], fields[13]
+            stages = (None if stage_pc < 0 else (stage_pc, str(OPCODES[opcode]) if opcode >= 0 else None)
+                      for stage_pc, opcode in zip(pcs, opcodes))
+            yield _line(cycle, pc, stages, stall, flags)
@@ -0,0 +1,199 @@
+from instruction import Instruction, Opcode
+
+# Longest straight-line run translated into a single block
+MAX_BLOCK_LENGTH = 128
+
+# Opcodes that end a basic block
+BLOCK_END = (Opcode.Bz, Opcode.Beq, Opcode.Jr, Opcode.Halt)
+
+def _s(expr):
+    '''
+    Returns source that truncates expr to 32 bits and interprets it as a signed number.
+    '''
+    return f'(((({expr}) + 0x80000000) & 0xFFFFFFFF) - 0x80000000)'
+
+class CodeModified(Exception):
+    '''
+    Raised by a translated block when it stores into translated code. The block stops right
+    after the store so that the rest of the program runs from freshly translated code.
+    '''
+    def __init__(self, address, pc, executed):
+        self.address = address
+        self.pc = pc
+        self.executed = executed
+
+class Block(object):
+    '''
+    A translated basic block.
+
+    Attributes:
+    - entry: PC of the first instruction.
+    - opcodes: Opcodes of the block's instructions in order (None for undecodable words).
+    - fn: Compiled callable that executes the block and returns the next PC.
+    - halts: True if the block ends with Halt.
+    - runs: Completed executions not yet added to the processor's counters.
+    '''
+    __slots__ = ('entry', 'opcodes', 'fn', 'halts', 'runs', 'length')
+
+    def __init__(self, entry, opcodes, fn, halts):
+        self.entry = entry
+        self.opcodes = opcodes
+        self.fn = fn
+        self.halts = halts
+        self.runs = 0
+        self.length = sum(1 for op in opcodes if op is not None)
+
+class BlockTranslator(object):
+    '''
+    Translates straight-line MIPS-lite code into Python functions, one per basic block, and
+    caches them by entry PC. A block runs from its entry to the first branch, jump or Halt.
+    Its source is generated from the decoded instructions and compiled once with compile().
+    The generated code has the same semantics as FunctionalProcessor's handlers, and it reads
+    and writes the processor's register dictionary and memory directly.
+
+    Stores check whether they hit translated code. If so, every block containing the address
+    is dropped and the running block exits, so self-modifying code is retranslated.
+    '''
+    def __init__(self, processor):
+        '''
+        Initializes an empty translation cache for a FunctionalProcessor.
+        '''
+        self.processor = processor
+        self.blocks = dict()
+        # Word address -> entry PCs of the blocks that contain it
+        self.code = dict()
+        self.taken = [0]
+        self.namespace = {
+            'r': processor.regs.regs,
+            'c': processor.changed_regs,
+            't': self.taken,
+            'read': processor.mem_image.read_word,
+            'write': processor.mem_image.write_word,
+            'code': self.code,
+            'CodeModified': CodeModified,
+        }
+
+    def get(self, pc):
+        '''
+        Returns the block starting at pc, translating it on first use.
+        '''
+        block = self.blocks.get(pc)
+        if block is None:
+            block = self._translate(pc)
+        return block
+
+    def _translate(self, entry):
+        mem = self.processor.mem_image
+        lines = ['def block():']
+        opcodes = []
+        pc = entry
+        halts = False
+        while True:
+            instr = Instruction(mem.read_word(pc))
+            instr.decode()
+            opcodes.append(instr.opcode)
+            lines.extend('    ' + line for line in self._emit(instr, pc, len(opcodes)))
+            if instr.opcode in BLOCK_END:
+                halts = instr.opcode == Opcode.Halt
+                if halts:
+                    lines.append(f'    return {pc + 4}')
+                break
+            pc += 4
+            if len(opcodes) >= MAX_BLOCK_LENGTH or (pc >> 2) >= len(mem):
+                lines.append(f'    return {pc}')
+                break
+        namespace = dict(self.namespace)
+        exec(compile('\n'.join(lines), f'<block {entry}>', 'exec'), namespace)
+        block = Block(entry, opcodes, namespace['block'], halts)
+        self.blocks[entry] = block
+        for address in range(entry, entry + 4 * len(opcodes), 4):
+            self.code.setdefault(address, set()).add(entry)
+        return block
+
+    def _emit(self, instr, pc, executed):
+        '''
+        Returns the source lines for one instruction. executed is the number of instructions
+        of the block that have completed once this one has.
+        '''
+        # Every handler stores a signed 32-bit value, so register reads need no truncation
+        op = instr.opcode
+        rs, rt, rd, imm = instr.reg_rs, instr.reg_rt, instr.reg_rd, instr.imm
+        if op is None:
+            return []
+        if op in (Opcode.Add, Opcode.Sub, Opcode.Mul):
+            sym = {Opcode.Add: '+', Opcode.Sub: '-', Opcode.Mul: '*'}[op]
+            return [f'r[{rd}] = c[{rd}] = ' + _s(f"r[{rs}] {sym} r[{rt}]")]
+        if op in (Opcode.Addi, Opcode.Subi, Opcode.Muli):
+            sym = {Opcode.Addi: '+', Opcode.Subi: '-', Opcode.Muli: '*'}[op]
+            return [f'r[{rt}] = c[{rt}] = ' + _s(f"r[{rs}] {sym} {imm}")]
+        if op in (Opcode.Or, Opcode.And, Opcode.Xor):
+            sym = {Opcode.Or: '|', Opcode.And: '&', Opcode.Xor: '^'}[op]
+            return [f"r[{rd}] = c[{rd}] = r[{rs}] {sym} r[{rt}]"]
+        if op in (Opcode.Ori, Opcode.Andi, Opcode.Xori):
+            sym = {Opcode.Ori: '|', Opcode.Andi: '&', Opcode.Xori: '^'}[op]
+            return [f'r[{rt}] = c[{rt}] = r[{rs}] {sym} {imm}']
+        address = _s(f"r[{rs}] + {imm}") if imm is not None else None
+        if op == Opcode.Ldw:
+            return [f"r[{rt}] = c[{rt}] = {_s(f'read({address})')}"]
+        if op == Opcode.Stw:
+            return [f'a = {address}',
+                    f'write(a, r[{rt}])',
+                    f'if (a & -4) in code:',
+                    f'    raise CodeModified(a & -4, {pc + 4}, {executed})']
+        if op == Opcode.Bz:
+            return [f"if r[{rs}] == 0:",
+                    f'    t[0] += 1',
+                    f'    return {pc + 4 * instr.x_addr}',
+                    f'return {pc + 4}']
+        if op == Opcode.Beq:
+            return [f"if r[{rs}] == r[{rt}]:",
+                    f'    t[0] += 1',
+                    f'    return {pc + 4 * imm}',
+                    f'return {pc + 4}']
+        if op == Opcode.Jr:
+            return ['t[0] += 1',
+                    f"return r[{rs}]"]
+        return []  # Halt
+
+    def invalidate(self, address):
+        '''
+        Drops every block that contains the word at address, folding its counts into the processor.
+        '''
+        for entry in self.code.pop(address, ()):
+            block = self.blocks.pop(entry, None)
+            if block is None:
+                continue
+            self.fold(block)
+            for other in range(entry, entry + 4 * len(block.opcodes), 4):
+                owners = self.code.get(other)
+                if owners is not None:
+                    owners.discard(entry)
+                    if not owners:
+                        del self.code[other]
+
+    def fold(self, block, executed=None):
+        '''
+        Adds a block's completed runs to the processor's instruction counters. With executed
+        given, also counts one partial run of the block's first executed instructions.
+        '''
+        counts = self.processor.opcode_counts
+        if block.runs:
+            for op in block.opcodes:
+                if op is not None:
+                    counts[op] += block.runs
+            self.processor.num_instructions += block.runs * block.length
+            block.runs = 0
+        if executed is not None:
+            for op in block.opcodes[:executed]:
+                if op is not None:
+                    counts[op] += 1
+                    self.processor.num_instructions += 1
+
+    def flush(self):
+        '''
+        Adds the pending counts of all cached blocks and the taken-branch count to the processor.
+        '''
+        for block in self.blocks.values():
+            self.fold(block)
+        self.processor.branches_taken += self.taken[0]
+        self.taken[0] = 0
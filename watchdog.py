@@ -0,0 +1,66 @@
+from instruction import Instruction
+
+class StuckDetector(object):
+    '''
+    Detects a Processor that can provably never reach Halt: one whose complete state recurs.
+
+    The state is fingerprinted at the end of every cycle in which a branch was taken, since
+    a program can only repeat itself through a taken branch. The fingerprint holds everything
+    the rest of the run depends on:
+    - the PC, the remaining stall cycles and the Halt flag;
+    - the registers;
+    - the contents of the instructions still in the pipeline;
+    - the scoreboard's issue cycles relative to the current cycle;
+    - the memory words written so far.
+    The counters and the decoded-instruction cache only feed the statistics, and the
+    caches and branch predictor only the timing, never which instructions execute.
+    The simulation is deterministic, so once a fingerprint recurs, the run between the two
+    occurrences repeats forever.
+
+    Fingerprints are compared with Brent's cycle detection algorithm. One fingerprint is kept,
+    and it is replaced after 1, 2, 4, 8, ... further events, so a loop whose state repeats
+    every n taken branches is found within about 2n of them after it starts. Memory is only
+    compared when the rest of the fingerprint matches, and the rest only when the PC and
+    registers do. A loop that makes progress, e.g. by counting a register down, costs one
+    comparison of the registers per taken branch.
+    '''
+    def __init__(self, processor):
+        '''
+        Starts watching processor.
+        '''
+        self.processor = processor
+        self.saved_key = None
+        self.saved_state = None
+        self.saved_memory = None
+        self.power = 1
+        self.distance = 0
+
+    def _key(self):
+        # The PC and registers tell almost every pair of states apart, and are cheap to compare
+        p = self.processor
+        return (p.pc, tuple(p.regs.regs.values()))
+
+    def _state(self):
+        p = self.processor
+        cycles = p.cycles
+        return (p.data_list[0], p.stall_cycle, p.Halt,
+                tuple(tuple(getattr(instr, name) for name in Instruction.__slots__) for instr in p.data_list[1:]),
+                tuple(min(cycles - issued, 3) for issued in p.scoreboard.issue_cycle))
+
+    def check(self):
+        '''
+        Records the state after a cycle in which a branch was taken. Returns True if the state
+        recurred, so the processor is stuck.
+        '''
+        key = self._key()
+        memory = self.processor.mem_image.dirty
+        if key == self.saved_key and self._state() == self.saved_state and memory == self.saved_memory:
+            return True
+        self.distance += 1
+        if self.saved_key is None or self.distance == self.power:
+            self.saved_key = key
+            self.saved_state = self._state()
+            self.saved_memory = dict(memory)
+            self.power *= 2
+            self.distance = 0
+        return False